@@ -0,0 +1,10 @@
+/** Tailwind build for `python manage.py build_static`, run from the project root */
+module.exports = {
+  // Only classes that appear in these templates end up in the bundle, so
+  // write class names out in full rather than assembling them
+  content: ['./templates/**/*.html', './*/templates/**/*.html'],
+  theme: {
+    extend: {},
+  },
+  plugins: [],
+};
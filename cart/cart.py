@@ -1,111 +1,143 @@
 import hashlib
+import logging
 from decimal import Decimal
-from django.conf import settings
-from products.models import Product, SizeVariant, IcingOption, EggOption
+from .resolver import resolve_lines, unit_price
+from .storage import (
+    EGGS, ICING, MESSAGE, PRICE, PRODUCT, QUANTITY, SIZE, cart_totals, get_cart_storage,
+)
+
+logger = logging.getLogger(__name__)
 
 class Cart:
     def __init__(self, request):
-        self.session = request.session
-        cart = self.session.get(settings.CART_SESSION_ID)
-        if not cart:
-            cart = self.session[settings.CART_SESSION_ID] = {}
-        self.cart = cart
+        self.storage = get_cart_storage(request)
+        # An empty cart is only stored by its first change
+        data = self.storage.load()
+        self.lines = {self._line_key(line): line for line in data['lines']}
+        # Running totals, kept in step with every change to the lines
+        self.count = data['count']
+        self.total = Decimal(data['total'])
     
-    def _generate_key(self, product_id, size_slug, eggs_slug, icing_slug, message):
+    def _generate_key(self, product_id, size_id, eggs_id, icing_id, message):
         """Generate unique key for cart item"""
         message_hash = hashlib.md5(message.encode()).hexdigest()[:8] if message else 'no-message'
-        return f"{product_id}-{size_slug}-{eggs_slug}-{icing_slug}-{message_hash}"
+        return f"{product_id}-{size_id or 0}-{eggs_id or 0}-{icing_id or 0}-{message_hash}"
+    
+    def _line_key(self, line):
+        return self._generate_key(line[PRODUCT], line[SIZE], line[EGGS], line[ICING], line[MESSAGE])
     
     def add(self, product, size, eggs, icing, message, quantity=1):
         """Add item to cart or update quantity"""
-        product_id = str(product.id)
-        size_slug = size.slug if size else 'no-size'
-        eggs_slug = eggs.slug if eggs else 'no-eggs'
-        icing_slug = icing.slug if icing else 'no-icing'
-        
-        key = self._generate_key(product_id, size_slug, eggs_slug, icing_slug, message)
+        size_id = size.id if size else None
+        eggs_id = eggs.id if eggs else None
+        icing_id = icing.id if icing else None
         
-        # Calculate unit price
-        unit_price = Decimal('0')
-        if size:
-            unit_price = size.price
-        else:
-            unit_price = product.base_price
-        
-        if icing:
-            unit_price += icing.price_modifier
+        key = self._generate_key(product.id, size_id, eggs_id, icing_id, message)
         
-        if eggs:
-            unit_price += eggs.price_modifier
+        price = unit_price(product, size, icing, eggs)
         
-        if key in self.cart:
-            # Update quantity
-            self.cart[key]['quantity'] += quantity
+        if key in self.lines:
+            # Update quantity at the price the line was added with
+            self._change_quantity(key, self.lines[key][QUANTITY] + quantity)
         else:
             # Add new item
-            self.cart[key] = {
-                'product_id': product_id,
-                'product_name': product.name,
-                'size_name': size.name if size else '',
-                'size_slug': size_slug,
-                'eggs_name': eggs.name if eggs else '',
-                'eggs_slug': eggs_slug,
-                'icing_name': icing.name if icing else '',
-                'icing_slug': icing_slug,
-                'message': message,
-                'unit_price': str(unit_price),
-                'quantity': quantity,
-            }
+            self.lines[key] = [product.id, size_id, icing_id, eggs_id, quantity, str(price), message]
+            self.count += quantity
+            self.total += price * quantity
         
-        self.cart[key]['total_price'] = str(unit_price * self.cart[key]['quantity'])
         self.save()
     
+    def _change_quantity(self, key, quantity):
+        line = self.lines[key]
+        delta = quantity - line[QUANTITY]
+        line[QUANTITY] = quantity
+        self.count += delta
+        self.total += Decimal(line[PRICE]) * delta
+    
     def update(self, key, quantity):
         """Update item quantity"""
-        if key in self.cart:
+        if key in self.lines:
             if quantity <= 0:
                 self.remove(key)
             else:
-                unit_price = Decimal(self.cart[key]['unit_price'])
-                self.cart[key]['quantity'] = quantity
-                self.cart[key]['total_price'] = str(unit_price * quantity)
+                self._change_quantity(key, quantity)
                 self.save()
     
     def remove(self, key):
         """Remove item from cart"""
-        if key in self.cart:
-            del self.cart[key]
+        if key in self.lines:
+            self._change_quantity(key, 0)
+            del self.lines[key]
             self.save()
     
+    def set_prices(self, prices):
+        """Set new unit prices by line key; a price of None drops the line"""
+        for key, price in prices.items():
+            if key not in self.lines:
+                continue
+            if price is None:
+                self._change_quantity(key, 0)
+                del self.lines[key]
+            else:
+                line = self.lines[key]
+                self.total += (price - Decimal(line[PRICE])) * line[QUANTITY]
+                line[PRICE] = str(price)
+        self.save()
+    
     def __iter__(self):
-        """Iterate through cart items"""
-        cart = self.cart.copy()
-        for key, item in cart.items():
-            item['key'] = key
-            item['unit_price'] = Decimal(item['unit_price'])
-            item['total_price'] = Decimal(item['total_price'])
-            yield item
+        """Iterate through cart items with names filled in from the catalog"""
+        lines = list(self.lines.items())
+        selections = resolve_lines([line for _, line in lines])
+        for (key, line), selection in zip(lines, selections):
+            product, size, icing, eggs, _ = selection or (None, None, None, None, None)
+            price = Decimal(line[PRICE])
+            yield {
+                'key': key,
+                'product_id': product.id if product else None,
+                'product_name': product.name if product else 'Unavailable product',
+                'size_name': size.name if size else '',
+                'size_slug': size.slug if size else 'no-size',
+                'eggs_name': eggs.name if eggs else '',
+                'eggs_slug': eggs.slug if eggs else 'no-eggs',
+                'icing_name': icing.name if icing else '',
+                'icing_slug': icing.slug if icing else 'no-icing',
+                'message': line[MESSAGE],
+                'unit_price': price,
+                'quantity': line[QUANTITY],
+                'total_price': price * line[QUANTITY],
+            }
     
     def __len__(self):
         """Return total quantity of items in cart"""
-        try:
-            return sum(int(item['quantity']) for item in self.cart.values())
-        except (KeyError, ValueError):
-            return 0
+        return self.count
     
     def get_total(self):
         """Return total cart value"""
-        try:
-            return sum(Decimal(item['total_price']) for item in self.cart.values())
-        except (KeyError, ValueError):
-            return Decimal('0')
+        return self.total
+    
+    def verify(self):
+        """Check the running totals against the lines, repairing them if off
+        
+        Returns True when they matched.
+        """
+        count, total = cart_totals(list(self.lines.values()))
+        if (count, total) == (self.count, self.total):
+            return True
+        logger.warning(f"Cart totals drifted ({self.count}, {self.total}) != ({count}, {total}); repaired")
+        self.count, self.total = count, total
+        self.save()
+        return False
     
     def clear(self):
         """Empty cart"""
-        if settings.CART_SESSION_ID in self.session:
-            del self.session[settings.CART_SESSION_ID]
-            self.save()
+        self.lines = {}
+        self.count, self.total = 0, Decimal('0')
+        self.storage.clear()
     
     def save(self):
-        """Mark session as modified"""
-        self.session.modified = True
\ No newline at end of file
+        """Write the lines and totals back to the cart storage"""
+        self.storage.save({
+            'lines': list(self.lines.values()),
+            'count': self.count,
+            'total': str(self.total),
+        })
\ No newline at end of file
@@ -1,8 +1,12 @@
+from django.utils.functional import SimpleLazyObject
 from .cart import Cart
 
 def cart(request):
-    try:
-        return {'cart': Cart(request)}
-    except Exception:
-        # Return empty cart if there's any issue
-        return {'cart': []}
\ No newline at end of file
+    """Expose the cart lazily so pages that never show it skip the session"""
+    def get_cart():
+        try:
+            return Cart(request)
+        except Exception:
+            # Return empty cart if there's any issue
+            return []
+    return {'cart': SimpleLazyObject(get_cart)}
\ No newline at end of file
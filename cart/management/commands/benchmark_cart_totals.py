@@ -0,0 +1,46 @@
+import timeit
+from decimal import Decimal
+from types import SimpleNamespace
+from django.core.management.base import BaseCommand
+from cart.cart import Cart
+from cart.storage import cart_totals
+from products.models import Product, SizeVariant
+
+
+class Command(BaseCommand):
+    help = 'Microbenchmark running cart totals against re-summing every line'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, nargs='+', default=[1, 10, 50, 100, 200])
+        parser.add_argument('--number', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        number = options['number']
+        self.stdout.write(f"{'lines':>5} {'running':>12} {'re-sum':>12} {'add':>12} {'update':>12}   (us per call)")
+        for lines in options['lines']:
+            cart = self.make_cart(lines)
+            key = next(iter(cart.lines))
+            product = Product(id=1, name='Cake', base_price=Decimal('1000'))
+            size = SizeVariant(id=1, product=product, name='Small', slug='small', price=Decimal('1000'))
+
+            # What the templates and cart views call on every request
+            running = timeit.timeit(lambda: (len(cart), cart.get_total()), number=number)
+            resum = timeit.timeit(lambda: cart_totals(list(cart.lines.values())), number=number)
+            add = timeit.timeit(lambda: cart.add(product, size, None, None, ''), number=number)
+            update = timeit.timeit(lambda: cart.update(key, 2), number=number)
+
+            self.stdout.write(
+                f'{lines:5d} {self.us(running, number):12.2f} {self.us(resum, number):12.2f} '
+                f'{self.us(add, number):12.2f} {self.us(update, number):12.2f}'
+            )
+
+    def make_cart(self, lines):
+        cart = Cart(SimpleNamespace(session={}))
+        for i in range(lines):
+            product = Product(id=i + 1, name=f'Cake {i}', base_price=Decimal(1000 + i))
+            cart.add(product, None, None, None, f'message {i}')
+        return cart
+
+    @staticmethod
+    def us(seconds, number):
+        return seconds / number * 1e6
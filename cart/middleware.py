@@ -0,0 +1,11 @@
+from django.utils.deprecation import MiddlewareMixin
+
+
+class CartMiddleware(MiddlewareMixin):
+    """Let the cart storage write its cookie once the view has run"""
+
+    def process_response(self, request, response):
+        storage = getattr(request, '_cart_storage', None)
+        if storage is not None:
+            storage.process_response(response)
+        return response
@@ -0,0 +1,92 @@
+"""Validate and price cake selections against the catalog
+
+Lookups go through the catalog cache, so a warm cache resolves a selection
+without touching the database and a cold one loads each product (with its
+sizes and icing options) once per catalog version.
+"""
+from collections import namedtuple
+from decimal import Decimal
+from products.cache import catalog
+from .storage import EGGS, ICING, PRODUCT, SIZE
+
+Selection = namedtuple('Selection', ['product', 'size', 'icing', 'eggs', 'unit_price'])
+
+
+class InvalidSelection(Exception):
+    """The requested product or one of its options cannot be ordered"""
+
+
+def unit_price(product, size=None, icing=None, eggs=None):
+    """Price of one cake: the size price (or base price) plus modifiers"""
+    price = size.price if size else product.base_price
+    if icing:
+        price += icing.price_modifier
+    if eggs:
+        price += eggs.price_modifier
+    return Decimal(price)
+
+
+def _find(options, attr, value):
+    return next((option for option in options if getattr(option, attr) == value), None)
+
+
+def resolve(product_id, size_slug=None, icing_slug=None, eggs_slug=None):
+    """Return the priced Selection for a product and option slugs
+
+    Raises InvalidSelection for an unknown or inactive product, an unknown
+    option, or a missing size on a product that has sizes.
+    """
+    try:
+        product = catalog.product(product_id)
+    except (TypeError, ValueError):
+        product = None
+    if product is None or not product.is_active:
+        raise InvalidSelection("This cake is no longer available.")
+
+    sizes = product.sizes.all()
+    size = None
+    if size_slug:
+        size = _find(sizes, 'slug', size_slug)
+        if size is None:
+            raise InvalidSelection("Please choose one of the listed sizes.")
+    elif sizes:
+        raise InvalidSelection("Please choose a size.")
+
+    icing = None
+    if icing_slug:
+        icing = _find(product.icing_options.all(), 'slug', icing_slug)
+        if icing is None:
+            raise InvalidSelection("Please choose one of the listed icings.")
+
+    eggs = None
+    if eggs_slug:
+        eggs = _find(catalog.egg_options(), 'slug', eggs_slug)
+        if eggs is None:
+            raise InvalidSelection("Please choose one of the listed egg options.")
+
+    return Selection(product, size, icing, eggs, unit_price(product, size, icing, eggs))
+
+
+def resolve_lines(lines, use_cache=True):
+    """Resolve stored cart lines in one batch, at current catalog prices
+
+    Returns a Selection per line, or None where the product is inactive or
+    gone or a chosen option no longer exists. With use_cache=False the
+    catalog is read from the database rather than the catalog cache.
+    """
+    products = catalog.products({line[PRODUCT] for line in lines}, use_cache)
+    eggs_options = {egg.id: egg for egg in catalog.egg_options(use_cache)} if any(line[EGGS] for line in lines) else {}
+
+    selections = []
+    for line in lines:
+        product = products.get(line[PRODUCT])
+        selection = None
+        if product is not None and product.is_active:
+            size = _find(product.sizes.all(), 'id', line[SIZE])
+            icing = _find(product.icing_options.all(), 'id', line[ICING])
+            eggs = eggs_options.get(line[EGGS])
+            chosen = [(line[SIZE], size), (line[ICING], icing), (line[EGGS], eggs)]
+            if all(option is not None for wanted, option in chosen if wanted):
+                selection = Selection(product, size, icing, eggs, unit_price(product, size, icing, eggs))
+        selections.append(selection)
+    return selections
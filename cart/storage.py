@@ -0,0 +1,227 @@
+"""Where a cart's lines are kept between requests
+
+A cart is stored as its lines plus running totals, so the item count and
+total are read without re-summing every line:
+
+    {'lines': [...], 'count': 3, 'total': '4500.00'}
+
+Each line is a compact list holding only catalog ids, the quantity, the unit
+price at the time of adding and the custom message:
+
+    [product_id, size_id, icing_id, eggs_id, quantity, unit_price, message]
+
+Names and slugs are filled in from the catalog cache when the cart is
+displayed. CART_STORAGE selects the backend:
+
+* SessionCartStorage keeps the lines in the session (the default; with the
+  DB session engine that is a django_session row)
+* SignedCookieCartStorage keeps them in a signed cookie, with no server state
+* CacheCartStorage keeps them in a cache alias, keyed by a random cart id
+  held in a signed cookie
+
+The cookie-based backends need cart.middleware.CartMiddleware to write
+their cookie on the response.
+"""
+import logging
+import uuid
+from decimal import Decimal
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from products.cache import catalog
+
+logger = logging.getLogger(__name__)
+
+# Positions in a stored line
+PRODUCT, SIZE, ICING, EGGS, QUANTITY, PRICE, MESSAGE = range(7)
+
+# Browsers drop cookies over 4096 bytes including the name and attributes
+MAX_COOKIE_SIZE = 4000
+
+
+def get_cart_storage(request):
+    """Return the request's cart storage, shared by every Cart it builds"""
+    storage = getattr(request, '_cart_storage', None)
+    if storage is None:
+        storage = request._cart_storage = import_string(settings.CART_STORAGE)(request)
+    return storage
+
+
+class BaseCartStorage:
+    """Loads the cart once per request and keeps it until saved"""
+
+    def __init__(self, request):
+        self.request = request
+        self._data = None
+        self.changed = False
+
+    def load(self):
+        """Return the stored cart, upgrading older formats on the way"""
+        if self._data is None:
+            self._data = upgrade_cart(self._read())
+        return self._data
+
+    def save(self, data):
+        self._data = data
+        self.changed = True
+        self._write(data if data['lines'] else None)
+
+    def clear(self):
+        self.save(empty_cart())
+
+    def process_response(self, response):
+        """Persist anything the response must carry (e.g. a cookie)"""
+
+    def _read(self):
+        raise NotImplementedError
+
+    def _write(self, data):
+        """Store data, or remove the cart when data is None"""
+        raise NotImplementedError
+
+
+class SessionCartStorage(BaseCartStorage):
+    def _read(self):
+        return self.request.session.get(settings.CART_SESSION_ID)
+
+    def _write(self, data):
+        session = self.request.session
+        if data:
+            session[settings.CART_SESSION_ID] = data
+        elif settings.CART_SESSION_ID in session:
+            del session[settings.CART_SESSION_ID]
+
+
+class SignedCookieCartStorage(BaseCartStorage):
+    salt = 'cart.storage.SignedCookieCartStorage'
+
+    def _read(self):
+        value = self.request.COOKIES.get(settings.CART_COOKIE_NAME)
+        if not value:
+            return None
+        try:
+            return signing.loads(value, salt=self.salt, max_age=settings.CART_COOKIE_AGE)
+        except signing.BadSignature:
+            # Tampered with or expired; start a new cart
+            return None
+
+    def _write(self, data):
+        pass
+
+    def process_response(self, response):
+        if not self.changed:
+            return
+        if not self._data['lines']:
+            response.delete_cookie(settings.CART_COOKIE_NAME)
+            return
+        value = signing.dumps(self._data, salt=self.salt, compress=True)
+        if len(value) > MAX_COOKIE_SIZE:
+            logger.warning(f"Cart cookie is {len(value)} bytes; browsers may drop it")
+        _set_cart_cookie(response, value)
+
+
+class CacheCartStorage(BaseCartStorage):
+    salt = 'cart.storage.CacheCartStorage'
+
+    def __init__(self, request):
+        super().__init__(request)
+        self.cart_id = request.get_signed_cookie(
+            settings.CART_COOKIE_NAME, default=None, salt=self.salt, max_age=settings.CART_COOKIE_AGE,
+        )
+
+    @property
+    def cache(self):
+        return caches[settings.CART_CACHE_ALIAS]
+
+    def _cache_key(self):
+        return f'cart:{self.cart_id}'
+
+    def _read(self):
+        if not self.cart_id:
+            return None
+        return self.cache.get(self._cache_key())
+
+    def _write(self, data):
+        if not data:
+            if self.cart_id:
+                self.cache.delete(self._cache_key())
+            return
+        if not self.cart_id:
+            self.cart_id = uuid.uuid4().hex
+        self.cache.set(self._cache_key(), data, settings.CART_COOKIE_AGE)
+
+    def process_response(self, response):
+        if not self.changed:
+            return
+        if self._data['lines']:
+            # Re-sent on every change so the cookie expires with the cache entry
+            _set_cart_cookie(response, self.cart_id, salt=self.salt)
+        else:
+            response.delete_cookie(settings.CART_COOKIE_NAME)
+
+
+def _set_cart_cookie(response, value, salt=None):
+    options = {
+        'max_age': settings.CART_COOKIE_AGE,
+        'secure': settings.SESSION_COOKIE_SECURE,
+        'httponly': True,
+        'samesite': 'Lax',
+    }
+    if salt:
+        response.set_signed_cookie(settings.CART_COOKIE_NAME, value, salt=salt, **options)
+    else:
+        response.set_cookie(settings.CART_COOKIE_NAME, value, **options)
+
+
+def empty_cart():
+    return {'lines': [], 'count': 0, 'total': '0'}
+
+
+def cart_totals(lines):
+    """Recompute (count, total) from scratch"""
+    count = sum(line[QUANTITY] for line in lines)
+    total = sum((Decimal(line[PRICE]) * line[QUANTITY] for line in lines), Decimal('0'))
+    return count, total
+
+
+def upgrade_cart(data):
+    """Bring a stored cart of any earlier format up to the current one
+
+    Carts stored before running totals were plain line lists, and before
+    that a dict of verbose line dicts keyed by line key.
+    """
+    if not data:
+        return empty_cart()
+    if isinstance(data, dict) and 'lines' in data:
+        return data
+    lines = upgrade_legacy_cart(data) if isinstance(data, dict) else data
+    count, total = cart_totals(lines)
+    return {'lines': lines, 'count': count, 'total': str(total)}
+
+
+def upgrade_legacy_cart(cart):
+    """Convert a cart stored as the old verbose dict into compact lines
+
+    Lines whose product no longer exists in the catalog are dropped.
+    """
+    products = catalog.products({item['product_id'] for item in cart.values()})
+    eggs_by_slug = {egg.slug: egg for egg in catalog.egg_options()}
+    lines = []
+    for item in cart.values():
+        product = products.get(int(item['product_id']))
+        if product is None:
+            continue
+        size = next((s for s in product.sizes.all() if s.slug == item.get('size_slug')), None)
+        icing = next((i for i in product.icing_options.all() if i.slug == item.get('icing_slug')), None)
+        eggs = eggs_by_slug.get(item.get('eggs_slug'))
+        lines.append([
+            product.id,
+            size.id if size else None,
+            icing.id if icing else None,
+            eggs.id if eggs else None,
+            int(item['quantity']),
+            str(item['unit_price']),
+            item.get('message', ''),
+        ])
+    return lines
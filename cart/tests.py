@@ -1,3 +1,227 @@
-from django.test import TestCase
+from decimal import Decimal
+from types import SimpleNamespace
+from django.contrib.sessions.models import Session
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from products.models import Product, SizeVariant
+from products.testing import make_catalog
+from .cart import Cart
+from .resolver import InvalidSelection, resolve, resolve_lines
+from .storage import upgrade_legacy_cart
 
-# Create your tests here.
+
+class LazyCartTests(TestCase):
+    def setUp(self):
+        self.product = make_catalog(products=3)[0]
+
+    def test_anonymous_browsing_writes_no_session(self):
+        urls = [reverse('shop:home'), reverse('products:list'), self.product.get_absolute_url(), reverse('cart:detail')]
+
+        with CaptureQueriesContext(connection) as queries:
+            for url in urls:
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+        self.assertEqual([q['sql'] for q in queries if 'django_session' in q['sql']], [])
+        self.assertFalse(Session.objects.exists())
+        self.assertNotIn('sessionid', self.client.cookies)
+
+    def test_first_add_creates_the_session(self):
+        self.client.post(reverse('cart:add'), {'product_id': self.product.id, 'size': 'small'})
+
+        self.assertEqual(Session.objects.count(), 1)
+        response = self.client.get(reverse('cart:detail'))
+        self.assertEqual(len(response.context['cart']), 1)
+
+    def test_removing_the_last_line_leaves_an_empty_cart(self):
+        self.client.post(reverse('cart:add'), {'product_id': self.product.id, 'size': 'small'})
+        key = next(iter(self.client.get(reverse('cart:detail')).context['cart']))['key']
+
+        self.client.post(reverse('cart:remove'), {'key': key})
+
+        self.assertNotIn('cart', self.client.session)
+
+
+class CartStorageTests(TestCase):
+    def setUp(self):
+        self.products = make_catalog(products=2)
+
+    def add(self, product, **options):
+        data = {'product_id': product.id, 'size': 'medium', 'icing': 'fondant', 'eggs': 'eggless'}
+        data.update(options)
+        return self.client.post(reverse('cart:add'), data)
+
+    def items(self):
+        return list(self.client.get(reverse('cart:detail')).context['cart'])
+
+    def check_round_trip(self):
+        self.add(self.products[0], message='Happy birthday')
+        self.add(self.products[0], message='Happy birthday')
+        self.add(self.products[1], size='small', icing='', eggs='')
+
+        first, second = self.items()
+        self.assertEqual(first['product_name'], self.products[0].name)
+        self.assertEqual((first['size_name'], first['icing_name'], first['eggs_name']),
+                         ('Medium', 'Fondant', 'Eggless'))
+        self.assertEqual(first['message'], 'Happy birthday')
+        self.assertEqual(first['quantity'], 2)
+        self.assertEqual(first['unit_price'], self.products[0].base_price + 800 + 500 + 300)
+        self.assertEqual(first['total_price'], first['unit_price'] * 2)
+        self.assertEqual(second['icing_name'], '')
+
+        self.client.post(reverse('cart:update'), {'key': first['key'], 'quantity': 5})
+        self.client.post(reverse('cart:remove'), {'key': second['key']})
+        self.assertEqual([(item['key'], item['quantity']) for item in self.items()], [(first['key'], 5)])
+
+    def test_session_storage(self):
+        self.check_round_trip()
+        self.assertEqual(len(self.client.session['cart']['lines']), 1)
+
+    @override_settings(CART_STORAGE='cart.storage.SignedCookieCartStorage')
+    def test_signed_cookie_storage(self):
+        self.check_round_trip()
+        self.assertIn('cart', self.client.cookies)
+        self.assertFalse(Session.objects.exists())
+
+    @override_settings(CART_STORAGE='cart.storage.CacheCartStorage')
+    def test_cache_storage(self):
+        self.check_round_trip()
+        self.assertIn('cart', self.client.cookies)
+        self.assertFalse(Session.objects.exists())
+
+    @override_settings(CART_STORAGE='cart.storage.SignedCookieCartStorage')
+    def test_tampered_cookie_starts_an_empty_cart(self):
+        self.add(self.products[0])
+        self.client.cookies['cart'] = self.client.cookies['cart'].value + 'x'
+
+        self.assertEqual(self.items(), [])
+
+    def test_legacy_session_cart_is_upgraded(self):
+        product = self.products[0]
+        size = SizeVariant.objects.get(product=product, slug='large')
+        legacy = {
+            f'{product.id}-large-eggless-no-icing-no-message': {
+                'product_id': str(product.id), 'product_name': product.name,
+                'size_name': 'Large', 'size_slug': 'large', 'eggs_name': 'Eggless', 'eggs_slug': 'eggless',
+                'icing_name': '', 'icing_slug': 'no-icing', 'message': '',
+                'unit_price': '2900.00', 'quantity': 3, 'total_price': '8700.00',
+            },
+            '999999-small-no-eggs-no-icing-no-message': {
+                'product_id': '999999', 'size_slug': 'small', 'eggs_slug': 'no-eggs',
+                'icing_slug': 'no-icing', 'unit_price': '1.00', 'quantity': 1,
+            },
+        }
+
+        lines = upgrade_legacy_cart(legacy)
+
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(lines[0][:5], [product.id, size.id, None, lines[0][3], 3])
+        self.assertIsNotNone(lines[0][3])
+        self.assertEqual(Decimal(lines[0][5]), Decimal('2900.00'))
+
+
+class ResolverTests(TestCase):
+    def setUp(self):
+        self.product = make_catalog(products=2)[0]
+
+    def test_resolve_prices_selection_from_the_cache(self):
+        resolve(self.product.id, 'small', 'fondant', 'eggless')
+
+        with self.assertNumQueries(0):
+            selection = resolve(self.product.id, 'large', 'fondant', 'eggless')
+
+        self.assertEqual(selection.size.slug, 'large')
+        self.assertEqual(selection.unit_price, self.product.base_price + 1600 + 500 + 300)
+
+    def test_invalid_selections_are_rejected(self):
+        Product.objects.filter(pk=self.product.pk + 1).update(is_active=False)
+        cases = [
+            (self.product.id, 'huge', None, None),
+            (self.product.id, None, None, None),
+            (self.product.id, 'small', 'marzipan', None),
+            (self.product.id, 'small', None, 'duck-eggs'),
+            (self.product.id + 1, 'small', None, None),
+            (999999, 'small', None, None),
+            ('not-a-number', 'small', None, None),
+        ]
+        for case in cases:
+            with self.subTest(case=case), self.assertRaises(InvalidSelection):
+                resolve(*case)
+
+    def test_cart_add_rejects_invalid_selection(self):
+        response = self.client.post(reverse('cart:add'), {'product_id': self.product.id, 'size': 'huge'},
+                                    headers={'x-requested-with': 'XMLHttpRequest'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['success'], False)
+        self.assertNotIn('cart', self.client.session)
+
+        response = self.client.post(reverse('cart:add'), {'product_id': self.product.id, 'size': 'small',
+                                                          'quantity': '0'})
+        self.assertRedirects(response, reverse('products:list'))
+
+    def test_resolve_lines_reprices_in_one_batch(self):
+        selection = resolve(self.product.id, 'medium', 'buttercream', None)
+        line = [self.product.id, selection.size.id, selection.icing.id, None, 1, '1.00', '']
+        other = [self.product.id + 1, None, None, None, 1, '1.00', '']
+        gone = [999999, None, None, None, 1, '1.00', '']
+        SizeVariant.objects.filter(pk=selection.size.pk).update(price=5000)
+        SizeVariant.objects.get(pk=selection.size.pk).save()  # Bumps the catalog version
+
+        with self.assertNumQueries(3):  # Products, then their sizes and icing options
+            resolved, resolved_other, missing = resolve_lines([line, other, gone])
+
+        self.assertEqual(resolved_other.unit_price, resolved_other.product.base_price)
+        self.assertIsNone(missing)
+        self.assertEqual(resolved.unit_price, Decimal('5000'))
+
+
+class CartTotalsTests(TestCase):
+    def setUp(self):
+        self.products = make_catalog(products=3)
+        self.request = SimpleNamespace(session={})
+
+    def add(self, cart, product, size_slug='small', quantity=1, message=''):
+        selection = resolve(product.id, size_slug)
+        cart.add(selection.product, selection.size, None, None, message, quantity)
+        return selection.unit_price
+
+    def test_totals_follow_every_change(self):
+        cart = Cart(self.request)
+        small = self.add(cart, self.products[0], quantity=2)
+        large = self.add(cart, self.products[1], 'large', quantity=3)
+        self.add(cart, self.products[0])
+
+        self.assertEqual((len(cart), cart.get_total()), (6, small * 3 + large * 3))
+
+        key = next(item['key'] for item in cart if item['size_slug'] == 'large')
+        cart.update(key, 1)
+        self.assertEqual((len(cart), cart.get_total()), (4, small * 3 + large))
+        cart.remove(key)
+        self.assertEqual((len(cart), cart.get_total()), (3, small * 3))
+        self.assertTrue(cart.verify())
+
+        # A fresh Cart reads the stored totals
+        stored = Cart(self.request)
+        self.assertEqual((len(stored), stored.get_total()), (3, small * 3))
+
+    def test_verify_repairs_drifted_totals(self):
+        cart = Cart(self.request)
+        price = self.add(cart, self.products[0], quantity=2)
+        self.request.session['cart']['total'] = '1.00'
+
+        cart = Cart(self.request)
+        self.assertFalse(cart.verify())
+
+        self.assertEqual(cart.get_total(), price * 2)
+        self.assertEqual(Decimal(self.request.session['cart']['total']), price * 2)
+
+    def test_line_list_carts_gain_totals(self):
+        product = self.products[0]
+        self.request.session['cart'] = [[product.id, None, None, None, 2, '1500.00', ''],
+                                         [product.id, None, None, None, 1, '10.50', 'Hi']]
+
+        cart = Cart(self.request)
+
+        self.assertEqual((len(cart), cart.get_total()), (3, Decimal('3010.50')))
@@ -1,7 +1,8 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from django.contrib import messages
+from django.shortcuts import render, redirect
 from django.http import JsonResponse
-from products.models import Product, SizeVariant, IcingOption, EggOption
 from .cart import Cart
+from .resolver import InvalidSelection, resolve
 
 def cart_detail(request):
     return render(request, 'cart/detail.html')
@@ -13,15 +14,20 @@ def cart_add(request):
         icing_slug = request.POST.get('icing')
         eggs_slug = request.POST.get('eggs')
         message = request.POST.get('message', '')
-        quantity = int(request.POST.get('quantity', 1))
+        try:
+            quantity = int(request.POST.get('quantity', 1))
+        except ValueError:
+            quantity = 0
+        if quantity < 1:
+            return _invalid_selection(request, "Please enter a quantity of at least 1.")
         
-        product = get_object_or_404(Product, id=product_id)
-        size = SizeVariant.objects.filter(slug=size_slug, product=product).first() if size_slug else None
-        icing = IcingOption.objects.filter(slug=icing_slug, product=product).first() if icing_slug else None
-        eggs = EggOption.objects.filter(slug=eggs_slug).first() if eggs_slug else None
+        try:
+            selection = resolve(product_id, size_slug, icing_slug, eggs_slug)
+        except InvalidSelection as e:
+            return _invalid_selection(request, str(e))
         
         cart = Cart(request)
-        cart.add(product, size, eggs, icing, message, quantity)
+        cart.add(selection.product, selection.size, selection.eggs, selection.icing, message, quantity)
         
         if request.headers.get('x-requested-with') == 'XMLHttpRequest':
             return JsonResponse({
@@ -34,6 +40,12 @@ def cart_add(request):
     
     return redirect('products:list')
 
+def _invalid_selection(request, error):
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        return JsonResponse({'success': False, 'error': error}, status=400)
+    messages.error(request, error)
+    return redirect('products:list')
+
 def cart_remove(request):
     if request.method == 'POST':
         key = request.POST.get('key')
@@ -1,3 +1,37 @@
 from django.contrib import admin
+from .inbox import requeue, wake_workers
+from .models import CallbackInboxEntry, CallbackLedgerEntry
 
-# Register your models here.
+@admin.register(CallbackLedgerEntry)
+class CallbackLedgerEntryAdmin(admin.ModelAdmin):
+    list_display = ['checkout_request_id', 'result_code', 'result_desc', 'receipt_number', 'received_at']
+    list_filter = ['result_code', 'received_at']
+    search_fields = ['checkout_request_id', 'merchant_request_id', 'receipt_number']
+    readonly_fields = [field.name for field in CallbackLedgerEntry._meta.fields]
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(CallbackInboxEntry)
+class CallbackInboxEntryAdmin(admin.ModelAdmin):
+    list_display = ['id', 'status', 'attempts', 'received_at', 'retry_at', 'processed_at', 'error']
+    list_filter = ['status', 'received_at']
+    readonly_fields = [field.name for field in CallbackInboxEntry._meta.fields]
+    
+    actions = ['requeue_entries']
+    
+    def requeue_entries(self, request, queryset):
+        count = requeue(queryset.exclude(status='processing'))
+        wake_workers()
+        self.message_user(request, f"{count} callbacks queued for another try.")
+    requeue_entries.short_description = "Retry selected callbacks"
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class MpesaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mpesa'
+
+    def ready(self):
+        from django.conf import settings
+        from myshop.workers import serves_requests
+        
+        # Start at boot, so callbacks stored before a restart (and retries
+        # waiting for their retry_at) are applied without a new callback
+        # having to wake the workers
+        if settings.CALLBACK_WORKERS > 0 and serves_requests():
+            from .inbox import get_worker_pool
+            get_worker_pool()
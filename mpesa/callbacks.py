@@ -0,0 +1,116 @@
+"""Idempotent processing of STK push callbacks
+
+Every callback is recorded in the callback ledger and applied in one
+transaction; a retry of a result already recorded stops at the ledger's
+unique constraint. A new result moves its order with a compare-and-set
+UPDATE that only matches the statuses the transition may start from, so a
+late failure never overwrites a paid order and concurrent deliveries cannot
+both apply. A result whose order is not found is rolled back with its
+ledger row, so a later delivery can still apply it.
+"""
+import logging
+from collections import namedtuple
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from orders.models import Order
+from orders.notifications import publish_order_status
+from .models import CallbackLedgerEntry
+
+logger = logging.getLogger(__name__)
+
+# Daraja ResultCode to order status; anything else is a failure
+RESULT_STATUSES = {
+    0: 'paid',
+    1: 'failed',       # Insufficient funds
+    1031: 'cancelled',  # Rejected by the user
+    1032: 'cancelled',  # Cancelled by the user
+    1037: 'timeout',    # The user did not enter their PIN
+}
+
+# A payment that went through is recorded even after the order gave up
+# waiting for it; every other result only settles a pending order
+TRANSITIONS_FROM = {
+    'paid': ['pending', 'failed', 'cancelled', 'timeout'],
+}
+
+ParsedCallback = namedtuple('ParsedCallback', [
+    'checkout_request_id', 'merchant_request_id', 'result_code', 'result_desc', 'receipt_number',
+])
+
+
+def parse_callback(data):
+    """Pull the fields we act on out of a callback body
+
+    Raises ValueError when the body is not an STK push callback.
+    """
+    stk_callback = (data.get('Body') or {}).get('stkCallback') if isinstance(data, dict) else None
+    if not stk_callback or not stk_callback.get('CheckoutRequestID') or stk_callback.get('ResultCode') is None:
+        raise ValueError("Not an STK push callback")
+
+    metadata = {
+        item.get('Name'): item.get('Value')
+        for item in (stk_callback.get('CallbackMetadata') or {}).get('Item', [])
+    }
+    return ParsedCallback(
+        checkout_request_id=str(stk_callback['CheckoutRequestID']),
+        merchant_request_id=str(stk_callback.get('MerchantRequestID') or ''),
+        result_code=int(stk_callback['ResultCode']),
+        result_desc=str(stk_callback.get('ResultDesc') or '')[:255],
+        receipt_number=str(metadata.get('MpesaReceiptNumber') or ''),
+    )
+
+
+def record_callback(callback, payload):
+    """Add callback to the ledger; False if this result was already recorded"""
+    try:
+        # A savepoint, so the rejected duplicate leaves the caller's
+        # transaction usable
+        with transaction.atomic():
+            CallbackLedgerEntry.objects.create(payload=payload, **callback._asdict())
+    except IntegrityError:
+        return False
+    return True
+
+
+def apply_callback(callback):
+    """Move the callback's order to its new status; None if nothing changed
+
+    Raises Order.DoesNotExist when no order carries the callback's ids yet,
+    e.g. when it arrives before the STK push response was saved.
+    """
+    status = RESULT_STATUSES.get(callback.result_code, 'failed')
+    updates = {'status': status, 'updated_at': timezone.now()}
+    if status == 'paid':
+        updates['transaction_id'] = callback.receipt_number
+
+    candidates = [Order.objects.by_checkout_request_id(callback.checkout_request_id)]
+    if callback.merchant_request_id:
+        candidates.append(Order.objects.by_merchant_request_id(callback.merchant_request_id))
+
+    for orders in candidates:
+        if orders.filter(status__in=TRANSITIONS_FROM.get(status, ['pending'])).update(**updates):
+            order = orders.get()
+            logger.info(f"Order {order.id} {status} after callback {callback.result_code}: {callback.result_desc}")
+            # Push the result to any browser waiting on the status stream
+            # once it is committed and visible to their re-reads
+            transaction.on_commit(lambda: publish_order_status(order))
+            return order
+
+    if not any(orders.exists() for orders in candidates):
+        raise Order.DoesNotExist(f"No order for callback {callback.checkout_request_id} ({callback.result_code})")
+    logger.info(f"Callback {callback.checkout_request_id} ({callback.result_code}) left its order unchanged")
+    return None
+
+
+def process_callback(data):
+    """Record a parsed callback body and apply it if it is new
+
+    Raises Order.DoesNotExist, recording nothing, when its order is missing.
+    """
+    callback = parse_callback(data)
+    with transaction.atomic():
+        if not record_callback(callback, data):
+            logger.info(f"Duplicate callback {callback.checkout_request_id} ({callback.result_code}) ignored")
+            return None
+        return apply_callback(callback)
+
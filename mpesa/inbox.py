@@ -0,0 +1,142 @@
+"""DB-backed inbox for STK push callbacks
+
+The callback view only stores the raw body and acknowledges Safaricom; a
+pool of worker threads claims queued entries in batches and applies them
+through mpesa.callbacks. The workers run inside the web process
+(CALLBACK_WORKERS > 0) or under ``manage.py run_callback_workers``.
+
+Safaricom does not resend an acknowledged callback, so an entry that hits
+an error is queued again with a growing delay; only bodies that can never
+be applied, and entries out of attempts, end up failed. The admin can
+requeue those.
+"""
+import json
+import logging
+import threading
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from myshop.workers import WorkerPool
+from .callbacks import process_callback
+from .models import CallbackInboxEntry
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def receive(body):
+    """Store a raw callback body and wake the workers once committed"""
+    entry = CallbackInboxEntry.objects.create(body=body)
+    transaction.on_commit(wake_workers)
+    return entry
+
+
+async def areceive(body):
+    """Async variant of receive(); views run outside a transaction"""
+    entry = await CallbackInboxEntry.objects.acreate(body=body)
+    wake_workers()
+    return entry
+
+
+def claim_batch(limit):
+    """Claim up to limit of the oldest queued entries for this worker
+
+    The claim is one compare-and-set UPDATE tagged with a fresh token, so
+    concurrent workers (threads or processes) never share an entry. Entries
+    waiting for a retry are skipped until their retry_at; entries left
+    processing by a worker that died are claimed again after
+    CALLBACK_CLAIM_TIMEOUT seconds.
+    """
+    now = timezone.now()
+    claimable = Q(status='queued') & (Q(retry_at__isnull=True) | Q(retry_at__lte=now)) | Q(
+        status='processing', claimed_at__lt=now - timedelta(seconds=settings.CALLBACK_CLAIM_TIMEOUT),
+    )
+    pks = list(CallbackInboxEntry.objects.filter(claimable).order_by('received_at')
+               .values_list('pk', flat=True)[:limit])
+    if not pks:
+        return []
+    token = uuid.uuid4().hex
+    CallbackInboxEntry.objects.filter(claimable, pk__in=pks).update(
+        status='processing', claimed_by=token, claimed_at=now, attempts=F('attempts') + 1,
+    )
+    return list(CallbackInboxEntry.objects.filter(claimed_by=token, status='processing').order_by('received_at'))
+
+
+def retry_delay(attempts):
+    """Seconds before another try, doubling from CALLBACK_RETRY_DELAY"""
+    return settings.CALLBACK_RETRY_DELAY * 2 ** (attempts - 1)
+
+
+def process_entry(entry):
+    """Apply one claimed entry; returns the error message, or '' on success
+
+    A failed entry is requeued, unless its body can never be applied or it
+    has used up CALLBACK_MAX_ATTEMPTS, in which case it is marked failed.
+    """
+    try:
+        process_callback(json.loads(entry.body))
+        return ''
+    except ValueError as e:
+        # Not JSON or not an STK callback; a retry would fail the same way
+        logger.error(f"Unexpected M-Pesa callback body in entry {entry.pk}: {e}")
+        error, retry = str(e)[:255] or 'Invalid callback', False
+    except Exception as e:
+        # The order may not be saved yet, or the database was unavailable
+        logger.exception(f"Error processing M-Pesa callback entry {entry.pk} (attempt {entry.attempts})")
+        error, retry = str(e)[:255] or e.__class__.__name__, entry.attempts < settings.CALLBACK_MAX_ATTEMPTS
+
+    entries = CallbackInboxEntry.objects.filter(pk=entry.pk, claimed_by=entry.claimed_by)
+    if retry:
+        entries.update(status='queued', error=error, claimed_by='',
+                       retry_at=timezone.now() + timedelta(seconds=retry_delay(entry.attempts)))
+    else:
+        entries.update(status='failed', error=error, processed_at=timezone.now())
+    return error
+
+
+def process_inbox(limit=None, batch_size=None):
+    """Apply queued callbacks until the inbox is empty or limit is reached"""
+    batch_size = batch_size or settings.CALLBACK_WORKER_BATCH_SIZE
+    processed = 0
+    while limit is None or processed < limit:
+        batch = claim_batch(batch_size if limit is None else min(batch_size, limit - processed))
+        if not batch:
+            break
+        done = [entry.pk for entry in batch if not process_entry(entry)]
+        # One UPDATE for the whole batch instead of a save per entry
+        CallbackInboxEntry.objects.filter(pk__in=done).update(status='done', processed_at=timezone.now())
+        processed += len(batch)
+    return processed
+
+
+def requeue(entries):
+    """Queue entries for another try with a fresh set of attempts"""
+    return entries.update(status='queued', attempts=0, retry_at=None, claimed_by='', error='')
+
+
+def get_worker_pool(threads=None):
+    """Return the process-wide callback worker pool, starting it if needed"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool(
+                'callback-worker',
+                lambda: process_inbox(limit=settings.CALLBACK_WORKER_BATCH_SIZE),
+                threads=threads or settings.CALLBACK_WORKERS,
+                idle_interval=settings.CALLBACK_WORKER_IDLE_INTERVAL,
+            )
+        _pool.start()
+    return _pool
+
+
+def wake_workers():
+    """Nudge the in-process workers, starting them if CALLBACK_WORKERS > 0"""
+    if _pool is None and settings.CALLBACK_WORKERS > 0:
+        get_worker_pool()
+    if _pool is not None:
+        _pool.wake()
@@ -0,0 +1,85 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from mpesa.callbacks import process_callback
+from mpesa.inbox import process_inbox, receive
+from mpesa.models import CallbackInboxEntry
+from myshop.benchmarking import benchmark_database, summarize
+from myshop.workers import WorkerPool
+from orders.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Compare applying M-Pesa callbacks inline with the fast-ack inbox and its workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--callbacks', type=int, default=2000)
+        parser.add_argument('--threads', type=int, default=8,
+                            help='Concurrent callback deliveries')
+        parser.add_argument('--workers', type=int, default=2,
+                            help='Callback worker threads draining the inbox')
+        parser.add_argument('--batch-size', type=int, default=50)
+
+    def handle(self, *args, **options):
+        count = options['callbacks']
+        with benchmark_database() as db, override_settings(CALLBACK_WORKERS=0):
+            self.stdout.write(f"Database: {db.vendor}, {count} callbacks, {options['threads']} senders")
+            Order.objects.bulk_create([
+                Order(total=100, payment_method='M-Pesa', checkout_request_id=f'ws_CO_{i}')
+                for i in range(count * 2)
+            ])
+            inline = [self.callback(i) for i in range(count)]
+            queued = [self.callback(i) for i in range(count, count * 2)]
+
+            def apply_inline(body):
+                process_callback(json.loads(body))
+
+            # What the callback view does before replying, without the
+            # request handling both variants share
+            self.deliver('inline', inline, apply_inline, options['threads'])
+            self.deliver('fast ack', queued, receive, options['threads'])
+            self.drain(count, options['workers'], options['batch_size'])
+
+            paid = Order.objects.filter(status='paid').count()
+            self.stdout.write(f'Orders paid: {paid} of {count * 2}')
+
+    def callback(self, i):
+        return json.dumps({'Body': {'stkCallback': {
+            'MerchantRequestID': f'merchant-{i}',
+            'CheckoutRequestID': f'ws_CO_{i}',
+            'ResultCode': 0,
+            'ResultDesc': 'The service request is processed successfully.',
+            'CallbackMetadata': {'Item': [
+                {'Name': 'Amount', 'Value': 100},
+                {'Name': 'MpesaReceiptNumber', 'Value': f'QK{i:08d}'},
+                {'Name': 'PhoneNumber', 'Value': 254712345678},
+            ]},
+        }}})
+
+    def deliver(self, label, bodies, send, threads):
+        """Send every body from threads concurrently; report latency seen by the gateway"""
+        def timed(body):
+            started = time.perf_counter()
+            send(body)
+            return (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            timings = list(executor.map(timed, bodies))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'{label:<9} {len(bodies) / elapsed:8.1f} callbacks/s  {summarize(timings)}')
+
+    def drain(self, count, workers, batch_size):
+        pool = WorkerPool('benchmark-callback', lambda: process_inbox(limit=batch_size, batch_size=batch_size),
+                          threads=workers, idle_interval=0.05)
+        started = time.perf_counter()
+        pool.start()
+        while CallbackInboxEntry.objects.filter(status__in=['queued', 'processing']).exists():
+            time.sleep(0.05)
+        elapsed = time.perf_counter() - started
+        pool.stop()
+        failed = CallbackInboxEntry.objects.filter(status='failed').count()
+        self.stdout.write(f'{"workers":<9} {count / elapsed:8.1f} callbacks/s  '
+                          f'({count} applied by {workers} threads in {elapsed:.2f} s, {failed} failed)')
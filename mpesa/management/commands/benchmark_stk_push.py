@@ -0,0 +1,52 @@
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from mpesa.services import MpesaService, token_cache
+from mpesa.testing import FakeDarajaServer
+from mpesa.transport import reset_session
+
+
+class Command(BaseCommand):
+    help = 'Compare cold vs pooled STK push latency against a local stub Daraja server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--latency', type=float, default=0,
+                            help='Simulated gateway latency per call, in seconds')
+
+    def run(self, label, iterations, cold):
+        timings = []
+        for order_id in range(iterations):
+            if cold:
+                # New connection and token for every push, like the old bare requests calls
+                reset_session()
+                token_cache.clear()
+            started = time.perf_counter()
+            MpesaService().stk_push('0712345678', 100, order_id)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        timings.sort()
+        self.stdout.write(
+            f'{label:<7} mean {statistics.mean(timings):7.2f} ms  '
+            f'p50 {timings[len(timings) // 2]:7.2f} ms  '
+            f'p95 {timings[int(len(timings) * 0.95)]:7.2f} ms'
+        )
+        return statistics.mean(timings)
+
+    def handle(self, *args, **options):
+        latency = options['latency']
+        with FakeDarajaServer(oauth_delay=latency, stk_delay=latency) as fake:
+            with override_settings(MPESA_BASE_URL=fake.url, MPESA_CONSUMER_KEY='benchmark'):
+                cold = self.run('cold', options['requests'], cold=True)
+                cold_oauth = fake.oauth_requests
+                fake.reset()
+
+                reset_session()
+                token_cache.clear()
+                pooled = self.run('pooled', options['requests'], cold=False)
+
+                self.stdout.write(
+                    f'OAuth calls: cold {cold_oauth}, pooled {fake.oauth_requests}'
+                )
+        self.stdout.write(self.style.SUCCESS(f'Pooled speedup: {cold / pooled:.1f}x'))
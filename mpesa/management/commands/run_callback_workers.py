@@ -0,0 +1,23 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from mpesa.inbox import get_worker_pool
+
+
+class Command(BaseCommand):
+    help = 'Apply queued M-Pesa callbacks using a pool of worker threads'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=settings.CALLBACK_WORKERS or 2)
+    
+    def handle(self, *args, **options):
+        pool = get_worker_pool(threads=options['threads'])
+        self.stdout.write(f"Started {pool.threads} callback workers")
+        
+        try:
+            while True:
+                time.sleep(60)
+                self.stdout.write(f"Callback workers: {pool.stats()}")
+        except KeyboardInterrupt:
+            pool.stop(timeout=30)
+            self.stdout.write(self.style.SUCCESS(f"Stopped after applying {pool.processed} callbacks"))
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CallbackLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('checkout_request_id', models.CharField(max_length=100)),
+                ('merchant_request_id', models.CharField(blank=True, max_length=100)),
+                ('result_code', models.IntegerField()),
+                ('result_desc', models.CharField(blank=True, max_length=255)),
+                ('receipt_number', models.CharField(blank=True, max_length=100)),
+                ('payload', models.JSONField()),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Callback ledger entries',
+                'ordering': ['received_at'],
+                'constraints': [models.UniqueConstraint(fields=('checkout_request_id', 'result_code'), name='mpesa_callback_once_per_result')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mpesa', '0002_callbackinboxentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='callbackinboxentry',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='callbackinboxentry',
+            name='retry_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
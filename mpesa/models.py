@@ -1,3 +1,68 @@
 from django.db import models
 
-# Create your models here.
+class CallbackLedgerEntry(models.Model):
+    """One STK push callback from Safaricom, recorded once per result
+    
+    Rows are only ever inserted, in the transaction that applies the result
+    to its order. Safaricom retries callbacks, and the unique
+    (checkout_request_id, result_code) constraint turns a retry into a
+    rejected insert, so each result is applied to its order once.
+    """
+    checkout_request_id = models.CharField(max_length=100)
+    merchant_request_id = models.CharField(max_length=100, blank=True)
+    result_code = models.IntegerField()
+    result_desc = models.CharField(max_length=255, blank=True)
+    receipt_number = models.CharField(max_length=100, blank=True)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['received_at']
+        verbose_name_plural = "Callback ledger entries"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['checkout_request_id', 'result_code'],
+                name='mpesa_callback_once_per_result',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.checkout_request_id} -> {self.result_code}"
+
+
+class CallbackInboxEntry(models.Model):
+    """Raw callback body, stored before Safaricom is acknowledged
+    
+    Safaricom is not asked to retry an acknowledged callback, so this row
+    is the only copy of the result. The callback workers parse and apply
+    queued entries in batches (see mpesa.inbox) and requeue an entry that
+    hit an error until CALLBACK_MAX_ATTEMPTS is reached. Processing goes
+    through the callback ledger, whose row commits with the order update,
+    so an entry processed twice after a worker crash is still applied once.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    claimed_by = models.CharField(max_length=32, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.CharField(max_length=255, blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    retry_at = models.DateTimeField(null=True, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['received_at']
+        verbose_name_plural = "Callback inbox entries"
+        indexes = [
+            models.Index(fields=['status', 'received_at']),
+        ]
+    
+    def __str__(self):
+        return f"Callback #{self.pk} ({self.status})"
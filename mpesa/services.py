@@ -1,12 +1,125 @@
+import asyncio
 import requests
 import base64
+import threading
+import time
+import weakref
 from datetime import datetime
 from django.conf import settings
 import json
 import logging
+from .transport import get_async_client, get_async_timeout, get_session, get_timeout, httpx
 
 logger = logging.getLogger(__name__)
 
+
+class AccessTokenCache:
+    """Process-wide OAuth token cache with single-flight refresh
+
+    Tokens are reused until ``margin`` seconds before their ``expires_in``.
+    When a token is missing or stale only one thread per key calls the OAuth
+    endpoint; concurrent callers wait for that refresh and share its result.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._tokens = {}
+        self._refresh_locks = {}
+        self._async_refresh_locks = weakref.WeakKeyDictionary()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    def _refresh_lock(self, key):
+        with self._lock:
+            self.misses += 1
+            return self._refresh_locks.setdefault(key, threading.Lock())
+
+    def _async_refresh_lock(self, key):
+        # asyncio locks belong to one event loop, so keep a set per loop
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self.misses += 1
+            locks = self._async_refresh_locks.setdefault(loop, {})
+            return locks.setdefault(key, asyncio.Lock())
+
+    def _hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def _store(self, key, token, expires_in):
+        with self._lock:
+            self.refreshes += 1
+        if token:
+            self._tokens[key] = (token, self._clock() + expires_in)
+
+    def _fresh(self, key, margin):
+        entry = self._tokens.get(key)
+        if entry and entry[1] - margin > self._clock():
+            return entry[0]
+        return None
+
+    def get(self, key, fetch, margin=0):
+        """Return a cached token for key, calling fetch() to refresh it
+
+        fetch must return an ``(access_token, expires_in)`` tuple; a falsy
+        token is returned to the caller but never cached.
+        """
+        token = self._fresh(key, margin)
+        if token:
+            self._hit()
+            return token
+
+        with self._refresh_lock(key):
+            # Another thread may have refreshed the token while we waited
+            token = self._fresh(key, margin)
+            if token:
+                return token
+
+            token, expires_in = fetch()
+            self._store(key, token, expires_in)
+            return token
+
+    async def aget(self, key, fetch, margin=0):
+        """Async variant of get(); fetch is a coroutine function"""
+        token = self._fresh(key, margin)
+        if token:
+            self._hit()
+            return token
+
+        async with self._async_refresh_lock(key):
+            token = self._fresh(key, margin)
+            if token:
+                return token
+
+            token, expires_in = await fetch()
+            self._store(key, token, expires_in)
+            return token
+
+    def invalidate(self, key):
+        """Drop the cached token for key (e.g. after a 401)"""
+        self._tokens.pop(key, None)
+
+    def clear(self):
+        """Drop all tokens and reset the counters"""
+        with self._lock:
+            self._tokens.clear()
+            self.hits = self.misses = self.refreshes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'refreshes': self.refreshes,
+                'cached_tokens': len(self._tokens),
+            }
+
+
+token_cache = AccessTokenCache()
+
+
 class MpesaService:
     def __init__(self):
         self.consumer_key = settings.MPESA_CONSUMER_KEY
@@ -15,40 +128,37 @@ class MpesaService:
         self.passkey = settings.MPESA_PASSKEY
         self.env = settings.MPESA_ENV
         
-        if self.env == 'sandbox':
+        if settings.MPESA_BASE_URL:
+            self.base_url = settings.MPESA_BASE_URL.rstrip('/')
+        elif self.env == 'sandbox':
             self.base_url = 'https://sandbox.safaricom.co.ke'
         else:
             self.base_url = 'https://api.safaricom.co.ke'
     
+    @property
+    def token_cache_key(self):
+        return (self.base_url, self.consumer_key)
+    
     def get_access_token(self):
-        """Get OAuth access token"""
+        """Get OAuth access token, reusing the cached one until it expires"""
+        return token_cache.get(
+            self.token_cache_key,
+            self._fetch_access_token,
+            margin=settings.MPESA_TOKEN_REFRESH_MARGIN,
+        )
+    
+    def _oauth_request(self):
+        """Return the (url, headers) of an OAuth token request"""
         url = f"{self.base_url}/oauth/v1/generate?grant_type=client_credentials"
         auth_string = base64.b64encode(f"{self.consumer_key}:{self.consumer_secret}".encode()).decode()
         
         headers = {
             'Authorization': f'Basic {auth_string}'
         }
-        
-        try:
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()
-            data = response.json()
-            return data.get('access_token')
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error getting access token: {e}")
-            logger.error(f"Response: {getattr(e, 'response', None)}")
-            return None
-        except Exception as e:
-            logger.error(f"Unexpected error getting access token: {e}")
-            return None
+        return url, headers
     
-    def stk_push(self, phone, amount, order_id, description="Cake Purchase"):
-        """Initiate STK Push request"""
-        access_token = self.get_access_token()
-        if not access_token:
-            logger.error("Failed to get access token")
-            return {'error': 'Failed to get access token'}
-        
+    def _stk_push_request(self, access_token, phone, amount, order_id, description):
+        """Return the (url, payload, headers) of an STK Push request"""
         url = f"{self.base_url}/mpesa/stkpush/v1/processrequest"
         
         # Format timestamp
@@ -84,12 +194,44 @@ class MpesaService:
             'Authorization': f'Bearer {access_token}',
             'Content-Type': 'application/json'
         }
+        return url, payload, headers
+    
+    def _fetch_access_token(self):
+        """Request a new OAuth access token, returning (token, expires_in)"""
+        url, headers = self._oauth_request()
+        
+        try:
+            response = get_session().get(url, headers=headers, timeout=get_timeout('oauth'))
+            response.raise_for_status()
+            data = response.json()
+            return data.get('access_token'), int(data.get('expires_in', 3599))
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error getting access token: {e}")
+            logger.error(f"Response: {getattr(e, 'response', None)}")
+            return None, 0
+        except Exception as e:
+            logger.error(f"Unexpected error getting access token: {e}")
+            return None, 0
+    
+    def stk_push(self, phone, amount, order_id, description="Cake Purchase"):
+        """Initiate STK Push request"""
+        access_token = self.get_access_token()
+        if not access_token:
+            logger.error("Failed to get access token")
+            return {'error': 'Failed to get access token'}
+        
+        url, payload, headers = self._stk_push_request(access_token, phone, amount, order_id, description)
         
         try:
             logger.info(f"Sending STK Push request for order {order_id}")
             logger.info(f"Payload: {json.dumps(payload, indent=2)}")
             
-            response = requests.post(url, json=payload, headers=headers, timeout=30)
+            response = get_session().post(
+                url, json=payload, headers=headers, timeout=get_timeout('stk_push')
+            )
+            if response.status_code == 401:
+                # Token was revoked or expired early; fetch a new one next time
+                token_cache.invalidate(self.token_cache_key)
             response_data = response.json()
             
             logger.info(f"STK Push response for order {order_id}: {json.dumps(response_data, indent=2)}")
@@ -100,6 +242,70 @@ class MpesaService:
             logger.error(f"Error in STK Push request: {e}")
             logger.error(f"Response: {getattr(e, 'response', None)}")
             return {'error': str(e)}
+        except Exception as e:
+            logger.error(f"Unexpected error in STK Push: {e}")
+            return {'error': str(e)}
+
+
+class AsyncMpesaService(MpesaService):
+    """MpesaService with non-blocking versions of the Daraja calls
+
+    Uses a keep-alive httpx client per event loop, so one ASGI process or
+    async worker can keep many STK pushes in flight. Requires httpx.
+    """
+    
+    async def aget_access_token(self):
+        """Get OAuth access token, reusing the cached one until it expires"""
+        return await token_cache.aget(
+            self.token_cache_key,
+            self._afetch_access_token,
+            margin=settings.MPESA_TOKEN_REFRESH_MARGIN,
+        )
+    
+    async def _afetch_access_token(self):
+        """Request a new OAuth access token, returning (token, expires_in)"""
+        url, headers = self._oauth_request()
+        client = get_async_client()
+        
+        try:
+            response = await client.get(url, headers=headers, timeout=get_async_timeout('oauth'))
+            response.raise_for_status()
+            data = response.json()
+            return data.get('access_token'), int(data.get('expires_in', 3599))
+        except httpx.HTTPError as e:
+            logger.error(f"Error getting access token: {e}")
+            return None, 0
+        except Exception as e:
+            logger.error(f"Unexpected error getting access token: {e}")
+            return None, 0
+    
+    async def astk_push(self, phone, amount, order_id, description="Cake Purchase"):
+        """Initiate STK Push request"""
+        access_token = await self.aget_access_token()
+        if not access_token:
+            logger.error("Failed to get access token")
+            return {'error': 'Failed to get access token'}
+        
+        url, payload, headers = self._stk_push_request(access_token, phone, amount, order_id, description)
+        client = get_async_client()
+        
+        try:
+            logger.info(f"Sending STK Push request for order {order_id}")
+            
+            response = await client.post(
+                url, json=payload, headers=headers, timeout=get_async_timeout('stk_push')
+            )
+            if response.status_code == 401:
+                token_cache.invalidate(self.token_cache_key)
+            response_data = response.json()
+            
+            logger.info(f"STK Push response for order {order_id}: {response_data}")
+            
+            return response_data
+            
+        except httpx.HTTPError as e:
+            logger.error(f"Error in STK Push request: {e}")
+            return {'error': str(e)}
         except Exception as e:
             logger.error(f"Unexpected error in STK Push: {e}")
             return {'error': str(e)}
\ No newline at end of file
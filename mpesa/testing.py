@@ -0,0 +1,106 @@
+"""Local fake of the Daraja API for tests and benchmarks"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _DarajaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        fake = self.server.fake
+        if not self.path.startswith('/oauth/v1/generate'):
+            self._send_json(404, {'errorMessage': 'Not found'})
+            return
+
+        with fake.lock:
+            fake.oauth_requests += 1
+            token = f'fake-token-{fake.oauth_requests}'
+        if fake.oauth_delay:
+            time.sleep(fake.oauth_delay)
+        if fake.oauth_status != 200:
+            self._send_json(fake.oauth_status, {'errorMessage': 'Invalid credentials'})
+            return
+        self._send_json(200, {'access_token': token, 'expires_in': str(fake.expires_in)})
+
+    def do_POST(self):
+        fake = self.server.fake
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        if not self.path.startswith('/mpesa/stkpush/v1/processrequest'):
+            self._send_json(404, {'errorMessage': 'Not found'})
+            return
+
+        with fake.lock:
+            fake.stk_requests += 1
+            request_number = fake.stk_requests
+        if fake.stk_delay:
+            time.sleep(fake.stk_delay)
+        self._send_json(200, {
+            'MerchantRequestID': f'merchant-{request_number}',
+            'CheckoutRequestID': f'ws_CO_{request_number}',
+            'ResponseCode': '0',
+            'ResponseDescription': 'Success. Request accepted for processing',
+            'CustomerMessage': 'Success. Request accepted for processing',
+            'AccountReference': payload.get('AccountReference', ''),
+        })
+
+
+class FakeDarajaServer:
+    """Threaded HTTP server answering the OAuth and STK push endpoints
+
+    Use as a context manager; ``url`` can be passed as ``MPESA_BASE_URL``.
+    """
+
+    def __init__(self, expires_in=3599, oauth_delay=0, stk_delay=0):
+        self.expires_in = expires_in
+        self.oauth_delay = oauth_delay
+        self.stk_delay = stk_delay
+        self.oauth_status = 200
+        self.oauth_requests = 0
+        self.stk_requests = 0
+        self.lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def reset(self):
+        with self.lock:
+            self.oauth_requests = 0
+            self.stk_requests = 0
+
+    def start(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _DarajaHandler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -1,3 +1,318 @@
-from django.test import TestCase
+import asyncio
+import threading
+import time
+from datetime import timedelta
+from django.db import OperationalError, connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from orders.models import Order
+from .callbacks import process_callback
+from .inbox import claim_batch, process_inbox, requeue
+from .models import CallbackInboxEntry, CallbackLedgerEntry
+from .services import AsyncMpesaService, MpesaService, token_cache
+from .testing import FakeDarajaServer
+from .transport import get_timeout
 
-# Create your tests here.
+
+class AccessTokenCacheTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.fake = FakeDarajaServer().start()
+        cls.addClassCleanup(cls.fake.stop)
+
+    def setUp(self):
+        self.fake.reset()
+        self.fake.expires_in = 3599
+        self.fake.oauth_delay = 0
+        self.fake.oauth_status = 200
+        token_cache.clear()
+        settings_override = override_settings(
+            MPESA_BASE_URL=self.fake.url,
+            MPESA_CONSUMER_KEY='key',
+            MPESA_CONSUMER_SECRET='secret',
+            MPESA_TOKEN_REFRESH_MARGIN=60,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_token_is_reused_until_expiry(self):
+        tokens = {MpesaService().get_access_token() for _ in range(5)}
+
+        self.assertEqual(tokens, {'fake-token-1'})
+        self.assertEqual(self.fake.oauth_requests, 1)
+        self.assertEqual(token_cache.stats()['hits'], 4)
+        self.assertEqual(token_cache.stats()['refreshes'], 1)
+
+    def test_token_within_refresh_margin_is_refreshed(self):
+        self.fake.expires_in = 30  # Already inside the 60s margin
+
+        MpesaService().get_access_token()
+        token = MpesaService().get_access_token()
+
+        self.assertEqual(token, 'fake-token-2')
+        self.assertEqual(self.fake.oauth_requests, 2)
+
+    def test_concurrent_callers_share_one_refresh(self):
+        self.fake.oauth_delay = 0.2
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(MpesaService().get_access_token()))
+            for _ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ['fake-token-1'] * 10)
+        self.assertEqual(self.fake.oauth_requests, 1)
+        self.assertEqual(token_cache.stats()['refreshes'], 1)
+
+    def test_failed_refresh_is_not_cached(self):
+        self.fake.oauth_status = 400
+        self.assertIsNone(MpesaService().get_access_token())
+
+        self.fake.oauth_status = 200
+        self.assertEqual(MpesaService().get_access_token(), 'fake-token-2')
+
+    def test_stk_push_reuses_cached_token(self):
+        for order_id in range(3):
+            response = MpesaService().stk_push('0712345678', 100, order_id)
+            self.assertEqual(response['ResponseCode'], '0')
+
+        self.assertEqual(self.fake.oauth_requests, 1)
+        self.assertEqual(self.fake.stk_requests, 3)
+
+    async def test_async_callers_share_one_refresh(self):
+        self.fake.oauth_delay = 0.2
+        tokens = await asyncio.gather(*[AsyncMpesaService().aget_access_token() for _ in range(10)])
+
+        self.assertEqual(set(tokens), {'fake-token-1'})
+        self.assertEqual(self.fake.oauth_requests, 1)
+
+    async def test_async_stk_push_shares_token_with_sync_client(self):
+        MpesaService().get_access_token()
+
+        responses = await asyncio.gather(*[
+            AsyncMpesaService().astk_push('0712345678', 100, order_id) for order_id in range(5)
+        ])
+
+        self.assertEqual({r['ResponseCode'] for r in responses}, {'0'})
+        self.assertEqual(self.fake.oauth_requests, 1)
+        self.assertEqual(self.fake.stk_requests, 5)
+
+
+class TransportTests(SimpleTestCase):
+    def test_idempotent_calls_are_retried_on_gateway_errors(self):
+        with FakeDarajaServer() as fake:
+            fake.oauth_status = 503
+            token_cache.clear()
+            with override_settings(MPESA_BASE_URL=fake.url, MPESA_HTTP_MAX_RETRIES=2,
+                                   MPESA_HTTP_BACKOFF=0):
+                self.assertIsNone(MpesaService().get_access_token())
+            self.assertEqual(fake.oauth_requests, 3)
+
+    def test_timeouts_are_per_endpoint(self):
+        with override_settings(MPESA_HTTP_TIMEOUTS={'default': (1, 2), 'oauth': (3, 4)}):
+            self.assertEqual(get_timeout('oauth'), (3, 4))
+            self.assertEqual(get_timeout('stk_push'), (1, 2))
+
+
+def stk_callback(checkout_request_id, result_code, receipt='QK123'):
+    return {'Body': {'stkCallback': {
+        'MerchantRequestID': 'merchant-1',
+        'CheckoutRequestID': checkout_request_id,
+        'ResultCode': result_code,
+        'ResultDesc': 'Processed',
+        'CallbackMetadata': {'Item': [{'Name': 'MpesaReceiptNumber', 'Value': receipt}]},
+    }}}
+
+
+class CallbackLedgerTests(TestCase):
+    def setUp(self):
+        self.order = Order.objects.create(total=100, payment_method='M-Pesa', checkout_request_id='ws_CO_1')
+
+    def test_duplicate_callback_is_recorded_once(self):
+        self.assertIsNotNone(process_callback(stk_callback('ws_CO_1', 0)))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertIsNone(process_callback(stk_callback('ws_CO_1', 0, receipt='QK999')))
+        self.assertFalse([query for query in queries if 'orders_order' in query['sql']])
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.transaction_id, 'QK123')
+        self.assertEqual(CallbackLedgerEntry.objects.count(), 1)
+
+    def test_late_failure_does_not_overwrite_paid_order(self):
+        process_callback(stk_callback('ws_CO_1', 0))
+
+        self.assertIsNone(process_callback(stk_callback('ws_CO_1', 1032)))
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'paid')
+        self.assertEqual(CallbackLedgerEntry.objects.count(), 2)
+
+    def test_payment_after_timeout_is_still_recorded(self):
+        process_callback(stk_callback('ws_CO_1', 1037))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'timeout')
+
+        process_callback(stk_callback('ws_CO_1', 0))
+
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.transaction_id), ('paid', 'QK123'))
+
+    def test_callback_without_its_order_is_not_recorded(self):
+        with self.assertRaises(Order.DoesNotExist):
+            process_callback(stk_callback('ws_CO_2', 0))
+        self.assertFalse(CallbackLedgerEntry.objects.exists())
+
+        Order.objects.create(total=100, payment_method='M-Pesa', checkout_request_id='ws_CO_2')
+        order = process_callback(stk_callback('ws_CO_2', 0))
+
+        self.assertEqual((order.status, order.transaction_id), ('paid', 'QK123'))
+
+    def test_status_is_published_once_committed(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            process_callback(stk_callback('ws_CO_1', 0))
+        self.assertEqual(len(callbacks), 1)
+
+    def test_malformed_callback_is_rejected(self):
+        with self.assertRaises(ValueError):
+            process_callback({'Body': {}})
+        self.assertFalse(CallbackLedgerEntry.objects.exists())
+
+
+class ConcurrentCallbackTests(TransactionTestCase):
+    def test_simultaneous_deliveries_apply_once(self):
+        order = Order.objects.create(total=100, payment_method='M-Pesa', checkout_request_id='ws_CO_1')
+        barrier = threading.Barrier(8)
+        results = []
+
+        def deliver():
+            try:
+                barrier.wait()
+                while True:
+                    try:
+                        results.append(process_callback(stk_callback('ws_CO_1', 0)))
+                        break
+                    except OperationalError:
+                        # SQLite's shared in-memory test database reports a
+                        # locked table at once instead of waiting for it
+                        time.sleep(0.01)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=deliver) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), 8)
+        self.assertEqual(sum(result is not None for result in results), 1)
+        self.assertEqual(CallbackLedgerEntry.objects.count(), 1)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'paid')
+
+
+@override_settings(CALLBACK_WORKERS=0)
+class CallbackInboxTests(TestCase):
+    def setUp(self):
+        self.order = Order.objects.create(total=100, payment_method='M-Pesa', checkout_request_id='ws_CO_1')
+
+    def post(self, body):
+        return self.client.post(reverse('mpesa:callback'), body, content_type='application/json')
+
+    def test_callback_is_acknowledged_before_it_is_applied(self):
+        with self.assertNumQueries(1):
+            response = self.post(stk_callback('ws_CO_1', 0))
+
+        self.assertEqual(response.json()['ResultCode'], 0)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'pending')
+
+        self.assertEqual(process_inbox(), 1)
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'paid')
+        self.assertEqual(CallbackInboxEntry.objects.get().status, 'done')
+
+    def test_invalid_json_is_rejected_without_storing(self):
+        response = self.client.post(reverse('mpesa:callback'), '{not json', content_type='application/json')
+
+        self.assertEqual(response.json()['ResultCode'], 1)
+        self.assertFalse(CallbackInboxEntry.objects.exists())
+
+    def test_unexpected_body_is_marked_failed(self):
+        self.post({'Body': {}})
+        self.post(stk_callback('ws_CO_1', 0))
+
+        self.assertEqual(process_inbox(), 2)
+
+        failed = CallbackInboxEntry.objects.get(status='failed')
+        self.assertEqual(failed.error, 'Not an STK push callback')
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'paid')
+
+    def test_batches_are_claimed_once(self):
+        for _ in range(3):
+            self.post(stk_callback('ws_CO_1', 0))
+
+        first = claim_batch(2)
+
+        self.assertEqual(len(first), 2)
+        self.assertEqual([entry.pk for entry in claim_batch(5)], [CallbackInboxEntry.objects.last().pk])
+        self.assertEqual(claim_batch(5), [])
+
+    @override_settings(CALLBACK_CLAIM_TIMEOUT=60)
+    def test_abandoned_claims_are_retried(self):
+        self.post(stk_callback('ws_CO_1', 0))
+        claim_batch(1)
+        CallbackInboxEntry.objects.update(claimed_at=timezone.now() - timedelta(minutes=5))
+
+        self.assertEqual(process_inbox(), 1)
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'paid')
+
+    @override_settings(CALLBACK_RETRY_DELAY=30)
+    def test_callback_before_its_order_is_retried(self):
+        self.post(stk_callback('ws_CO_2', 0))
+
+        self.assertEqual(process_inbox(), 1)
+
+        entry = CallbackInboxEntry.objects.get()
+        self.assertEqual((entry.status, entry.attempts), ('queued', 1))
+        self.assertAlmostEqual(entry.retry_at, timezone.now() + timedelta(seconds=30), delta=timedelta(seconds=5))
+        self.assertFalse(CallbackLedgerEntry.objects.exists())
+        self.assertEqual(process_inbox(), 0)
+
+        order = Order.objects.create(total=100, payment_method='M-Pesa', checkout_request_id='ws_CO_2')
+        CallbackInboxEntry.objects.update(retry_at=timezone.now())
+        self.assertEqual(process_inbox(), 1)
+
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'paid')
+        self.assertEqual(CallbackInboxEntry.objects.get().status, 'done')
+
+    @override_settings(CALLBACK_MAX_ATTEMPTS=2)
+    def test_entry_fails_once_attempts_run_out(self):
+        self.post(stk_callback('ws_CO_2', 0))
+
+        process_inbox()
+        CallbackInboxEntry.objects.update(retry_at=timezone.now())
+        process_inbox()
+
+        entry = CallbackInboxEntry.objects.get()
+        self.assertEqual((entry.status, entry.attempts), ('failed', 2))
+        self.assertIn('ws_CO_2', entry.error)
+
+        Order.objects.create(total=100, payment_method='M-Pesa', checkout_request_id='ws_CO_2')
+        self.assertEqual(requeue(CallbackInboxEntry.objects.all()), 1)
+        self.assertEqual(process_inbox(), 1)
+
+        self.assertEqual(CallbackInboxEntry.objects.get().status, 'done')
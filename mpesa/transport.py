@@ -0,0 +1,106 @@
+"""Shared, connection-pooled HTTP transport for Daraja calls"""
+import asyncio
+import threading
+import weakref
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+try:
+    import httpx
+except ImportError:  # Only the async client needs it
+    httpx = None
+
+_session = None
+_session_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+
+# Gateway errors worth retrying; anything else is returned to the caller
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def build_session():
+    """Create a keep-alive session sized and configured from settings"""
+    # Only idempotent methods are retried after the request was sent.
+    # Connection errors happen before anything reaches Daraja, so urllib3
+    # retries those for every method, including the STK push POST.
+    retry = Retry(
+        total=settings.MPESA_HTTP_MAX_RETRIES,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({'GET', 'HEAD'}),
+        backoff_factor=settings.MPESA_HTTP_BACKOFF,
+        backoff_jitter=settings.MPESA_HTTP_BACKOFF,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=settings.MPESA_HTTP_POOL_SIZE,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    """Return the process-wide Daraja session, creating it on first use"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = build_session()
+    return _session
+
+
+def reset_session():
+    """Close the shared session so the next call builds a fresh pool"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def get_timeout(endpoint):
+    """Return the (connect, read) timeout configured for an endpoint"""
+    timeouts = settings.MPESA_HTTP_TIMEOUTS
+    return tuple(timeouts.get(endpoint, timeouts['default']))
+
+
+def get_async_client():
+    """Return the keep-alive httpx client for the running event loop"""
+    if httpx is None:
+        raise ImproperlyConfigured("The async M-Pesa client requires the httpx package")
+
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        # httpx only retries failed connection attempts, never a sent request
+        transport = httpx.AsyncHTTPTransport(
+            retries=settings.MPESA_HTTP_MAX_RETRIES,
+            limits=httpx.Limits(
+                max_connections=settings.MPESA_ASYNC_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.MPESA_ASYNC_MAX_CONNECTIONS,
+            ),
+        )
+        client = _async_clients[loop] = httpx.AsyncClient(transport=transport)
+    return client
+
+
+def get_async_timeout(endpoint):
+    """Return the httpx timeout configured for an endpoint"""
+    connect, read = get_timeout(endpoint)
+    return httpx.Timeout(read, connect=connect)
+
+
+@receiver(setting_changed)
+def _reset_on_setting_change(setting, **kwargs):
+    if setting.startswith('MPESA_HTTP_') or setting == 'MPESA_BASE_URL':
+        reset_session()
+        # Clients are rebuilt lazily on each loop's next call
+        _async_clients.clear()
@@ -0,0 +1,67 @@
+"""Helpers shared by the benchmark and load-test management commands"""
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+from django.db import connections
+from django.test.utils import (
+    setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+)
+
+
+@contextmanager
+def benchmark_database(verbosity=0):
+    """Run the block against a throwaway, freshly migrated database
+
+    SQLite gets a temporary file instead of the shared in-memory test
+    database so that worker threads can write to it concurrently.
+    """
+    tmpdir = None
+    settings_dict = connections['default'].settings_dict
+    if settings_dict['ENGINE'].endswith('sqlite3'):
+        tmpdir = tempfile.mkdtemp(prefix='myshop-benchmark-')
+        settings_dict['TEST']['NAME'] = os.path.join(tmpdir, 'benchmark.sqlite3')
+
+    setup_test_environment()
+    old_config = setup_databases(verbosity, interactive=False, aliases={'default'})
+    try:
+        yield connections['default']
+    finally:
+        teardown_databases(old_config, verbosity)
+        teardown_test_environment()
+        if tmpdir:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def summarize(timings_ms):
+    """Return mean/p50/p95/max of a list of millisecond timings as text"""
+    if not timings_ms:
+        return 'no samples'
+    ordered = sorted(timings_ms)
+    return (
+        f'mean {statistics.mean(ordered):8.2f} ms  '
+        f'p50 {ordered[len(ordered) // 2]:8.2f} ms  '
+        f'p95 {ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]:8.2f} ms  '
+        f'max {ordered[-1]:8.2f} ms'
+    )
+
+
+def time_requests(client, url, count, **headers):
+    """GET url count times; returns (last response, timings in ms)"""
+    timings, response = [], None
+    for _ in range(count):
+        started = time.perf_counter()
+        response = client.get(url, headers=headers)
+        timings.append((time.perf_counter() - started) * 1000)
+    return response, timings
+
+
+def wire_size(response):
+    """Bytes a response puts on the wire: status line, headers and body"""
+    head = f'HTTP/1.1 {response.status_code} {response.reason_phrase}\r\n'
+    head += ''.join(f'{name}: {value}\r\n' for name, value in response.items())
+    for cookie in response.cookies.values():
+        head += f'Set-Cookie: {cookie.OutputString()}\r\n'
+    return len(head.encode()) + 2 + len(response.content)
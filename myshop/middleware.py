@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+
+COMPRESSIBLE_TYPES = {'text/html', 'application/json', 'text/plain', 'text/css', 'application/javascript'}
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """GZipMiddleware limited to sizeable text responses
+
+    Small bodies do not win back the CPU time and the gzip header, and
+    streamed responses (payment status events, static files, which come
+    precompressed) are left alone. Django's GZipMiddleware already pads
+    compressed bodies against BREACH.
+    """
+
+    def process_response(self, request, response):
+        content_type = response.get('Content-Type', '').split(';')[0].strip()
+        if response.streaming or content_type not in COMPRESSIBLE_TYPES:
+            return response
+        if len(response.content) < settings.GZIP_MIN_LENGTH:
+            return response
+        return super().process_response(request, response)
@@ -0,0 +1,75 @@
+"""Serve the collected static bundle from STATIC_ROOT with long-lived caching
+
+Used when SERVE_STATIC is on, i.e. when no front-end server or CDN sits in
+front of Django. Content-hashed names (cake.3f2a9c81d0b4.css) never change
+their bytes, so they are cacheable for a year; the .br/.gz variants written
+by `manage.py build_static` are sent to clients that accept them.
+"""
+import mimetypes
+import re
+from pathlib import Path
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.urls import re_path
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.\w+$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+# Preferred first
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+def accepted_encodings(header):
+    """Content codings an Accept-Encoding header allows (q > 0)"""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        name, _, value = params.partition('=')
+        try:
+            if name.strip() == 'q' and float(value) <= 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+@require_safe
+def serve(request, path):
+    try:
+        fullpath = Path(safe_join(settings.STATIC_ROOT, path))
+    except SuspiciousFileOperation:
+        raise Http404('Invalid path')
+    if not fullpath.is_file():
+        raise Http404(f'"{path}" does not exist')
+
+    content_type, _ = mimetypes.guess_type(fullpath.name)
+    encoding = None
+    accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+    for coding, suffix in ENCODINGS:
+        variant = fullpath.with_name(fullpath.name + suffix)
+        if coding in accepted and variant.is_file():
+            fullpath, encoding = variant, coding
+            break
+
+    stat = fullpath.stat()
+    since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    if since is not None and int(stat.st_mtime) <= since:
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(fullpath.open('rb'), content_type=content_type or 'application/octet-stream')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.headers['Last-Modified'] = http_date(stat.st_mtime)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = IMMUTABLE if HASHED_NAME.search(path) else 'public, max-age=300'
+    return response
+
+
+def static_urlpatterns():
+    prefix = settings.STATIC_URL.lstrip('/')
+    return [re_path(rf'^{re.escape(prefix)}(?P<path>.*)$', serve)]
@@ -0,0 +1,17 @@
+"""Static files storage for the content-hashed bundle in STATIC_ROOT"""
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+
+class StaticStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage that falls back to plain names until collectstatic ran
+
+    Development and test runs then serve the unhashed files from
+    STATICFILES_DIRS instead of failing on the missing manifest.
+    """
+
+    manifest_strict = False
+
+    def stored_name(self, name):
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
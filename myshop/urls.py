@@ -2,8 +2,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
-
-from myshop.orders import views
+from myshop.static import static_urlpatterns
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -12,9 +11,10 @@ urlpatterns = [
     path('cart/', include('cart.urls')),
     path('checkout/', include('orders.urls')),
     path('mpesa/', include('mpesa.urls')),
-    path('checkout/retry-payment/<int:order_id>/', views.retry_payment, name='retry_payment'),
-    path('mpesa/', include('mpesa.urls')),  # Use mpesa (correct spelling)
 ]
 
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+
+if settings.SERVE_STATIC:
+    urlpatterns += static_urlpatterns()
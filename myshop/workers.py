@@ -0,0 +1,106 @@
+"""In-process background worker threads for DB-backed queues"""
+import logging
+import os
+import sys
+import threading
+import time
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+MANAGE_SCRIPTS = {'manage.py', 'django-admin', 'django-admin.py', '__main__.py'}
+
+
+def serves_requests(argv=None):
+    """True in a web server process, where in-process pools start at boot
+
+    Management commands (tests, migrations, the run_*_workers commands)
+    start no pools. Under runserver's autoreloader only the child process
+    that serves requests does.
+    """
+    argv = sys.argv if argv is None else argv
+    if not argv or os.path.basename(argv[0]) not in MANAGE_SCRIPTS:
+        return True  # gunicorn, uvicorn, daphne...
+    if len(argv) < 2 or argv[1] != 'runserver':
+        return False
+    return '--noreload' in argv or os.environ.get('RUN_MAIN') == 'true'
+
+
+class WorkerPool:
+    """Daemon threads that repeatedly call a batch handler
+
+    ``handler()`` processes some queued work and returns how many items it
+    handled. When it returns 0 the thread sleeps for ``idle_interval``
+    seconds or until ``wake()`` is called.
+    """
+
+    def __init__(self, name, handler, threads=1, idle_interval=1.0):
+        self.name = name
+        self.handler = handler
+        self.threads = threads
+        self.idle_interval = idle_interval
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = []
+        self.processed = 0
+        self.busy_seconds = 0.0
+        self.started_at = None
+
+    @property
+    def running(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return self
+            self._stopping.clear()
+            self.started_at = time.monotonic()
+            self._threads = [
+                threading.Thread(target=self._run, name=f'{self.name}-{i}', daemon=True)
+                for i in range(self.threads)
+            ]
+            for thread in self._threads:
+                thread.start()
+        return self
+
+    def wake(self):
+        self._wakeup.set()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def stats(self):
+        """Return processed count and the share of thread time spent working"""
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0
+        capacity = elapsed * max(self.threads, 1)
+        return {
+            'threads': self.threads,
+            'processed': self.processed,
+            'busy_seconds': round(self.busy_seconds, 3),
+            'occupancy': round(self.busy_seconds / capacity, 3) if capacity else 0.0,
+        }
+
+    def _run(self):
+        while not self._stopping.is_set():
+            started = time.monotonic()
+            try:
+                processed = self.handler()
+            except Exception:
+                logger.exception(f"Error in {self.name} worker")
+                processed = 0
+            finally:
+                close_old_connections()
+
+            if processed:
+                with self._lock:
+                    self.processed += processed
+                    self.busy_seconds += time.monotonic() - started
+            else:
+                self._wakeup.wait(self.idle_interval)
+                self._wakeup.clear()
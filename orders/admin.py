@@ -1,18 +1,42 @@
 from django.contrib import admin
-from .models import Order, OrderItem
+from django.db.models import Count
+from .models import County, Order, OrderItem, PaymentRequest, PickupStation
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     readonly_fields = ['product_name', 'unit_price', 'quantity', 'total_price']
     extra = 0
 
+class PaymentRequestInline(admin.TabularInline):
+    model = PaymentRequest
+    readonly_fields = ['status', 'attempts', 'error', 'created_at', 'started_at', 'finished_at']
+    extra = 0
+    can_delete = False
+
+class PaymentWindowFilter(admin.SimpleListFilter):
+    """Pending orders by whether their payment window is still open"""
+    title = 'payment window'
+    parameter_name = 'payment_window'
+    
+    def lookups(self, request, model_admin):
+        return [('open', 'Awaiting payment'), ('expired', 'Expired')]
+    
+    def queryset(self, request, queryset):
+        if self.value() == 'open':
+            return queryset.awaiting_payment()
+        if self.value() == 'expired':
+            return queryset.expired()
+        return queryset
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ['id', 'first_name', 'last_name', 'phone', 'total', 'status', 'payment_method', 'created_at']
-    list_filter = ['status', 'payment_method', 'county', 'created_at']
+    list_display = [
+        'id', 'first_name', 'last_name', 'phone', 'total', 'status', 'payment_method', 'payment_deadline', 'created_at',
+    ]
+    list_filter = ['status', PaymentWindowFilter, 'payment_method', 'county', 'created_at']
     search_fields = ['first_name', 'last_name', 'phone', 'email', 'transaction_id']
     readonly_fields = ['created_at', 'updated_at']
-    inlines = [OrderItemInline]
+    inlines = [OrderItemInline, PaymentRequestInline]
     
     actions = ['mark_as_paid', 'mark_as_fulfilled']
     
@@ -28,4 +52,23 @@ class OrderAdmin(admin.ModelAdmin):
 class OrderItemAdmin(admin.ModelAdmin):
     list_display = ['order', 'product_name', 'quantity', 'unit_price', 'total_price']
     list_filter = ['order__status']
-    search_fields = ['product_name', 'order__id']
\ No newline at end of file
+    search_fields = ['product_name', 'order__id']
+
+class PickupStationInline(admin.TabularInline):
+    model = PickupStation
+    extra = 1
+
+@admin.register(County)
+class CountyAdmin(admin.ModelAdmin):
+    list_display = ['name', 'is_active', 'station_count']
+    list_filter = ['is_active']
+    search_fields = ['name', 'stations__name']
+    inlines = [PickupStationInline]
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(station_count=Count('stations'))
+    
+    def station_count(self, obj):
+        return obj.station_count
+    station_count.short_description = "Stations"
+    station_count.admin_order_field = 'station_count'
@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class OrdersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'orders'
+
+    def ready(self):
+        from django.conf import settings
+        from myshop.workers import serves_requests
+        from . import stations  # noqa: F401  Connects the invalidation signals
+        
+        # Start at boot, so pushes queued before a restart are sent without
+        # waiting for the next checkout to wake the workers
+        if settings.PAYMENT_WORKERS > 0 and serves_requests():
+            from .payments import get_worker_pool
+            get_worker_pool()
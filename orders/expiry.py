@@ -0,0 +1,41 @@
+"""Set-based expiry of payments that were never completed
+
+A sweep moves pending orders whose payment window has passed to
+timeout with one UPDATE per chunk of at most batch_size rows. Each order's
+deadline is compared with the database's own clock (Order.objects.expired()),
+and the (status, payment_deadline) index finds the rows.
+
+Swept orders are not published to the status hub: sweeps usually run in
+their own process, and open status streams re-read the order every
+PAYMENT_STATUS_STREAM_RECHECK seconds. Their cached status snapshots are
+dropped once each chunk commits, so polls re-read them too.
+"""
+import time
+from collections import namedtuple
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import Order
+from .notifications import forget_snapshots
+
+SweepResult = namedtuple('SweepResult', ['expired', 'batches', 'seconds'])
+
+
+def sweep_expired_payments(batch_size=None):
+    """Move every expired payment to timeout, batch_size rows per chunk"""
+    batch_size = batch_size or settings.PAYMENT_EXPIRY_BATCH_SIZE
+    started = time.monotonic()
+    expired = batches = 0
+    while True:
+        pks = list(Order.objects.expired().order_by('payment_deadline').values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            break
+        # The UPDATE repeats the expired filter, so a row a callback marked
+        # paid since the SELECT is left alone
+        count = Order.objects.expired().filter(pk__in=pks).update(status='timeout', updated_at=timezone.now())
+        transaction.on_commit(lambda pks=pks: forget_snapshots(pks))
+        expired += count
+        batches += 1
+        if len(pks) < batch_size:
+            break
+    return SweepResult(expired, batches, time.monotonic() - started)
@@ -0,0 +1,88 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from mpesa.services import token_cache
+from mpesa.testing import FakeDarajaServer
+from myshop.benchmarking import benchmark_database
+from myshop.workers import WorkerPool
+from orders.models import Order, PaymentRequest
+from orders.payments import aprocess_pending, process_pending
+
+
+class Command(BaseCommand):
+    help = 'Compare WSGI-style threads with ASGI/async for status polls and STK pushes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--polls', type=int, default=2000)
+        parser.add_argument('--pushes', type=int, default=200)
+        parser.add_argument('--threads', type=int, default=8,
+                            help='WSGI worker threads / sync payment workers')
+        parser.add_argument('--concurrency', type=int, default=200,
+                            help='In-flight requests for the async runs')
+        parser.add_argument('--gateway-delay', type=float, default=0.5)
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            order = Order.objects.create(total=100, payment_method='M-Pesa', phone='0712345678')
+            url = f'/checkout/payment-status/{order.id}/'
+
+            self.report('status polls, WSGI threads', options['polls'], self.wsgi_polls(url, options))
+            self.report('status polls, ASGI', options['polls'], asyncio.run(self.asgi_polls(url, options)))
+
+            with FakeDarajaServer(stk_delay=options['gateway_delay']) as fake:
+                with override_settings(MPESA_BASE_URL=fake.url, PAYMENT_WORKERS=0):
+                    self.queue_pushes(options['pushes'])
+                    self.report('STK pushes, thread pool', options['pushes'], self.sync_pushes(options))
+                    self.queue_pushes(options['pushes'])
+                    self.report('STK pushes, async', options['pushes'], self.async_pushes(options))
+
+    def report(self, label, count, elapsed):
+        self.stdout.write(f'{label:<28} {count / elapsed:9.1f} /s  ({count} in {elapsed:.2f} s)')
+
+    def wsgi_polls(self, url, options):
+        def poll(_):
+            Client().get(url)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+            list(executor.map(poll, range(options['polls'])))
+        return time.perf_counter() - started
+
+    async def asgi_polls(self, url, options):
+        client = AsyncClient()
+        slots = asyncio.Semaphore(options['concurrency'])
+
+        async def poll():
+            async with slots:
+                await client.get(url)
+
+        started = time.perf_counter()
+        await asyncio.gather(*[poll() for _ in range(options['polls'])])
+        return time.perf_counter() - started
+
+    def queue_pushes(self, count):
+        PaymentRequest.objects.all().delete()
+        token_cache.clear()
+        orders = Order.objects.bulk_create([
+            Order(total=100, payment_method='M-Pesa', phone='0712345678') for _ in range(count)
+        ])
+        PaymentRequest.objects.bulk_create([PaymentRequest(order=order) for order in orders])
+
+    def sync_pushes(self, options):
+        pool = WorkerPool('benchmark-payment', lambda: process_pending(limit=1),
+                          threads=options['threads'], idle_interval=0.05)
+        started = time.perf_counter()
+        pool.start()
+        while PaymentRequest.objects.exclude(status__in=['sent', 'failed']).exists():
+            time.sleep(0.05)
+        elapsed = time.perf_counter() - started
+        pool.stop()
+        return elapsed
+
+    def async_pushes(self, options):
+        started = time.perf_counter()
+        asyncio.run(aprocess_pending(concurrency=options['concurrency']))
+        return time.perf_counter() - started
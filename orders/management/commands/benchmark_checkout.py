@@ -0,0 +1,45 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from myshop.benchmarking import benchmark_database, summarize
+from products.testing import make_catalog
+
+CHECKOUT_FORM = {
+    'first_name': 'Bench',
+    'last_name': 'Mark',
+    'phone': '0712345678',
+    'email': 'bench@example.com',
+    'county': 'Nairobi',
+    'pickup_station': 'Westgate Mall',
+    'payment_method': 'M-Pesa',
+}
+
+
+class Command(BaseCommand):
+    help = 'Benchmark checkout latency by cart size (set DATABASE_URL to test PostgreSQL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, nargs='+', default=[1, 10, 50])
+        parser.add_argument('--iterations', type=int, default=50)
+
+    def handle(self, *args, **options):
+        with benchmark_database() as db, override_settings(PAYMENT_WORKERS=0):
+            self.stdout.write(f'Database: {db.vendor}')
+            products = make_catalog(products=max(options['lines']))
+
+            for lines in options['lines']:
+                client = Client()
+                for product in products[:lines]:
+                    client.post('/cart/add/', {'product_id': product.id, 'size': 'small'})
+
+                # M-Pesa checkouts leave the cart in place, so it can be reused
+                timings = []
+                for _ in range(options['iterations']):
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        client.post('/checkout/', CHECKOUT_FORM)
+                        timings.append((time.perf_counter() - started) * 1000)
+
+                self.stdout.write(f'{lines:3d} lines  {summarize(timings)}  {len(queries)} queries')
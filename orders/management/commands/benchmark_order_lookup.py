@@ -0,0 +1,64 @@
+import random
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from myshop.benchmarking import benchmark_database, summarize
+from orders.expiry import sweep_expired_payments
+from orders.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Benchmark callback order lookups and expiry filters on a large orders table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1_000_000)
+        parser.add_argument('--lookups', type=int, default=200)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        with benchmark_database() as db:
+            self.stdout.write(f"Database: {db.vendor}, {options['orders']} orders")
+            started = time.perf_counter()
+            self.create_orders(options['orders'], options['batch_size'])
+            self.stdout.write(f'Created orders in {time.perf_counter() - started:.1f} s')
+
+            ids = random.sample(range(options['orders']), min(options['lookups'], options['orders']))
+            self.run('by CheckoutRequestID', ids,
+                     lambda i: Order.objects.by_checkout_request_id(f'ws_CO_{i}').get())
+            self.run('by MerchantRequestID', ids,
+                     lambda i: Order.objects.by_merchant_request_id(f'merchant-{i}').get())
+            # Without the partial index condition, as the callback used to query
+            self.run('unindexed filter', ids[:20],
+                     lambda i: Order.objects.filter(checkout_request_id=f'ws_CO_{i}').get())
+            self.run('expired pending', ids[:20], lambda i: Order.objects.expired().count())
+
+            # Settled history is left alone; only the pending slice past its window is swept
+            result = sweep_expired_payments()
+            self.stdout.write(f'{"expiry sweep":<22} {result.expired} orders in {result.batches} batches, '
+                              f'{result.seconds * 1000:.1f} ms')
+
+    def create_orders(self, count, batch_size):
+        now = timezone.now()
+        for start in range(0, count, batch_size):
+            Order.objects.bulk_create([
+                Order(
+                    first_name='Bench', last_name='Mark', phone='0712345678', email='bench@example.com',
+                    county='Nairobi', pickup_station='Westgate Mall', payment_method='M-Pesa', total=1000,
+                    # Mostly settled history with a thin slice of pending orders
+                    status='pending' if i % 100 == 0 else 'paid',
+                    checkout_request_id=f'ws_CO_{i}',
+                    merchant_request_id=f'merchant-{i}',
+                    payment_initiated_at=now - timedelta(seconds=i % 86400),
+                    payment_deadline=now - timedelta(seconds=i % 86400 - 120),
+                )
+                for i in range(start, min(start + batch_size, count))
+            ])
+
+    def run(self, label, ids, lookup):
+        timings = []
+        for i in ids:
+            started = time.perf_counter()
+            lookup(i)
+            timings.append((time.perf_counter() - started) * 1000)
+        self.stdout.write(f'{label:<22} {summarize(timings)}')
@@ -0,0 +1,52 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from cart.cart import Cart
+from myshop.benchmarking import benchmark_database, summarize
+from orders.pricing import price_cart
+from products.cache import catalog
+from products.testing import make_catalog
+
+
+class Command(BaseCommand):
+    help = 'Benchmark checkout repricing for large carts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=100)
+        parser.add_argument('--iterations', type=int, default=50)
+
+    def handle(self, *args, **options):
+        with benchmark_database(), override_settings(PAYMENT_WORKERS=0):
+            client = Client()
+            for product in make_catalog(products=options['lines']):
+                client.post('/cart/add/', {
+                    'product_id': product.id, 'size': 'medium', 'icing': 'fondant', 'eggs': 'eggless',
+                })
+            request = client.get('/cart/').wsgi_request
+            self.stdout.write(f"{options['lines']}-line cart")
+
+            def cold():
+                catalog.bump()
+                price_cart(Cart(request))
+
+            self.run('cold catalog', options, cold)
+            self.run('warm catalog', options, lambda: price_cart(Cart(request), use_cache=False))
+            self.run('cached priced cart', options, lambda: price_cart(Cart(request)))
+
+            form = {
+                'first_name': 'Bench', 'last_name': 'Mark', 'phone': '0712345678', 'email': 'bench@example.com',
+                'county': 'Nairobi', 'pickup_station': 'Westgate Mall', 'payment_method': 'M-Pesa',
+            }
+            self.run('checkout POST', options, lambda: client.post('/checkout/', form))
+
+    def run(self, label, options, call):
+        call()
+        timings = []
+        for _ in range(options['iterations']):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                call()
+                timings.append((time.perf_counter() - started) * 1000)
+        self.stdout.write(f'{label:<20} {summarize(timings)}  {len(queries)} queries')
@@ -0,0 +1,40 @@
+import time
+from django.core.cache import caches
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+from myshop.benchmarking import benchmark_database, summarize
+from orders.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Measure payment status polls per second for one worker, with and without the snapshot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--polls', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            order = Order(total=100, payment_method='M-Pesa', checkout_request_id='ws_CO_1')
+            order.start_payment_window()
+            order.save()
+            url = reverse('orders:payment_status', args=[order.id])
+            cache = caches[settings.ORDER_STATUS_CACHE_ALIAS]
+            client = Client()
+            etag = client.get(url)['ETag']
+
+            # Every poll rebuilds the snapshot from the order row, as before
+            self.run('uncached', options['polls'], lambda: (cache.clear(), client.get(url)))
+            self.run('snapshot', options['polls'], lambda: client.get(url))
+            self.run('if-none-match', options['polls'], lambda: client.get(url, headers={'if-none-match': etag}))
+
+    def run(self, label, polls, poll):
+        timings = []
+        started = time.perf_counter()
+        for _ in range(polls):
+            poll_started = time.perf_counter()
+            poll()
+            timings.append((time.perf_counter() - poll_started) * 1000)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'{label:<14} {polls / elapsed:8.1f} polls/s  {summarize(timings)}')
@@ -1,27 +1,38 @@
+import time
+from django.conf import settings
 from django.core.management.base import BaseCommand
-from django.utils import timezone
-from orders.models import Order
+from django.db import close_old_connections
+from orders.expiry import sweep_expired_payments
 
 class Command(BaseCommand):
-    help = 'Clean up expired M-Pesa payments'
+    help = 'Mark M-Pesa payments whose payment window has passed as timed out'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.PAYMENT_EXPIRY_BATCH_SIZE,
+                            help='Most orders updated by one statement')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep sweeping every INTERVAL seconds instead of once')
     
     def handle(self, *args, **options):
-        expired_orders = Order.objects.filter(
-            payment_method='M-Pesa',
-            status='pending',
-            payment_initiated_at__isnull=False
-        )
-        
-        count = 0
-        for order in expired_orders:
-            if order.is_payment_expired():
-                order.status = 'timeout'
-                order.save()
-                count += 1
-                self.stdout.write(
-                    self.style.WARNING(f'Marked order {order.id} as timeout')
-                )
+        interval = options['interval']
+        if not interval:
+            self.sweep(options['batch_size'])
+            return
         
-        self.stdout.write(
-            self.style.SUCCESS(f'Cleaned up {count} expired payments')
-        )
\ No newline at end of file
+        self.stdout.write(f"Sweeping expired payments every {interval:g} s")
+        next_run = time.monotonic()
+        try:
+            while True:
+                self.sweep(options['batch_size'])
+                close_old_connections()
+                # Keep to the schedule however long the sweep took
+                next_run = max(next_run + interval, time.monotonic())
+                time.sleep(next_run - time.monotonic())
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.SUCCESS("Stopped expiry sweeper"))
+    
+    def sweep(self, batch_size):
+        result = sweep_expired_payments(batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f'Expired {result.expired} payments in {result.batches} batches, {result.seconds * 1000:.1f} ms'
+        ))
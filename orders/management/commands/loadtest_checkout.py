@@ -0,0 +1,88 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings
+from mpesa.testing import FakeDarajaServer
+from myshop.benchmarking import benchmark_database, summarize
+from orders.models import PaymentRequest
+from orders.payments import get_worker_pool, send_stk_push
+from products.testing import make_catalog
+
+CHECKOUT_FORM = {
+    'first_name': 'Load',
+    'last_name': 'Test',
+    'phone': '0712345678',
+    'email': 'load@example.com',
+    'county': 'Nairobi',
+    'pickup_station': 'Westgate Mall',
+    'payment_method': 'M-Pesa',
+}
+
+
+class Command(BaseCommand):
+    help = 'Measure request-worker occupancy during M-Pesa checkout against a slow fake gateway'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--checkouts', type=int, default=40)
+        parser.add_argument('--request-workers', type=int, default=4,
+                            help='Simulated WSGI worker threads')
+        parser.add_argument('--payment-workers', type=int, default=4)
+        parser.add_argument('--gateway-delay', type=float, default=1.0,
+                            help='Seconds the fake Daraja takes to answer an STK push')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            product = make_catalog(products=1)[0]
+            with FakeDarajaServer(stk_delay=options['gateway_delay']) as fake:
+                with override_settings(MPESA_BASE_URL=fake.url, PAYMENT_WORKERS=0):
+                    self.run('inline', product, options, inline=True)
+                    PaymentRequest.objects.all().delete()
+                    self.run('queued', product, options, inline=False)
+
+    def run(self, label, product, options, inline):
+        request_timings = []
+        busy = [0.0]
+        lock = threading.Lock()
+
+        def checkout(_):
+            client = Client()
+            client.post('/cart/add/', {'product_id': product.id, 'size': 'small', 'quantity': 1})
+            started = time.perf_counter()
+            response = client.post('/checkout/', CHECKOUT_FORM)
+            if inline:
+                # What checkout used to do: block the request on the gateway
+                order_id = int(response.url.rstrip('/').rsplit('/', 1)[-1])
+                payment_request = PaymentRequest.objects.select_related('order').get(order_id=order_id)
+                PaymentRequest.objects.filter(pk=payment_request.pk).update(status='processing')
+                send_stk_push(payment_request)
+            elapsed = time.perf_counter() - started
+            with lock:
+                request_timings.append(elapsed * 1000)
+                busy[0] += elapsed
+
+        pool = None
+        if not inline:
+            pool = get_worker_pool(threads=options['payment_workers'])
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['request_workers']) as executor:
+            list(executor.map(checkout, range(options['checkouts'])))
+        responded = time.perf_counter() - started
+
+        while PaymentRequest.objects.filter(status__in=['queued', 'processing']).exists():
+            time.sleep(0.05)
+        all_sent = time.perf_counter() - started
+        if pool:
+            pool.stop()
+
+        checkouts = options['checkouts']
+        self.stdout.write(self.style.MIGRATE_HEADING(f'{label}:'))
+        self.stdout.write(f'  checkout response   {summarize(request_timings)}')
+        self.stdout.write(f'  all responses sent  {responded:.2f} s')
+        self.stdout.write(f'  all STK pushes sent {all_sent:.2f} s')
+        self.stdout.write(f'  request workers     {busy[0] / checkouts * 1000:.1f} ms busy per checkout, '
+                          f'{checkouts / responded:.1f} checkouts/s')
+        if pool:
+            self.stdout.write(f'  payment workers     {pool.stats()}')
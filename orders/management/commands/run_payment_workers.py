@@ -0,0 +1,40 @@
+import asyncio
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from orders.payments import aprocess_pending, get_worker_pool
+
+
+class Command(BaseCommand):
+    help = 'Send queued M-Pesa STK pushes using a pool of worker threads'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=settings.PAYMENT_WORKERS or 2)
+        parser.add_argument('--async', action='store_true', dest='use_async',
+                            help='Send pushes from one event loop instead of threads')
+        parser.add_argument('--concurrency', type=int, default=100,
+                            help='Maximum STK pushes in flight with --async')
+    
+    def handle(self, *args, **options):
+        if options['use_async']:
+            self.stdout.write(f"Sending STK pushes asynchronously, {options['concurrency']} at a time")
+            try:
+                asyncio.run(aprocess_pending(
+                    concurrency=options['concurrency'],
+                    drain=False,
+                    idle_interval=settings.PAYMENT_WORKER_IDLE_INTERVAL,
+                ))
+            except KeyboardInterrupt:
+                self.stdout.write(self.style.SUCCESS("Stopped async payment worker"))
+            return
+        
+        pool = get_worker_pool(threads=options['threads'])
+        self.stdout.write(f"Started {pool.threads} payment workers")
+        
+        try:
+            while True:
+                time.sleep(60)
+                self.stdout.write(f"Payment workers: {pool.stats()}")
+        except KeyboardInterrupt:
+            pool.stop(timeout=30)
+            self.stdout.write(self.style.SUCCESS(f"Stopped after sending {pool.processed} STK pushes"))
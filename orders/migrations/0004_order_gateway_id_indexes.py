@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_paymentrequest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='merchant_request_id',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'payment_method', 'payment_initiated_at'], name='orders_orde_status_edd815_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('checkout_request_id', ''), _negated=True), fields=('checkout_request_id',), name='order_unique_checkout_request_id'),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('merchant_request_id', ''), _negated=True), fields=('merchant_request_id',), name='order_unique_merchant_request_id'),
+        ),
+    ]
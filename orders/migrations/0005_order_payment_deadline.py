@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:11
+
+from datetime import timedelta
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_deadlines(apps, schema_editor):
+    """Give orders with an open payment window the deadline they would get today"""
+    Order = apps.get_model('orders', 'Order')
+    for payment_method, seconds in settings.PAYMENT_EXPIRY_SECONDS.items():
+        Order.objects.filter(payment_method=payment_method, payment_initiated_at__isnull=False).update(
+            payment_deadline=F('payment_initiated_at') + timedelta(seconds=seconds),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_order_gateway_id_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='order',
+            name='orders_orde_status_edd815_idx',
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='payment_deadline',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'payment_deadline'], name='orders_orde_status_ae3a03_idx'),
+        ),
+        migrations.RunPython(backfill_deadlines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# The stations previously hardcoded in orders.views.COUNTY_STATIONS
+INITIAL_STATIONS = {
+    'Nairobi': ['Westgate Mall', 'Garden City Mall', 'The Hub Karen', 'Two Rivers Mall'],
+    'Mombasa': ['Nyali Centre', 'City Mall', 'Mtwapa', 'Likoni'],
+    'Kisumu': ['West End Mall', 'Kisumu Mega Plaza', 'Kisumu CBD'],
+    'Nakuru': ['Westside Mall', 'Nakuru Town', 'Lanet'],
+}
+
+
+def add_initial_stations(apps, schema_editor):
+    County = apps.get_model('orders', 'County')
+    PickupStation = apps.get_model('orders', 'PickupStation')
+    for name, stations in INITIAL_STATIONS.items():
+        county = County.objects.create(name=name)
+        PickupStation.objects.bulk_create([PickupStation(county=county, name=station) for station in stations])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_order_payment_deadline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='County',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('is_active', models.BooleanField(default=True)),
+            ],
+            options={
+                'verbose_name_plural': 'counties',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PickupStation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('is_active', models.BooleanField(default=True)),
+                ('county', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stations', to='orders.county')),
+            ],
+            options={
+                'ordering': ['name'],
+                'constraints': [models.UniqueConstraint(fields=('county', 'name'), name='orders_station_unique_per_county')],
+            },
+        ),
+        migrations.RunPython(add_initial_stations, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,30 @@
+from datetime import timedelta
+from django.conf import settings
 from django.db import models
+from django.db.models import Q
+from django.db.models.functions import Now
+from django.utils import timezone
 from decimal import Decimal
 
+class OrderQuerySet(models.QuerySet):
+    # The gateway id columns are only unique (and indexed) where non-empty,
+    # so lookups repeat that condition to let the partial index serve them
+    def by_checkout_request_id(self, checkout_request_id):
+        return self.filter(checkout_request_id=checkout_request_id).exclude(checkout_request_id='')
+    
+    def by_merchant_request_id(self, merchant_request_id):
+        return self.filter(merchant_request_id=merchant_request_id).exclude(merchant_request_id='')
+    
+    # Payment windows are compared against the database clock, so these
+    # filter in SQL on the (status, payment_deadline) index
+    def awaiting_payment(self):
+        """Pending orders whose payment window is still open"""
+        return self.filter(status='pending', payment_deadline__gte=Now())
+    
+    def expired(self):
+        """Pending orders whose payment window has closed"""
+        return self.filter(status='pending', payment_deadline__lt=Now())
+
 class Order(models.Model):
     PAYMENT_METHOD_CHOICES = [
         ('M-Pesa', 'M-Pesa'),
@@ -26,23 +50,73 @@ class Order(models.Model):
     total = models.DecimalField(max_digits=10, decimal_places=2)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
     checkout_request_id = models.CharField(max_length=100, blank=True)
+    merchant_request_id = models.CharField(max_length=100, blank=True)
     transaction_id = models.CharField(max_length=100, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     payment_initiated_at = models.DateTimeField(null=True, blank=True)
+    payment_deadline = models.DateTimeField(null=True, blank=True)
+    
+    objects = OrderQuerySet.as_manager()
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Pending orders by payment deadline (expiry sweeps and filters)
+            models.Index(fields=['status', 'payment_deadline']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['checkout_request_id'],
+                condition=~Q(checkout_request_id=''),
+                name='order_unique_checkout_request_id',
+            ),
+            models.UniqueConstraint(
+                fields=['merchant_request_id'],
+                condition=~Q(merchant_request_id=''),
+                name='order_unique_merchant_request_id',
+            ),
+        ]
     
     def __str__(self):
         return f"Order #{self.id} - {self.first_name} {self.last_name}"
     
+    def start_payment_window(self, now=None):
+        """Set payment_initiated_at and the deadline from PAYMENT_EXPIRY_SECONDS"""
+        self.payment_initiated_at = now or timezone.now()
+        expiry = settings.PAYMENT_EXPIRY_SECONDS.get(self.payment_method)
+        self.payment_deadline = self.payment_initiated_at + timedelta(seconds=expiry) if expiry else None
+    
     def is_payment_expired(self):
-        """Check if payment initiation is older than 2 minutes"""
-        from django.utils import timezone
-        if self.payment_initiated_at:
-            return (timezone.now() - self.payment_initiated_at).total_seconds() > 120  # 2 minutes
-        return False
+        """Check if the payment deadline has passed"""
+        return self.payment_deadline is not None and timezone.now() > self.payment_deadline
+
+class PaymentRequest(models.Model):
+    """Queued STK push for an order, sent by the payment workers"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('processing', 'Processing'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+        ('skipped', 'Skipped'),
+    ]
+    
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='payment_requests')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"STK push for order #{self.order_id} ({self.status})"
 
 # OrderItem model remains the same...
 class OrderItem(models.Model):
@@ -63,4 +137,29 @@ class OrderItem(models.Model):
         super().save(*args, **kwargs)
     
     def __str__(self):
-        return f"{self.product_name} - {self.quantity}"
\ No newline at end of file
+        return f"{self.product_name} - {self.quantity}"
+
+class County(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    is_active = models.BooleanField(default=True)
+    
+    class Meta:
+        ordering = ['name']
+        verbose_name_plural = 'counties'
+    
+    def __str__(self):
+        return self.name
+
+class PickupStation(models.Model):
+    county = models.ForeignKey(County, on_delete=models.CASCADE, related_name='stations')
+    name = models.CharField(max_length=200)
+    is_active = models.BooleanField(default=True)
+    
+    class Meta:
+        ordering = ['name']
+        constraints = [
+            models.UniqueConstraint(fields=['county', 'name'], name='orders_station_unique_per_county'),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} ({self.county})"
@@ -0,0 +1,184 @@
+"""In-process hub pushing order payment status changes to waiting browsers
+
+Writers (the M-Pesa callback, payment workers, expiry checks) call
+``publish_order_status(order)``; the payment status stream waits on the
+hub instead of polling the database. The hub only spans one process, so
+streams also re-read the order every PAYMENT_STATUS_STREAM_RECHECK seconds
+to pick up changes written by other processes.
+
+Each publish also stores a status snapshot in the cache, from which the
+payment_status endpoint answers polls without touching the database. A
+pending order's snapshot only lives for PAYMENT_STATUS_STREAM_RECHECK
+seconds, so a writer in another process with a process-local cache is
+picked up as quickly as by the streams.
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from .models import Order
+
+
+class PaymentStatusHub:
+    """Latest status payload per order plus the waiters watching it"""
+
+    def __init__(self, max_orders=10000):
+        self.max_orders = max_orders
+        self._lock = threading.Lock()
+        self._latest = OrderedDict()
+        self._waiters = {}
+        self._version = 0
+
+    def publish(self, order_id, payload):
+        """Store payload as the order's latest status and wake its waiters"""
+        with self._lock:
+            self._version += 1
+            self._latest[order_id] = (self._version, payload)
+            self._latest.move_to_end(order_id)
+            while len(self._latest) > self.max_orders:
+                self._latest.popitem(last=False)
+            waiters = self._waiters.pop(order_id, [])
+        for wake in waiters:
+            try:
+                wake()
+            except RuntimeError:
+                # The waiter's event loop has already closed
+                pass
+        return self._version
+
+    def latest(self, order_id):
+        """Return (version, payload) of the last publish for order, or None"""
+        with self._lock:
+            return self._latest.get(order_id)
+
+    def _newer(self, order_id, after_version):
+        entry = self._latest.get(order_id)
+        if entry and entry[0] > after_version:
+            return entry
+        return None
+
+    def _finish_wait(self, order_id, after_version, wake):
+        with self._lock:
+            waiters = self._waiters.get(order_id)
+            if waiters and wake in waiters:
+                waiters.remove(wake)
+                if not waiters:
+                    del self._waiters[order_id]
+            return self._newer(order_id, after_version)
+
+    def wait(self, order_id, after_version=0, timeout=None):
+        """Block until a publish newer than after_version; None on timeout"""
+        event = threading.Event()
+        wake = event.set
+        with self._lock:
+            entry = self._newer(order_id, after_version)
+            if entry:
+                return entry
+            self._waiters.setdefault(order_id, []).append(wake)
+        event.wait(timeout)
+        return self._finish_wait(order_id, after_version, wake)
+
+    async def await_change(self, order_id, after_version=0, timeout=None):
+        """Async variant of wait()"""
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+
+        def wake():
+            loop.call_soon_threadsafe(event.set)
+
+        with self._lock:
+            entry = self._newer(order_id, after_version)
+            if entry:
+                return entry
+            self._waiters.setdefault(order_id, []).append(wake)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self._finish_wait(order_id, after_version, wake)
+
+
+hub = PaymentStatusHub()
+
+
+def status_payload(order, stk_status=None, stk_error=''):
+    """The status fields shared by payment_status and the status stream"""
+    return {
+        'status': order.status,
+        'status_display': order.get_status_display(),
+        'transaction_id': order.transaction_id,
+        'payment_method': order.payment_method,
+        'stk_status': stk_status,
+        'stk_error': stk_error,
+    }
+
+
+def _snapshot_key(order_id):
+    return f'order-status:{order_id}'
+
+
+def make_snapshot(order, stk_status=None, stk_error=''):
+    """Status payload plus when a pending payment's window closes"""
+    expires_at = None
+    if order.status == 'pending' and order.payment_deadline:
+        expires_at = order.payment_deadline.timestamp()
+    return {'payload': status_payload(order, stk_status, stk_error), 'expires_at': expires_at}
+
+
+def store_snapshot(snapshot, order_id, replace=True):
+    """Cache snapshot; with replace=False an existing (newer) one is kept"""
+    cache = caches[settings.ORDER_STATUS_CACHE_ALIAS]
+    if snapshot['payload']['status'] == 'pending':
+        timeout = settings.PAYMENT_STATUS_STREAM_RECHECK
+    else:
+        timeout = settings.ORDER_STATUS_SNAPSHOT_TIMEOUT
+    if replace:
+        cache.set(_snapshot_key(order_id), snapshot, timeout)
+    else:
+        cache.add(_snapshot_key(order_id), snapshot, timeout)
+
+
+def get_snapshot(order_id):
+    return caches[settings.ORDER_STATUS_CACHE_ALIAS].get(_snapshot_key(order_id))
+
+
+async def aget_snapshot(order_id):
+    return await caches[settings.ORDER_STATUS_CACHE_ALIAS].aget(_snapshot_key(order_id))
+
+
+def forget_snapshots(order_ids):
+    """Drop cached snapshots so the next poll re-reads the orders"""
+    caches[settings.ORDER_STATUS_CACHE_ALIAS].delete_many([_snapshot_key(order_id) for order_id in order_ids])
+
+
+def snapshot_status(snapshot):
+    """The payload to show for snapshot now, with is_expired filled in
+
+    A pending payment whose window has closed is shown as timed out without
+    writing the order; the expiry sweep records the timeout.
+    """
+    payload = dict(snapshot['payload'])
+    expires_at = snapshot['expires_at']
+    payload['is_expired'] = bool(payload['status'] == 'pending' and expires_at and time.time() > expires_at)
+    if payload['is_expired']:
+        payload['status'] = 'timeout'
+        payload['status_display'] = dict(Order.STATUS_CHOICES)['timeout']
+    return payload
+
+
+def publish_order_status(order, stk_status=None, stk_error=''):
+    """Announce order's current status to any open status streams
+
+    Writers that don't know the STK push state (e.g. the callback) keep the
+    one already in the snapshot.
+    """
+    if stk_status is None:
+        previous = get_snapshot(order.id)
+        if previous:
+            stk_status = previous['payload']['stk_status']
+            stk_error = previous['payload']['stk_error']
+    snapshot = make_snapshot(order, stk_status, stk_error)
+    store_snapshot(snapshot, order.id)
+    return hub.publish(order.id, snapshot['payload'])
@@ -0,0 +1,290 @@
+"""DB-backed queue for M-Pesa payment initiation
+
+Checkout only records a PaymentRequest; the STK push itself is sent by a
+pool of worker threads, either inside the web process (PAYMENT_WORKERS > 0)
+or by ``manage.py run_payment_workers``. With ``--async`` that command sends
+pushes from one event loop instead, keeping many of them in flight at once.
+"""
+import asyncio
+import logging
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from mpesa.services import AsyncMpesaService, MpesaService
+from myshop.workers import WorkerPool
+from .models import Order, PaymentRequest
+from .notifications import publish_order_status
+
+logger = logging.getLogger(__name__)
+
+ORDER_SENT_FIELDS = [
+    'checkout_request_id', 'merchant_request_id', 'payment_initiated_at', 'payment_deadline', 'updated_at',
+]
+REQUEST_DONE_FIELDS = ['status', 'error', 'finished_at']
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def enqueue_stk_push(order):
+    """Queue an STK push for order and wake the workers once committed"""
+    payment_request = PaymentRequest.objects.create(order=order)
+    transaction.on_commit(wake_workers)
+    return payment_request
+
+
+def _claimable():
+    """Queued requests, and ones left processing by a worker that died
+
+    A request is claimed again PAYMENT_CLAIM_TIMEOUT seconds after it was
+    started; send_stk_push() does not send it again if the order already
+    has a checkout_request_id, and gives up once PAYMENT_MAX_ATTEMPTS are
+    used.
+    """
+    stale = timezone.now() - timedelta(seconds=settings.PAYMENT_CLAIM_TIMEOUT)
+    return Q(status='queued') | Q(status='processing', started_at__lt=stale)
+
+
+def claim_next():
+    """Claim the oldest claimable request, or return None if there is none
+
+    Claiming is a compare-and-set UPDATE, so concurrent workers (threads or
+    processes) never send the same STK push twice.
+    """
+    claimable = _claimable()
+    candidates = PaymentRequest.objects.filter(claimable).order_by('created_at')
+    for pk in candidates.values_list('pk', flat=True)[:10]:
+        claimed = PaymentRequest.objects.filter(claimable, pk=pk).update(
+            status='processing',
+            started_at=timezone.now(),
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return PaymentRequest.objects.select_related('order').get(pk=pk)
+    return None
+
+
+def _apply_response(payment_request, response):
+    """Update the order and request from an STK push response (unsaved)"""
+    order = payment_request.order
+    if response.get('ResponseCode') == '0':
+        order.checkout_request_id = response.get('CheckoutRequestID')
+        order.merchant_request_id = response.get('MerchantRequestID') or ''
+        order.start_payment_window()
+        payment_request.status = 'sent'
+        payment_request.finished_at = timezone.now()
+    else:
+        error_message = response.get('error') or response.get('ResponseDescription') or 'Payment initiation failed'
+        logger.warning(f"STK push failed for order {order.id}: {error_message}")
+        _fail(payment_request, error_message)
+
+
+def _fail(payment_request, error):
+    """Mark the request failed with error (unsaved)"""
+    payment_request.status = 'failed'
+    payment_request.error = str(error)[:255] or error.__class__.__name__
+    payment_request.finished_at = timezone.now()
+
+
+def _skip_unless_pending(payment_request):
+    """Skip requests whose order was settled while they were queued
+
+    The order was loaded with the claim, so a request for an order that
+    timed out, was cancelled or failed meanwhile never prompts the customer.
+    """
+    status = payment_request.order.status
+    if status == 'pending':
+        return False
+    logger.info(f"STK push for order {payment_request.order_id} skipped: order is {status}")
+    payment_request.status = 'skipped'
+    payment_request.error = f'Order is {status}'
+    payment_request.finished_at = timezone.now()
+    return True
+
+
+def _already_sent(payment_request):
+    """Record a push Daraja accepted before its worker stalled as sent
+
+    A claim taken over after PAYMENT_CLAIM_TIMEOUT may belong to a worker
+    that sent the push but died before recording the request; the order's
+    checkout_request_id shows it went out, so the customer is not prompted
+    a second time.
+    """
+    if not payment_request.order.checkout_request_id:
+        return False
+    logger.warning(f"STK push for order {payment_request.order_id} was already sent; not sending it again")
+    payment_request.status = 'sent'
+    payment_request.error = ''
+    payment_request.finished_at = timezone.now()
+    return True
+
+
+def _attempts_exhausted(payment_request):
+    if payment_request.attempts <= settings.PAYMENT_MAX_ATTEMPTS:
+        return False
+    logger.error(f"STK push for order {payment_request.order_id} abandoned after "
+                 f"{settings.PAYMENT_MAX_ATTEMPTS} attempts")
+    _fail(payment_request, f'Abandoned after {settings.PAYMENT_MAX_ATTEMPTS} attempts')
+    return True
+
+
+def send_stk_push(payment_request):
+    """Send the STK push for a claimed request and record the outcome
+
+    The customer's payment window opens once the push is sent. Any error
+    marks the request and its pending order failed, so neither is left
+    processing.
+    """
+    order = payment_request.order
+    if not (_skip_unless_pending(payment_request) or _already_sent(payment_request)
+            or _attempts_exhausted(payment_request)):
+        try:
+            response = MpesaService().stk_push(
+                phone=order.phone,
+                amount=order.total,
+                order_id=order.id
+            )
+            _apply_response(payment_request, response)
+            if payment_request.status == 'sent':
+                # A savepoint, so a rejected save leaves any outer transaction usable
+                with transaction.atomic():
+                    order.save(update_fields=ORDER_SENT_FIELDS)
+        except Exception as e:
+            logger.exception(f"Error sending STK push for order {order.id}")
+            _fail(payment_request, e)
+
+    if payment_request.status == 'failed' and Order.objects.filter(pk=order.pk, status='pending').update(
+            status='failed', updated_at=timezone.now()):
+        order.status = 'failed'
+    payment_request.save(update_fields=REQUEST_DONE_FIELDS)
+    publish_order_status(order, payment_request.status, payment_request.error)
+    return payment_request
+
+
+def process_pending(limit=None):
+    """Send queued STK pushes until the queue is empty or limit is reached"""
+    processed = 0
+    while limit is None or processed < limit:
+        payment_request = claim_next()
+        if payment_request is None:
+            break
+        send_stk_push(payment_request)
+        processed += 1
+    return processed
+
+
+def get_worker_pool(threads=None):
+    """Return the process-wide payment worker pool, starting it if needed"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool(
+                'payment-worker',
+                lambda: process_pending(limit=settings.PAYMENT_WORKER_BATCH_SIZE),
+                threads=threads or settings.PAYMENT_WORKERS,
+                idle_interval=settings.PAYMENT_WORKER_IDLE_INTERVAL,
+            )
+        _pool.start()
+    return _pool
+
+
+def wake_workers():
+    """Nudge the in-process workers, starting them if PAYMENT_WORKERS > 0"""
+    if _pool is None and settings.PAYMENT_WORKERS > 0:
+        get_worker_pool()
+    if _pool is not None:
+        _pool.wake()
+
+
+async def aclaim_next():
+    """Async variant of claim_next()"""
+    claimable = _claimable()
+    candidates = PaymentRequest.objects.filter(claimable).order_by('created_at')
+    async for pk in candidates.values_list('pk', flat=True)[:10]:
+        claimed = await PaymentRequest.objects.filter(claimable, pk=pk).aupdate(
+            status='processing',
+            started_at=timezone.now(),
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return await PaymentRequest.objects.select_related('order').aget(pk=pk)
+    return None
+
+
+async def asend_stk_push(payment_request):
+    """Async variant of send_stk_push(); the gateway call does not block"""
+    order = payment_request.order
+    if not (_skip_unless_pending(payment_request) or _already_sent(payment_request)
+            or _attempts_exhausted(payment_request)):
+        try:
+            response = await AsyncMpesaService().astk_push(
+                phone=order.phone,
+                amount=order.total,
+                order_id=order.id
+            )
+            _apply_response(payment_request, response)
+            if payment_request.status == 'sent':
+                await order.asave(update_fields=ORDER_SENT_FIELDS)
+        except Exception as e:
+            logger.exception(f"Error sending STK push for order {order.id}")
+            _fail(payment_request, e)
+
+    if payment_request.status == 'failed' and await Order.objects.filter(pk=order.pk, status='pending').aupdate(
+            status='failed', updated_at=timezone.now()):
+        order.status = 'failed'
+    await payment_request.asave(update_fields=REQUEST_DONE_FIELDS)
+    publish_order_status(order, payment_request.status, payment_request.error)
+    return payment_request
+
+
+async def aprocess_pending(concurrency=100, drain=True, idle_interval=1.0):
+    """Send queued STK pushes with up to concurrency of them in flight
+
+    With drain=True this returns once the queue is empty; otherwise it runs
+    until cancelled, polling every idle_interval seconds when idle.
+    """
+    slots = asyncio.Semaphore(concurrency)
+    in_flight = set()
+    processed = 0
+
+    async def send(payment_request):
+        nonlocal processed
+        try:
+            await asend_stk_push(payment_request)
+            processed += 1
+        except Exception:
+            logger.exception(f"Error sending STK push for order {payment_request.order_id}")
+        finally:
+            slots.release()
+
+    try:
+        while True:
+            await slots.acquire()
+            payment_request = await aclaim_next()
+            if payment_request is None:
+                slots.release()
+                if drain:
+                    break
+                await asyncio.sleep(idle_interval)
+                continue
+            task = asyncio.create_task(send(payment_request))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+    finally:
+        if in_flight:
+            await asyncio.wait(in_flight)
+    return processed
+
+
+def latest_request_status(order):
+    """Return (status, error) of the order's most recent STK push request"""
+    return order.payment_requests.order_by('-created_at').values_list('status', 'error').first() or (None, '')
+
+
+async def alatest_request_status(order):
+    """Return (status, error) of the order's most recent STK push request"""
+    latest = await order.payment_requests.order_by('-created_at').values_list('status', 'error').afirst()
+    return latest or (None, '')
@@ -0,0 +1,93 @@
+"""Reprice a cart against the current catalog before an order is placed
+
+Cart lines keep the unit price they were added at. Checkout prices every
+line again in one batch (see cart.resolver.resolve_lines) and caches the
+result per cart contents and catalog version for the checkout page. The
+order POST prices from the database, so what is charged never comes from a
+cache entry a missed version bump left stale.
+"""
+import hashlib
+import json
+from collections import namedtuple
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import caches
+from cart.resolver import resolve_lines
+from cart.storage import MESSAGE, PRICE, QUANTITY
+from products.cache import catalog
+
+# Plain values only, so a cached PricedCart pickles cheaply
+PricedLine = namedtuple('PricedLine', [
+    'key', 'product_id', 'product_name', 'size', 'icing', 'eggs', 'message',
+    'unit_price', 'quantity', 'total_price',
+])
+PriceChange = namedtuple('PriceChange', ['key', 'name', 'old_price', 'new_price'])
+
+
+class PricedCart:
+    """Every cart line at its current price, plus what differs from the cart"""
+
+    def __init__(self, lines, changes, unavailable):
+        self.lines = lines
+        self.changes = changes
+        self.unavailable = unavailable
+        self.total = sum((line.total_price for line in lines), Decimal('0'))
+
+    @property
+    def is_current(self):
+        """True when the cart's stored prices are all still valid"""
+        return not self.changes and not self.unavailable
+
+    def updates(self):
+        """New unit price per changed line key; None for unavailable lines"""
+        updates = {change.key: change.new_price for change in self.changes}
+        updates.update((key, None) for key in self.unavailable)
+        return updates
+
+    def messages(self):
+        for change in self.changes:
+            yield (f"The price of {change.name} changed from KSh {change.old_price} "
+                   f"to KSh {change.new_price}.")
+        if len(self.unavailable) == 1:
+            yield "One item in your cart is no longer available and was removed."
+        elif self.unavailable:
+            yield f"{len(self.unavailable)} items in your cart are no longer available and were removed."
+
+
+def _cache_key(lines):
+    digest = hashlib.md5(json.dumps(lines, separators=(',', ':')).encode()).hexdigest()
+    return f'priced-cart:{catalog.version()}:{digest}'
+
+
+def price_cart(cart, use_cache=True):
+    """Return the PricedCart for cart, reusing a recent result if possible
+
+    With use_cache=False the cart is priced from the database, bypassing
+    both the priced cart and the catalog cache.
+    """
+    items = list(cart.lines.items())
+    lines = [line for _, line in items]
+    cache = caches[settings.CATALOG_CACHE_ALIAS]
+    key = _cache_key(lines)
+    priced = cache.get(key) if use_cache else None
+    if priced is not None:
+        return priced
+
+    priced_lines, changes, unavailable = [], [], []
+    for (line_key, line), selection in zip(items, resolve_lines(lines, use_cache)):
+        if selection is None:
+            unavailable.append(line_key)
+            continue
+        old_price = Decimal(line[PRICE])
+        if selection.unit_price != old_price:
+            changes.append(PriceChange(line_key, selection.product.name, old_price, selection.unit_price))
+        product, size, icing, eggs, price = selection
+        priced_lines.append(PricedLine(
+            line_key, product.id, product.name,
+            size.name if size else '', icing.name if icing else '', eggs.name if eggs else '',
+            line[MESSAGE], price, line[QUANTITY], price * line[QUANTITY],
+        ))
+
+    priced = PricedCart(priced_lines, changes, unavailable)
+    cache.set(key, priced, settings.CHECKOUT_PRICING_TIMEOUT)
+    return priced
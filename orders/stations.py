@@ -0,0 +1,99 @@
+"""In-memory index of active counties and their pickup stations
+
+Each process keeps the whole county -> stations map in memory, tagged with a
+version stored in the catalog cache. Saving or deleting a County or
+PickupStation bumps the version, and every process rebuilds its index on
+its next lookup (one query for counties, one for stations). As with the
+catalog cache, share the cache backend between worker processes
+(CACHE_URL=redis://...) so they all see the bump.
+
+The checkout page loads the whole map once from a URL carrying the version,
+which can be cached for good because a change produces a new URL.
+"""
+import json
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Prefetch
+from django.db.models.signals import post_delete, post_save
+from .models import County, PickupStation
+
+
+class StationIndex:
+    """One version of the county -> station names map"""
+
+    def __init__(self, version, counties):
+        self.version = version
+        self.counties = counties
+        self.json = json.dumps({'version': version, 'counties': counties}, separators=(',', ':'))
+
+    def stations(self, county):
+        return self.counties.get(county, [])
+
+
+class StationRegistry:
+    key = 'pickup-stations:version'
+
+    def __init__(self, alias=None):
+        self._alias = alias
+        self._lock = threading.Lock()
+        self._index = None
+
+    @property
+    def cache(self):
+        return caches[self._alias or settings.CATALOG_CACHE_ALIAS]
+
+    def version(self):
+        """Return the current version, initialising it if evicted"""
+        version = self.cache.get(self.key)
+        if version is None:
+            # Seed from the clock so a lost version never matches an old index
+            self.cache.add(self.key, time.time_ns(), None)
+            version = self.cache.get(self.key)
+        return version
+
+    def bump(self):
+        try:
+            return self.cache.incr(self.key)
+        except ValueError:
+            return self.version()
+
+    def index(self):
+        """The index for the current version, rebuilt if it changed"""
+        version = self.version()
+        index = self._index
+        if index is None or index.version != version:
+            with self._lock:
+                index = self._index
+                if index is None or index.version != version:
+                    # A change during the load bumps the version again, so
+                    # the next lookup rebuilds
+                    index = self._index = StationIndex(version, _load())
+        return index
+
+    def counties(self):
+        return list(self.index().counties)
+
+    def stations(self, county):
+        return self.index().stations(county)
+
+
+def _load():
+    stations = Prefetch('stations', PickupStation.objects.filter(is_active=True).only('county_id', 'name'))
+    return {
+        county.name: [station.name for station in county.stations.all()]
+        for county in County.objects.filter(is_active=True).prefetch_related(stations)
+    }
+
+
+registry = StationRegistry()
+
+
+def _bump_registry_version(sender, **kwargs):
+    registry.bump()
+
+
+for model in (County, PickupStation):
+    post_save.connect(_bump_registry_version, sender=model, dispatch_uid=f'station-registry-{model.__name__}')
+    post_delete.connect(_bump_registry_version, sender=model, dispatch_uid=f'station-registry-{model.__name__}')
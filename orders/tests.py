@@ -1,3 +1,654 @@
-from django.test import TestCase
+import asyncio
+import json
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from mpesa.inbox import process_inbox
+from mpesa.services import token_cache
+from mpesa.testing import FakeDarajaServer
+from myshop.workers import serves_requests
+from cart.cart import Cart
+from products.cache import catalog
+from products.models import Product, SizeVariant
+from products.testing import make_catalog
+from .expiry import sweep_expired_payments
+from .models import County, Order, PaymentRequest, PickupStation
+from .notifications import PaymentStatusHub, get_snapshot, publish_order_status
+from .payments import aprocess_pending, process_pending
+from .pricing import price_cart
+from .stations import registry
+from .views import expire_payment_if_due
 
-# Create your tests here.
+CHECKOUT_FORM = {
+    'first_name': 'Jane',
+    'last_name': 'Doe',
+    'phone': '0712345678',
+    'email': 'jane@example.com',
+    'county': 'Nairobi',
+    'pickup_station': 'Westgate Mall',
+    'payment_method': 'M-Pesa',
+}
+
+
+@override_settings(PAYMENT_WORKERS=0)
+class PaymentQueueTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.fake = FakeDarajaServer().start()
+        cls.addClassCleanup(cls.fake.stop)
+
+    def setUp(self):
+        self.fake.reset()
+        self.fake.oauth_status = 200
+        token_cache.clear()
+        cache.clear()  # Status snapshots of orders from earlier tests
+        self.product = make_catalog(products=1)[0]
+        self.client.post(reverse('cart:add'), {'product_id': self.product.id, 'size': 'small'})
+
+    def checkout(self):
+        response = self.client.post(reverse('orders:checkout'), CHECKOUT_FORM)
+        order = Order.objects.get()
+        self.assertRedirects(response, reverse('orders:success', args=[order.id]),
+                             fetch_redirect_response=False)
+        return order
+
+    def test_checkout_queues_stk_push_without_calling_gateway(self):
+        order = self.checkout()
+
+        self.assertEqual(self.fake.stk_requests, 0)
+        self.assertEqual(order.payment_requests.get().status, 'queued')
+        status = self.client.get(reverse('orders:payment_status', args=[order.id])).json()
+        self.assertEqual(status['status'], 'pending')
+        self.assertEqual(status['stk_status'], 'queued')
+
+    def test_worker_sends_queued_stk_push(self):
+        order = self.checkout()
+
+        with self.settings(MPESA_BASE_URL=self.fake.url):
+            self.assertEqual(process_pending(), 1)
+
+        order.refresh_from_db()
+        self.assertEqual(order.checkout_request_id, 'ws_CO_1')
+        self.assertIsNotNone(order.payment_deadline)
+        self.assertEqual(order.payment_requests.get().status, 'sent')
+        self.assertEqual(process_pending(), 0)
+
+    def test_queued_push_is_not_expired_before_it_is_sent(self):
+        order = self.checkout()
+
+        self.assertIsNone(order.payment_deadline)
+        self.assertEqual(sweep_expired_payments().expired, 0)
+
+    def test_push_for_a_settled_order_is_skipped(self):
+        order = self.checkout()
+        Order.objects.filter(pk=order.pk).update(status='cancelled')
+
+        with self.settings(MPESA_BASE_URL=self.fake.url):
+            self.assertEqual(process_pending(), 1)
+
+        self.assertEqual(self.fake.stk_requests, 0)
+        payment_request = order.payment_requests.get()
+        self.assertEqual((payment_request.status, payment_request.error), ('skipped', 'Order is cancelled'))
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'cancelled')
+
+    def test_gateway_failure_marks_order_failed(self):
+        self.fake.oauth_status = 400
+        order = self.checkout()
+
+        with self.settings(MPESA_BASE_URL=self.fake.url):
+            process_pending()
+
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'failed')
+        payment_request = PaymentRequest.objects.get()
+        self.assertEqual(payment_request.status, 'failed')
+        self.assertEqual(payment_request.error, 'Failed to get access token')
+
+    def test_error_while_recording_response_marks_request_failed(self):
+        order = self.checkout()
+        Order.objects.create(total=100, payment_method='M-Pesa', checkout_request_id='ws_CO_1')
+
+        # The fake gateway hands out ws_CO_1 again, which another order holds
+        with self.settings(MPESA_BASE_URL=self.fake.url):
+            self.assertEqual(process_pending(), 1)
+
+        payment_request = order.payment_requests.get()
+        self.assertEqual(payment_request.status, 'failed')
+        self.assertIn('UNIQUE', payment_request.error.upper())
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.checkout_request_id), ('failed', ''))
+
+    @override_settings(PAYMENT_CLAIM_TIMEOUT=60, PAYMENT_MAX_ATTEMPTS=2)
+    def test_abandoned_claims_are_retried_until_attempts_run_out(self):
+        order = self.checkout()
+        abandoned = {'status': 'processing', 'started_at': timezone.now() - timedelta(minutes=5)}
+        PaymentRequest.objects.update(attempts=1, **abandoned)
+
+        with self.settings(MPESA_BASE_URL=self.fake.url):
+            self.assertEqual(process_pending(), 1)
+        self.assertEqual(order.payment_requests.get().status, 'sent')
+
+        PaymentRequest.objects.update(**abandoned)
+        Order.objects.filter(pk=order.pk).update(checkout_request_id='')
+        self.assertEqual(process_pending(), 1)
+
+        self.assertEqual(self.fake.stk_requests, 1)
+        payment_request = order.payment_requests.get()
+        self.assertEqual((payment_request.status, payment_request.attempts), ('failed', 3))
+        self.assertEqual(payment_request.error, 'Abandoned after 2 attempts')
+
+    @override_settings(PAYMENT_CLAIM_TIMEOUT=60)
+    def test_abandoned_claim_of_a_sent_push_is_not_sent_again(self):
+        order = self.checkout()
+        with self.settings(MPESA_BASE_URL=self.fake.url):
+            process_pending()
+        # The worker died after saving the order but before the request
+        PaymentRequest.objects.update(status='processing', started_at=timezone.now() - timedelta(minutes=5))
+
+        with self.settings(MPESA_BASE_URL=self.fake.url):
+            self.assertEqual(process_pending(), 1)
+
+        self.assertEqual(self.fake.stk_requests, 1)
+        self.assertEqual(order.payment_requests.get().status, 'sent')
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.checkout_request_id), ('pending', 'ws_CO_1'))
+
+    def test_recent_claims_are_not_taken_over(self):
+        self.checkout()
+        PaymentRequest.objects.update(status='processing', started_at=timezone.now())
+
+        self.assertEqual(process_pending(), 0)
+
+    async def test_async_worker_sends_queued_stk_pushes(self):
+        orders = [await Order.objects.acreate(total=100, payment_method='M-Pesa', phone='0712345678')
+                  for _ in range(3)]
+        for order in orders:
+            await PaymentRequest.objects.acreate(order=order)
+
+        with self.settings(MPESA_BASE_URL=self.fake.url):
+            self.assertEqual(await aprocess_pending(concurrency=3), 3)
+
+        self.assertEqual(self.fake.stk_requests, 3)
+        self.assertEqual(await PaymentRequest.objects.filter(status='sent').acount(), 3)
+        self.assertEqual(await Order.objects.exclude(checkout_request_id='').acount(), 3)
+
+
+@override_settings(PAYMENT_WORKERS=0)
+class CheckoutRepricingTests(TestCase):
+    def setUp(self):
+        self.products = make_catalog(products=3)
+        for product in self.products:
+            self.client.post(reverse('cart:add'), {'product_id': product.id, 'size': 'small', 'quantity': 2})
+
+    def checkout(self):
+        return self.client.post(reverse('orders:checkout'), CHECKOUT_FORM)
+
+    def test_price_change_is_confirmed_before_ordering(self):
+        size = SizeVariant.objects.get(product=self.products[0], slug='small')
+        size.price += 250
+        size.save()
+
+        response = self.checkout()
+
+        self.assertRedirects(response, reverse('orders:checkout'), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+        warnings = [str(m) for m in get_messages(response.wsgi_request)]
+        self.assertEqual(warnings, [
+            f"The price of {self.products[0].name} changed from KSh {size.price - 250} to KSh {size.price}.",
+        ])
+
+        self.checkout()
+
+        order = Order.objects.get()
+        expected = size.price * 2 + sum(p.base_price * 2 for p in self.products[1:])
+        self.assertEqual(order.total, expected)
+        self.assertEqual(order.items.get(product=self.products[0]).unit_price, size.price)
+
+    def test_order_is_priced_from_the_database(self):
+        self.client.get(reverse('orders:checkout'))
+        # A write that skipped the catalog version bump leaves the caches stale
+        size = SizeVariant.objects.get(product=self.products[0], slug='small')
+        SizeVariant.objects.filter(pk=size.pk).update(price=size.price + 100)
+
+        response = self.checkout()
+
+        self.assertRedirects(response, reverse('orders:checkout'), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+        self.checkout()
+        self.assertEqual(Order.objects.get().items.get(product=self.products[0]).unit_price, size.price + 100)
+
+    def test_unavailable_lines_are_removed(self):
+        Product.objects.filter(pk=self.products[1].pk).update(is_active=False)
+        catalog.bump()
+
+        response = self.client.get(reverse('orders:checkout'))
+
+        self.assertContains(response, 'One item in your cart is no longer available')
+        self.checkout()
+        self.assertEqual(Order.objects.get().items.count(), 2)
+
+    def test_priced_cart_is_reused_until_the_cart_changes(self):
+        request = self.client.get(reverse('cart:detail')).wsgi_request
+        priced = price_cart(Cart(request))
+        catalog.reset_stats()
+
+        self.assertTrue(price_cart(Cart(request)).is_current)
+        self.assertEqual(catalog.stats()['hits'] + catalog.stats()['misses'], 0)
+        self.assertEqual(priced.total, sum(p.base_price * 2 for p in self.products))
+
+    def test_drifted_cart_totals_are_repaired_at_checkout(self):
+        session = self.client.session
+        session['cart']['count'] = 0
+        session.save()
+
+        response = self.client.get(reverse('orders:checkout'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.session['cart']['count'], 6)
+
+
+@override_settings(CALLBACK_WORKERS=0)
+class MpesaCallbackTests(TestCase):
+    def callback(self, checkout_request_id, result_code):
+        body = {'Body': {'stkCallback': {
+            'MerchantRequestID': 'merchant-1',
+            'CheckoutRequestID': checkout_request_id,
+            'ResultCode': result_code,
+            'ResultDesc': 'Processed',
+            'CallbackMetadata': {'Item': [{'Name': 'MpesaReceiptNumber', 'Value': 'QK123'}]},
+        }}}
+        response = self.client.post(reverse('mpesa:callback'), body, content_type='application/json')
+        process_inbox()
+        return response
+
+    def test_successful_callback_marks_order_paid(self):
+        order = Order.objects.create(total=100, payment_method='M-Pesa', checkout_request_id='ws_CO_1')
+
+        response = self.callback('ws_CO_1', 0)
+
+        self.assertEqual(response.json()['ResultCode'], 0)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'paid')
+        self.assertEqual(order.transaction_id, 'QK123')
+
+    def test_cancelled_callback(self):
+        order = Order.objects.create(total=100, payment_method='M-Pesa', checkout_request_id='ws_CO_1')
+
+        self.callback('ws_CO_1', 1032)
+
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'cancelled')
+
+    def test_callback_falls_back_to_merchant_request_id(self):
+        order = Order.objects.create(total=100, payment_method='M-Pesa', merchant_request_id='merchant-1')
+
+        self.callback('ws_CO_unknown', 0)
+
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'paid')
+
+
+class ExpirySweepTests(TestCase):
+    def create(self, age, status='pending', payment_method='M-Pesa'):
+        order = Order(total=100, status=status, payment_method=payment_method)
+        order.start_payment_window(timezone.now() - timedelta(seconds=age))
+        order.save()
+        return order
+
+    def test_sweep_times_out_expired_payments_in_batches(self):
+        expired = [self.create(300) for _ in range(3)]
+        recent = self.create(30)
+        paid = self.create(300, status='paid')
+        cash = self.create(300, payment_method='COD')
+
+        # A SELECT of the chunk's ids and its UPDATE per batch
+        with self.assertNumQueries(4):
+            result = sweep_expired_payments(batch_size=2)
+
+        self.assertEqual((result.expired, result.batches), (3, 2))
+        statuses = dict(Order.objects.values_list('pk', 'status'))
+        self.assertEqual({statuses[order.pk] for order in expired}, {'timeout'})
+        self.assertEqual([statuses[order.pk] for order in (recent, paid, cash)], ['pending', 'paid', 'pending'])
+
+    def test_update_rechecks_that_the_chunk_is_still_expired(self):
+        self.create(300)
+
+        with CaptureQueriesContext(connection) as queries:
+            sweep_expired_payments()
+
+        update = next(query['sql'] for query in queries if query['sql'].startswith('UPDATE'))
+        self.assertIn('"status" = ', update)
+        self.assertIn('"payment_deadline" < ', update)
+
+    def test_swept_orders_lose_their_cached_snapshot(self):
+        order = self.create(300)
+        publish_order_status(order)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            sweep_expired_payments()
+
+        self.assertIsNone(get_snapshot(order.pk))
+        data = self.client.get(reverse('orders:payment_status', args=[order.pk])).json()
+        self.assertEqual((data['status'], data['is_expired']), ('timeout', False))
+
+    def test_command_reports_each_sweep(self):
+        self.create(300)
+        out = StringIO()
+
+        call_command('cleanup_expired_payments', stdout=out)
+
+        self.assertIn('Expired 1 payments in 1 batches', out.getvalue())
+
+
+class PaymentExpiryPolicyTests(TestCase):
+    @override_settings(PAYMENT_EXPIRY_SECONDS={'M-Pesa': 600})
+    def test_deadline_follows_the_payment_method_policy(self):
+        started = timezone.now()
+        mpesa = Order(total=100, payment_method='M-Pesa')
+        cash = Order(total=100, payment_method='COD')
+
+        mpesa.start_payment_window(started)
+        cash.start_payment_window(started)
+
+        self.assertEqual(mpesa.payment_deadline, started + timedelta(minutes=10))
+        self.assertIsNone(cash.payment_deadline)
+        self.assertFalse(cash.is_payment_expired())
+
+    def test_expiry_is_filtered_in_the_database(self):
+        past, future = timezone.now() - timedelta(minutes=1), timezone.now() + timedelta(minutes=1)
+        expired = Order.objects.create(total=100, payment_method='M-Pesa', payment_deadline=past)
+        open_ = Order.objects.create(total=100, payment_method='M-Pesa', payment_deadline=future)
+        Order.objects.create(total=100, payment_method='M-Pesa', payment_deadline=past, status='paid')
+        Order.objects.create(total=100, payment_method='COD')
+
+        self.assertEqual(list(Order.objects.expired()), [expired])
+        self.assertEqual(list(Order.objects.awaiting_payment()), [open_])
+        self.assertIn('payment_deadline', str(Order.objects.expired().query))
+        self.assertTrue(expired.is_payment_expired())
+
+    def test_expiry_check_does_not_overwrite_a_payment_that_just_landed(self):
+        order = Order.objects.create(
+            total=100, payment_method='M-Pesa', payment_deadline=timezone.now() - timedelta(minutes=1))
+        # Callback marks the order paid after the stream re-read it
+        Order.objects.filter(pk=order.pk).update(status='paid', transaction_id='QK123')
+
+        with mock.patch('orders.views.publish_order_status') as publish:
+            expire_payment_if_due(order)
+
+        publish.assert_not_called()
+        self.assertEqual((order.status, order.transaction_id), ('paid', 'QK123'))
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'paid')
+
+    def test_expiry_check_times_out_a_pending_order(self):
+        order = Order.objects.create(
+            total=100, payment_method='M-Pesa', payment_deadline=timezone.now() - timedelta(minutes=1))
+
+        with mock.patch('orders.views.publish_order_status') as publish:
+            expire_payment_if_due(order)
+
+        publish.assert_called_once_with(order)
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'timeout')
+
+
+class OrderIndexTests(TestCase):
+    def test_gateway_ids_are_unique_unless_empty(self):
+        Order.objects.create(total=100, payment_method='COD')
+        Order.objects.create(total=100, payment_method='COD')
+        Order.objects.create(total=100, payment_method='M-Pesa', checkout_request_id='ws_CO_1')
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Order.objects.create(total=100, payment_method='M-Pesa', checkout_request_id='ws_CO_1')
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite query plan format')
+    def test_gateway_id_lookups_use_the_partial_indexes(self):
+        plans = [
+            Order.objects.by_checkout_request_id('ws_CO_1').explain(),
+            Order.objects.by_merchant_request_id('merchant-1').explain(),
+            Order.objects.expired().explain(),
+        ]
+
+        self.assertIn('USING INDEX order_unique_checkout_request_id', plans[0])
+        self.assertIn('USING INDEX order_unique_merchant_request_id', plans[1])
+        self.assertIn('USING INDEX orders_orde_status_ae3a03_idx', plans[2])
+
+
+@override_settings(PAYMENT_WORKERS=0)
+class CheckoutQueryCountTests(TestCase):
+    def setUp(self):
+        self.products = make_catalog(products=50)
+
+    def fill_cart(self, lines):
+        for product in self.products[:lines]:
+            self.client.post(reverse('cart:add'), {'product_id': product.id, 'size': 'small'})
+
+    def assert_checkout_queries(self, lines, payment_method, expected):
+        self.fill_cart(lines)
+        with self.assertNumQueries(expected):
+            self.client.post(reverse('orders:checkout'), dict(CHECKOUT_FORM, payment_method=payment_method))
+        order = Order.objects.get()
+        self.assertEqual(order.items.count(), lines)
+        return order
+
+    def test_mpesa_checkout_query_count_is_independent_of_cart_size(self):
+        for lines in (1, 10, 50):
+            with self.subTest(lines=lines):
+                Order.objects.all().delete()
+                self.client = self.client_class()
+                order = self.assert_checkout_queries(lines, 'M-Pesa', 9)
+                self.assertIsNone(order.payment_deadline)
+                self.assertEqual(order.payment_requests.count(), 1)
+
+    def test_cod_checkout_query_count(self):
+        # Clearing the cart adds the session UPDATE and its savepoint
+        self.assert_checkout_queries(10, 'COD', 11)
+
+    def test_failed_checkout_writes_nothing(self):
+        self.fill_cart(3)
+
+        form = {key: value for key, value in CHECKOUT_FORM.items() if key != 'first_name'}
+        self.client.post(reverse('orders:checkout'), form)
+
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(PaymentRequest.objects.exists())
+
+
+class PaymentStatusHubTests(SimpleTestCase):
+    def test_wait_returns_publish_from_another_thread(self):
+        status_hub = PaymentStatusHub()
+        threading.Timer(0.05, status_hub.publish, args=(1, {'status': 'paid'})).start()
+
+        version, payload = status_hub.wait(1, timeout=5)
+
+        self.assertEqual(payload, {'status': 'paid'})
+        self.assertIsNone(status_hub.wait(1, after_version=version, timeout=0.01))
+        self.assertEqual(status_hub._waiters, {})
+
+    async def test_await_change(self):
+        status_hub = PaymentStatusHub()
+        asyncio.get_running_loop().call_later(0.05, status_hub.publish, 1, {'status': 'failed'})
+
+        version, payload = await status_hub.await_change(1, timeout=5)
+
+        self.assertEqual(payload['status'], 'failed')
+
+
+class PaymentStatusPollTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.order = Order(total=100, payment_method='M-Pesa', checkout_request_id='ws_CO_1')
+        self.order.start_payment_window()
+        self.order.save()
+        self.url = reverse('orders:payment_status', args=[self.order.id])
+
+    def test_steady_state_poll_touches_neither_db_nor_session(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.json()['status'], 'pending')
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+            unchanged = self.client.get(self.url, headers={'if-none-match': first['ETag']})
+
+        self.assertEqual(response.content, first.content)
+        self.assertEqual(unchanged.status_code, 304)
+        self.assertNotIn('Set-Cookie', unchanged)
+
+    def test_published_status_changes_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.order.status = 'paid'
+        publish_order_status(self.order)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, headers={'if-none-match': etag})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'paid')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_expired_payment_is_reported_without_writing(self):
+        Order.objects.filter(pk=self.order.pk).update(payment_deadline=timezone.now() - timedelta(minutes=1))
+
+        data = self.client.get(self.url).json()
+
+        self.assertEqual((data['status'], data['is_expired']), ('timeout', True))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'pending')
+
+    def test_unknown_order(self):
+        self.assertEqual(self.client.get(reverse('orders:payment_status', args=[999])).status_code, 404)
+
+
+class CountyStationsTests(TestCase):
+    def setUp(self):
+        # The registry version lives in the cache, which outlives test rollbacks
+        cache.clear()
+
+    def test_stations_are_public_and_revalidated_by_etag(self):
+        url = reverse('orders:county_stations') + '?county=Nairobi'
+        first = self.client.get(url)
+        self.assertIn('Westgate Mall', first.json()['stations'])
+        self.assertIn('public', first['Cache-Control'])
+
+        with self.assertNumQueries(0):
+            repeat = self.client.get(url, headers={'if-none-match': first['ETag']})
+
+        self.assertEqual(repeat.status_code, 304)
+        self.assertEqual(repeat.content, b'')
+
+
+    def test_registry_follows_admin_changes(self):
+        self.assertEqual(registry.counties(), ['Kisumu', 'Mombasa', 'Nairobi', 'Nakuru'])
+        nairobi = County.objects.get(name='Nairobi')
+        PickupStation.objects.create(county=nairobi, name='Sarit Centre')
+        PickupStation.objects.filter(name='Westgate Mall').first().delete()
+        County.objects.filter(name='Nakuru').update(is_active=False)
+        County.objects.get(name='Kisumu').save()  # Bulk updates send no signal
+
+        self.assertIn('Sarit Centre', registry.stations('Nairobi'))
+        self.assertNotIn('Westgate Mall', registry.stations('Nairobi'))
+        self.assertEqual(registry.stations('Nakuru'), [])
+
+    def test_index_loads_in_two_queries_and_is_then_served_from_memory(self):
+        counties = County.objects.bulk_create([County(name=f'County {i}') for i in range(47)])
+        PickupStation.objects.bulk_create([
+            PickupStation(county=county, name=f'Station {i}') for county in counties for i in range(10)
+        ])
+        registry.bump()
+
+        with self.assertNumQueries(2):
+            index = registry.index()
+        with self.assertNumQueries(0):
+            self.assertIs(registry.index(), index)
+        self.assertEqual(len(index.stations('County 46')), 10)
+
+    def test_whole_map_is_immutable_at_its_versioned_url(self):
+        version = registry.version()
+        response = self.client.get(reverse('orders:pickup_stations', args=[version]))
+
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        data = response.json()
+        self.assertEqual(data['version'], version)
+        self.assertIn('Westgate Mall', data['counties']['Nairobi'])
+
+        County.objects.create(name='Kiambu')
+        stale = self.client.get(reverse('orders:pickup_stations', args=[version]))
+        self.assertRedirects(stale, reverse('orders:pickup_stations', args=[registry.version()]))
+
+    def test_checkout_preloads_the_current_map(self):
+        product = make_catalog(products=1)[0]
+        self.client.post(reverse('cart:add'), {'product_id': product.id, 'size': 'small'})
+
+        response = self.client.get(reverse('orders:checkout'))
+
+        self.assertContains(response, reverse('orders:pickup_stations', args=[registry.version()]))
+        self.assertContains(response, '<option value="Nairobi">')
+
+
+class PaymentStatusStreamTests(TestCase):
+    def setUp(self):
+        self.order = Order.objects.create(total=100, payment_method='M-Pesa', checkout_request_id='ws_CO_1')
+        self.url = reverse('orders:payment_status_stream', args=[self.order.id])
+
+    def paid_later(self):
+        def mark_paid():
+            self.order.status = 'paid'
+            publish_order_status(self.order)
+        return mark_paid
+
+    @staticmethod
+    def parse(events):
+        return [json.loads(event.split('data: ')[1]) for event in events if 'data: ' in event]
+
+    def test_stream_pushes_published_status(self):
+        threading.Timer(0.05, self.paid_later()).start()
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = self.parse(chunk.decode() for chunk in response.streaming_content)
+        self.assertEqual([e['status'] for e in events], ['pending', 'paid'])
+
+    async def test_stream_over_asgi(self):
+        asyncio.get_running_loop().call_later(0.05, self.paid_later())
+
+        response = await self.async_client.get(self.url)
+
+        events = self.parse([chunk.decode() async for chunk in response.streaming_content])
+        self.assertEqual([e['status'] for e in events], ['pending', 'paid'])
+
+    def test_finished_order_gets_single_event(self):
+        Order.objects.filter(pk=self.order.pk).update(status='cancelled')
+
+        response = self.client.get(self.url)
+
+        events = self.parse(chunk.decode() for chunk in response.streaming_content)
+        self.assertEqual([e['status'] for e in events], ['cancelled'])
+
+    def test_success_page_only_streams_when_enabled(self):
+        url = reverse('orders:success', args=[self.order.id])
+
+        self.assertContains(self.client.get(url), 'if (!false || !window.EventSource)')
+        with override_settings(PAYMENT_STATUS_STREAM=True):
+            self.assertContains(self.client.get(url), 'if (!true || !window.EventSource)')
+
+
+class WorkerBootTests(SimpleTestCase):
+    def test_pools_start_in_web_servers_only(self):
+        self.assertTrue(serves_requests(['/venv/bin/gunicorn', 'myshop.wsgi']))
+        self.assertTrue(serves_requests(['manage.py', 'runserver', '--noreload']))
+        self.assertFalse(serves_requests(['manage.py', 'test']))
+        self.assertFalse(serves_requests(['manage.py', 'run_payment_workers']))
+        with mock.patch.dict('os.environ', {'RUN_MAIN': 'true'}):
+            self.assertTrue(serves_requests(['manage.py', 'runserver']))
+        with mock.patch.dict('os.environ', {'RUN_MAIN': ''}):
+            self.assertFalse(serves_requests(['manage.py', 'runserver']))
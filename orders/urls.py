@@ -7,6 +7,8 @@ urlpatterns = [
     path('', views.checkout, name='checkout'),
     path('success/<int:order_id>/', views.order_success, name='success'),
     path('county-stations/', views.get_county_stations, name='county_stations'),
+    path('pickup-stations/<int:version>.json', views.pickup_stations, name='pickup_stations'),
     path('payment-status/<int:order_id>/', views.payment_status, name='payment_status'),
+    path('payment-status/<int:order_id>/stream/', views.payment_status_stream, name='payment_status_stream'),
     path('simulate-cancel/<int:order_id>/', views.simulate_payment_cancel, name='simulate_cancel'),
 ]
\ No newline at end of file
@@ -1,145 +1,251 @@
+import hashlib
 import json
-from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib import messages
+from django.db import transaction
 from django.utils import timezone
+from django.utils.http import parse_etags, quote_etag
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from .models import Order, OrderItem
 from cart.cart import Cart
-from mpesa.services import MpesaService
-
-# County and station data
-COUNTY_STATIONS = {
-    'Nairobi': ['Westgate Mall', 'Garden City Mall', 'The Hub Karen', 'Two Rivers Mall'],
-    'Mombasa': ['Nyali Centre', 'City Mall', 'Mtwapa', 'Likoni'],
-    'Kisumu': ['West End Mall', 'Kisumu Mega Plaza', 'Kisumu CBD'],
-    'Nakuru': ['Westside Mall', 'Nakuru Town', 'Lanet'],
-}
+from .notifications import (
+    aget_snapshot, hub, make_snapshot, publish_order_status, snapshot_status, status_payload, store_snapshot,
+)
+from .pricing import price_cart
+from .stations import registry
+from .payments import enqueue_stk_push, alatest_request_status, latest_request_status
 
 def checkout(request):
     cart = Cart(request)
+    # The item count and the cart page come from the running totals, so
+    # repair them before relying on either
+    cart.verify()
     
     # Redirect if cart is empty
     if len(cart) == 0:
         messages.warning(request, "Your cart is empty. Add some items before checkout.")
         return redirect('cart:detail')
     
+    # Price every line against the current catalog; the customer confirms
+    # any change before an order is placed. The totals an order is charged
+    # are read from the database, not the pricing or catalog caches
+    use_cache = request.method != 'POST'
+    priced = price_cart(cart, use_cache=use_cache)
+    if not priced.is_current:
+        cart.set_prices(priced.updates())
+        for message in priced.messages():
+            messages.warning(request, message)
+        if len(cart) == 0:
+            return redirect('cart:detail')
+        if request.method == 'POST':
+            return redirect('orders:checkout')
+        priced = price_cart(cart, use_cache=use_cache)
+    
     if request.method == 'POST':
+        payment_method = request.POST.get('payment_method')
         try:
-            # Create order
-            order = Order.objects.create(
-                first_name=request.POST.get('first_name'),
-                last_name=request.POST.get('last_name'),
-                phone=request.POST.get('phone'),
-                email=request.POST.get('email'),
-                county=request.POST.get('county'),
-                pickup_station=request.POST.get('pickup_station'),
-                payment_method=request.POST.get('payment_method'),
-                total=cart.get_total(),
-            )
-            
-            # Create order items
-            for item in cart:
-                OrderItem.objects.create(
-                    order=order,
-                    product_name=item['product_name'],
-                    product_id=item['product_id'],
-                    size=item['size_name'],
-                    icing=item['icing_name'],
-                    eggs=item['eggs_name'],
-                    custom_message=item['message'],
-                    unit_price=item['unit_price'],
-                    quantity=item['quantity'],
-                    total_price=item['total_price'],
+            # One transaction: the order, its items and the queued STK push
+            # are written together or not at all
+            with transaction.atomic():
+                order = Order(
+                    first_name=request.POST.get('first_name'),
+                    last_name=request.POST.get('last_name'),
+                    phone=request.POST.get('phone'),
+                    email=request.POST.get('email'),
+                    county=request.POST.get('county'),
+                    pickup_station=request.POST.get('pickup_station'),
+                    payment_method=payment_method,
+                    total=priced.total,
                 )
-            
-            # Handle payment based on method
-            if order.payment_method == 'M-Pesa':
-                # Set payment initiation time
-                order.payment_initiated_at = timezone.now()
+                # The payment window opens when the worker sends the STK
+                # push, so a queued push cannot expire before it is sent
                 order.save()
                 
-                # Initialize M-Pesa service
-                mpesa_service = MpesaService()
-                
-                # Trigger STK Push
-                response = mpesa_service.stk_push(
-                    phone=order.phone,
-                    amount=order.total,
-                    order_id=order.id
-                )
-                
-                if response.get('ResponseCode') == '0':
-                    # STK Push initiated successfully
-                    order.checkout_request_id = response.get('CheckoutRequestID')
-                    order.save()
-                    
-                    messages.success(request, "M-Pesa payment initiated! Check your phone to complete payment.")
-                    return redirect('orders:success', order_id=order.id)
-                    
-                else:
-                    # STK Push failed
-                    error_message = response.get('error') or response.get('ResponseDescription') or 'Payment initiation failed'
-                    order.status = 'failed'
-                    order.save()
-                    
-                    messages.error(request, f"M-Pesa payment failed: {error_message}")
-                    return redirect('cart:detail')
-                    
-            else:  # Cash on Delivery
-                order.status = 'pending'
-                order.save()
-                cart.clear()
-                messages.success(request, "Order placed successfully! Pay when you pickup.")
-                return redirect('orders:success', order_id=order.id)
+                # Create order items in a single INSERT
+                OrderItem.objects.bulk_create([
+                    OrderItem(
+                        order=order,
+                        product_name=line.product_name,
+                        product_id=line.product_id,
+                        size=line.size,
+                        icing=line.icing,
+                        eggs=line.eggs,
+                        custom_message=line.message,
+                        unit_price=line.unit_price,
+                        quantity=line.quantity,
+                        total_price=line.total_price,
+                    )
+                    for line in priced.lines
+                ])
                 
+                if payment_method == 'M-Pesa':
+                    # Hand the STK push to the payment workers; the success
+                    # page follows its progress through payment_status
+                    enqueue_stk_push(order)
         except Exception as e:
             messages.error(request, f"Error processing order: {str(e)}")
             return redirect('cart:detail')
+        
+        if payment_method == 'M-Pesa':
+            messages.success(request, "M-Pesa payment initiated! Check your phone to complete payment.")
+        else:  # Cash on Delivery
+            cart.clear()
+            messages.success(request, "Order placed successfully! Pay when you pickup.")
+        return redirect('orders:success', order_id=order.id)
     
-    # GET request - show checkout form
+    # GET request - show checkout form; the page loads the station map
+    # from a versioned URL, so a repeat checkout reads it from the browser cache
     context = {
-        'counties': list(COUNTY_STATIONS.keys())
+        'counties': registry.counties(),
+        'stations_version': registry.version(),
     }
     return render(request, 'orders/checkout.html', context)
 
-
-# ... (keep the existing COUNTY_STATIONS and checkout function)
-
 def order_success(request, order_id):
     order = get_object_or_404(Order, id=order_id)
-    
-    # If this is an M-Pesa order and payment was just initiated, set the initiation time
-    if order.payment_method == 'M-Pesa' and order.status == 'pending' and not order.payment_initiated_at:
-        order.payment_initiated_at = timezone.now()
-        order.save()
-        
     context = {
         'order': order,
+        'stream_status': settings.PAYMENT_STATUS_STREAM,
     }
     return render(request, 'orders/success.html', context)
 
+def _stations_etag(request):
+    return str(registry.version())
+
+@cache_control(public=True, max_age=3600)
+@condition(etag_func=_stations_etag)
 def get_county_stations(request):
     county = request.GET.get('county')
-    stations = COUNTY_STATIONS.get(county, [])
+    stations = registry.stations(county)
     return JsonResponse({'stations': stations})
 
-def payment_status(request, order_id):
-    """API endpoint to check payment status"""
+def pickup_stations(request, version):
+    """The whole county -> stations map at its version-specific URL"""
+    index = registry.index()
+    if version != index.version:
+        # An outdated or made-up version; never cache it under that URL
+        return redirect('orders:pickup_stations', version=index.version)
+    response = HttpResponse(index.json, content_type='application/json')
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+def expire_payment_if_due(order):
+    """Move a pending M-Pesa order whose payment window passed to timeout
+    
+    A compare-and-set UPDATE rather than a save: a callback that marked the
+    order paid since it was read is neither overwritten nor published over.
+    """
+    if order.status == 'pending' and order.is_payment_expired():
+        if Order.objects.expired().filter(pk=order.pk).update(status='timeout', updated_at=timezone.now()) == 1:
+            order.status = 'timeout'
+            publish_order_status(order)
+        else:
+            order.refresh_from_db()
+
+async def aexpire_payment_if_due(order):
+    """Async variant of expire_payment_if_due()"""
+    if order.status == 'pending' and order.is_payment_expired():
+        if await Order.objects.expired().filter(pk=order.pk).aupdate(status='timeout', updated_at=timezone.now()) == 1:
+            order.status = 'timeout'
+            publish_order_status(order)
+        else:
+            await order.arefresh_from_db()
+
+def _load_snapshot(order_id):
+    """Build an order's status snapshot from the database and cache it"""
     order = get_object_or_404(Order, id=order_id)
+    snapshot = make_snapshot(order, *latest_request_status(order))
+    # add() rather than set(), so a status published meanwhile is kept
+    store_snapshot(snapshot, order.id, replace=False)
+    return snapshot
+
+async def payment_status(request, order_id):
+    """API endpoint to check payment status
     
-    # Check if payment has expired (10 minutes)
-    if order.payment_method == 'M-Pesa' and order.status == 'pending' and order.is_payment_expired():
-        order.status = 'timeout'
-        order.save()
+    Read-only: served from the cached status snapshot, with an ETag so an
+    unchanged status costs a 304 and no database or session access.
+    """
+    snapshot = await aget_snapshot(order_id) or await sync_to_async(_load_snapshot)(order_id)
+    body = json.dumps(snapshot_status(snapshot))
+    etag = quote_etag(hashlib.md5(body.encode()).hexdigest())
+    
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+def _sse_event(payload, version):
+    return f"id: {version}\nevent: status\ndata: {json.dumps(payload)}\n\n"
+
+def _status_events(order):
+    """Sync SSE generator, used when served over WSGI"""
+    entry = hub.latest(order.id)
+    version = entry[0] if entry else 0
+    payload = status_payload(order, *latest_request_status(order))
+    yield _sse_event(payload, version)
+    
+    deadline = time.monotonic() + settings.PAYMENT_STATUS_STREAM_TIMEOUT
+    while payload['status'] == 'pending' and time.monotonic() < deadline:
+        entry = hub.wait(order.id, version, timeout=settings.PAYMENT_STATUS_STREAM_RECHECK)
+        if entry:
+            version, payload = entry
+        else:
+            # Nothing published in this process; re-read in case another
+            # process updated the order or the payment window has passed
+            order.refresh_from_db()
+            expire_payment_if_due(order)
+            fresh = status_payload(order, *latest_request_status(order))
+            if fresh == payload:
+                yield ": keep-alive\n\n"
+                continue
+            payload = fresh
+        yield _sse_event(payload, version)
+
+async def _astatus_events(order):
+    """Async variant of _status_events(), used when served over ASGI"""
+    entry = hub.latest(order.id)
+    version = entry[0] if entry else 0
+    payload = status_payload(order, *await alatest_request_status(order))
+    yield _sse_event(payload, version)
+    
+    deadline = time.monotonic() + settings.PAYMENT_STATUS_STREAM_TIMEOUT
+    while payload['status'] == 'pending' and time.monotonic() < deadline:
+        entry = await hub.await_change(order.id, version, timeout=settings.PAYMENT_STATUS_STREAM_RECHECK)
+        if entry:
+            version, payload = entry
+        else:
+            await order.arefresh_from_db()
+            await aexpire_payment_if_due(order)
+            fresh = status_payload(order, *await alatest_request_status(order))
+            if fresh == payload:
+                yield ": keep-alive\n\n"
+                continue
+            payload = fresh
+        yield _sse_event(payload, version)
+
+async def payment_status_stream(request, order_id):
+    """Server-Sent Events stream of payment status, pushed as it changes"""
+    order = await aget_object_or_404(Order, id=order_id)
+    
+    if isinstance(request, ASGIRequest):
+        events = _astatus_events(order)
+    else:
+        events = _status_events(order)
     
-    return JsonResponse({
-        'status': order.status,
-        'status_display': order.get_status_display(),
-        'transaction_id': order.transaction_id,
-        'payment_method': order.payment_method,
-        'is_expired': order.is_payment_expired() if order.status == 'pending' else False,
-    })
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Don't let nginx buffer the stream
+    return response
 
 def simulate_payment_cancel(request, order_id):
     """Endpoint to simulate payment cancellation (for testing)"""
@@ -147,5 +253,6 @@ def simulate_payment_cancel(request, order_id):
         order = get_object_or_404(Order, id=order_id)
         order.status = 'cancelled'
         order.save()
+        publish_order_status(order)
         return JsonResponse({'success': True, 'status': 'cancelled'})
     return JsonResponse({'error': 'Method not allowed'})
\ No newline at end of file
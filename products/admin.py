@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import Category, Product, SizeVariant, IcingOption, EggOption
+from .search import get_backend, search_ids
 
 class SizeVariantInline(admin.TabularInline):
     model = SizeVariant
@@ -23,6 +24,12 @@ class ProductAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('name',)}
     search_fields = ['name', 'description']
     inlines = [SizeVariantInline, IcingOptionInline]
+    
+    def get_search_results(self, request, queryset, search_term):
+        """Search through the full-text index, inactive products included"""
+        if not search_term or get_backend() is None:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(pk__in=search_ids(search_term, active_only=False)), False
 
 @admin.register(SizeVariant)
 class SizeVariantAdmin(admin.ModelAdmin):
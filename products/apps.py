@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ProductsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'products'
+
+    def ready(self):
+        from . import cache  # noqa: F401  Connects the invalidation signals
+        from . import images  # noqa: F401  Renders uploaded product images
+        from . import search  # noqa: F401  Keeps the search index up to date
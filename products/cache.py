@@ -0,0 +1,151 @@
+"""Read-through cache for catalog lookups on product pages and cart adds
+
+Entries are keyed by a catalog version stored in the same cache. Saving or
+deleting any catalog model bumps the version, so every process sharing the
+cache backend moves to fresh entries on its next lookup; the old ones simply
+age out. With the default locmem backend each process has its own version,
+so use a shared backend (CACHE_URL=redis://...) when running several workers.
+"""
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from .models import Category, EggOption, IcingOption, Product, SizeVariant
+
+CATALOG_MODELS = (Category, Product, SizeVariant, IcingOption, EggOption)
+
+_MISSING = object()
+
+
+class CatalogCache:
+    """Versioned catalog lookups backed by a Django cache alias"""
+
+    key_prefix = 'catalog'
+
+    def __init__(self, alias=None, timeout=None):
+        self._alias = alias
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cache(self):
+        return caches[self._alias or settings.CATALOG_CACHE_ALIAS]
+
+    @property
+    def timeout(self):
+        return self._timeout if self._timeout is not None else settings.CATALOG_CACHE_TIMEOUT
+
+    @property
+    def version_key(self):
+        return f'{self.key_prefix}:version'
+
+    def version(self):
+        """Return the current catalog version, initialising it if evicted"""
+        version = self.cache.get(self.version_key)
+        if version is None:
+            # Seed from the clock so a lost version never reuses old entries
+            self.cache.add(self.version_key, time.time_ns(), None)
+            version = self.cache.get(self.version_key)
+        return version
+
+    def bump(self):
+        """Invalidate every cached entry by moving to a new version"""
+        try:
+            return self.cache.incr(self.version_key)
+        except ValueError:
+            # Nothing cached under any version yet
+            return self.version()
+
+    def _key(self, version, name):
+        return f'{self.key_prefix}:{version}:{name}'
+
+    def _count(self, hits=0, misses=0):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def get_or_load(self, name, load, use_cache=True):
+        """Return the cached value for name, calling load() on a miss
+
+        None is a valid value, so unknown products are cached too. With
+        use_cache=False the value is always loaded and the entry refreshed.
+        """
+        key = self._key(self.version(), name)
+        value = self.cache.get(key, _MISSING) if use_cache else _MISSING
+        self._count(hits=int(value is not _MISSING), misses=int(value is _MISSING))
+        if value is _MISSING:
+            value = load()
+            self.cache.set(key, value, self.timeout)
+        return value
+
+    def product(self, product_id):
+        """Product by id with its sizes and icing options prefetched"""
+        product_id = int(product_id)
+        return self.get_or_load(
+            f'product:{product_id}',
+            lambda: _with_options(Product.objects.filter(pk=product_id)).first(),
+        )
+
+    def products(self, product_ids, use_cache=True):
+        """Map of id to product for product_ids, unknown ids left out
+
+        Cached products come back in one cache round trip and all misses
+        are loaded together in one batched query. With use_cache=False every
+        product is loaded and its entry refreshed.
+        """
+        version = self.version()
+        keys = {self._key(version, f'product:{int(pk)}'): int(pk) for pk in product_ids}
+        found = self.cache.get_many(keys) if use_cache else {}
+        missing = [pk for key, pk in keys.items() if key not in found]
+        self._count(hits=len(found), misses=len(missing))
+        if missing:
+            loaded = _with_options(Product.objects.filter(pk__in=missing)).in_bulk()
+            new_entries = {self._key(version, f'product:{pk}'): loaded.get(pk) for pk in missing}
+            self.cache.set_many(new_entries, self.timeout)
+            found.update(new_entries)
+        return {keys[key]: product for key, product in found.items() if product is not None}
+
+    def product_by_slug(self, slug):
+        """Active product by slug with its sizes and icing options prefetched"""
+        return self.get_or_load(
+            f'product-slug:{slug}',
+            lambda: _with_options(Product.objects.active().filter(slug=slug)).first(),
+        )
+
+    def categories(self):
+        return self.get_or_load('categories', lambda: list(Category.objects.all()))
+
+    def egg_options(self, use_cache=True):
+        return self.get_or_load('egg-options', lambda: list(EggOption.objects.all()), use_cache)
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+def _with_options(queryset):
+    return queryset.select_related('category').prefetch_related('sizes', 'icing_options')
+
+
+catalog = CatalogCache()
+
+
+def _bump_catalog_version(sender, **kwargs):
+    catalog.bump()
+
+
+for model in CATALOG_MODELS:
+    post_save.connect(_bump_catalog_version, sender=model, dispatch_uid=f'catalog-cache-{model.__name__}')
+    post_delete.connect(_bump_catalog_version, sender=model, dispatch_uid=f'catalog-cache-{model.__name__}')
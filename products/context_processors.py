@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+from .cache import catalog
+
+def catalog_fragments(request):
+    """Version and timeout for {% cache %} fragments of catalog pages
+
+    The version is only read from the cache when a template uses it.
+    """
+    return {
+        'catalog_version': SimpleLazyObject(catalog.version),
+        'catalog_fragment_timeout': settings.CATALOG_FRAGMENT_TIMEOUT,
+    }
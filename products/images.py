@@ -0,0 +1,170 @@
+"""Resized product image renditions for responsive <picture> markup
+
+Every uploaded base_image is rendered at each PRODUCT_IMAGE_WIDTHS width in
+each PRODUCT_IMAGE_FORMATS format plus the upload's own format (the <img>
+fallback). Files are named after a hash of the source image, so they can be
+served with far-future cache headers and a re-upload never collides with an
+old rendition. What was generated is recorded on Product.image_renditions:
+
+    {'source': 'products/cake.jpg', 'hash': '3f2a...', 'width': 2400, 'height': 1600,
+     'formats': ['webp', 'jpeg'],
+     'renditions': {'webp': [[320, 'products/renditions/...', 213], ...], 'jpeg': [...]}}
+
+'formats' is best first and ends with the fallback format.
+
+Encoding runs in render_renditions(), which only takes and returns bytes
+so that `manage.py generate_image_renditions` can spread a backfill over a
+process pool.
+"""
+import hashlib
+import io
+import logging
+import os
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import post_save
+from PIL import Image, ImageOps, features
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS_DIR = 'products/renditions'
+
+# Pillow format name, file extension and MIME type per output format
+FORMATS = {
+    'avif': ('AVIF', 'avif', 'image/avif'),
+    'webp': ('WEBP', 'webp', 'image/webp'),
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg'),
+    'png': ('PNG', 'png', 'image/png'),
+}
+
+
+def output_formats(source_format):
+    """Formats to render, best first, ending with the source's own format"""
+    fallback = 'png' if source_format == 'png' else 'jpeg'
+    formats = [fmt for fmt in settings.PRODUCT_IMAGE_FORMATS if fmt in FORMATS and fmt != fallback]
+    return [fmt for fmt in formats if features.check(fmt)] + [fallback]
+
+
+def render_renditions(data, widths, quality):
+    """Encode image bytes at each width and format
+
+    Returns (info, files): info is the image_renditions record without the
+    storage names, files maps each rendition's file name to its bytes.
+    Widths above the source's are dropped rather than upscaled.
+    """
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    with Image.open(io.BytesIO(data)) as opened:
+        source_format = (opened.format or 'jpeg').lower()
+        image = ImageOps.exif_transpose(opened)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+
+    sizes = sorted({min(width, image.width) for width in widths})
+    formats = output_formats(source_format)
+    info = {
+        'hash': digest, 'width': image.width, 'height': image.height,
+        'formats': formats, 'renditions': {fmt: [] for fmt in formats},
+    }
+    files = {}
+    for width in sizes:
+        height = round(image.height * width / image.width)
+        resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+        for fmt in formats:
+            pil_format, extension, _ = FORMATS[fmt]
+            frame = resized.convert('RGB') if fmt == 'jpeg' and resized.mode != 'RGB' else resized
+            buffer = io.BytesIO()
+            frame.save(buffer, pil_format, quality=quality, optimize=fmt in ('jpeg', 'png'))
+            name = f'{digest}-{width}w.{extension}'
+            files[name] = buffer.getvalue()
+            info['renditions'][fmt].append([width, name, height])
+    return info, files
+
+
+def needs_renditions(product):
+    """True when the product's current image has not been rendered yet"""
+    if not product.base_image:
+        return bool(product.image_renditions)
+    return (product.image_renditions or {}).get('source') != product.base_image.name
+
+
+def read_source(product):
+    with product.base_image.open('rb') as source:
+        return source.read()
+
+
+def store_renditions(product, info, files):
+    """Save rendered files and record them on product"""
+    stem = os.path.splitext(os.path.basename(product.base_image.name))[0]
+    for renditions in info['renditions'].values():
+        for rendition in renditions:
+            data = files[rendition[1]]
+            name = f'{RENDITIONS_DIR}/{stem}-{rendition[1]}'
+            # Content-addressed: an existing file already holds these bytes
+            if not default_storage.exists(name):
+                name = default_storage.save(name, ContentFile(data))
+            rendition[1] = name
+    info['source'] = product.base_image.name
+    product.image_renditions = info
+    product.save(update_fields=['image_renditions'])
+
+
+def update_renditions(product):
+    """Render product's image in this process if it changed; True if it did"""
+    if not needs_renditions(product):
+        return False
+    if not product.base_image:
+        product.image_renditions = {}
+        product.save(update_fields=['image_renditions'])
+        return True
+    info, files = render_renditions(
+        read_source(product), settings.PRODUCT_IMAGE_WIDTHS.values(), settings.PRODUCT_IMAGE_QUALITY,
+    )
+    store_renditions(product, info, files)
+    return True
+
+
+def picture_sources(product, default_width):
+    """Template context for a <picture> of product, or None without renditions
+
+    default_width picks the fallback <img> src; every width goes in srcset.
+    """
+    record = product.image_renditions or {}
+    renditions = record.get('renditions')
+    if not renditions or not product.base_image or record.get('source') != product.base_image.name:
+        return None
+
+    def srcset(items):
+        return ', '.join(f'{default_storage.url(name)} {width}w' for width, name, _ in items)
+
+    *modern, fallback = record['formats']
+    width, name, height = min(renditions[fallback], key=lambda item: abs(item[0] - default_width))
+    return {
+        'sources': [{'type': FORMATS[fmt][2], 'srcset': srcset(renditions[fmt])} for fmt in modern],
+        'src': default_storage.url(name),
+        'srcset': srcset(renditions[fallback]),
+        'width': width,
+        'height': height,
+    }
+
+
+def _render_on_upload(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) == {'image_renditions'}:
+        return
+    if needs_renditions(instance):
+        # After commit, so a failed save leaves no orphaned files
+        transaction.on_commit(lambda: _safe_update(instance))
+
+
+def _safe_update(product):
+    try:
+        update_renditions(product)
+    except Exception:
+        # The page falls back to the original image until a backfill
+        logger.exception(f"Could not render images for product {product.pk}")
+
+
+post_save.connect(_render_on_upload, sender=Product, dispatch_uid='product-image-renditions')
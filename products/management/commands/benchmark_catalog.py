@@ -0,0 +1,52 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from myshop.benchmarking import benchmark_database, summarize
+from products.cache import catalog
+from products.testing import make_catalog
+
+
+class Command(BaseCommand):
+    help = 'Benchmark catalog pages and cart adds against a large catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--hot-products', type=int, default=50,
+                            help='Distinct products visited by the detail and cart runs')
+
+    def handle(self, *args, **options):
+        with benchmark_database() as db:
+            self.stdout.write(f"Database: {db.vendor}, {options['products']} products")
+            products = make_catalog(products=options['products'], categories=options['categories'])
+            hot = products[:options['hot_products']]
+
+            client = Client()
+            self.run('home', options, lambda: client.get('/'))
+            self.run('product list', options, lambda: client.get('/products/'))
+
+            catalog.reset_stats()
+            self.run('product detail', options, lambda: client.get(random.choice(hot).get_absolute_url()))
+            self.run('cart add', options, lambda: client.post('/cart/add/', {
+                'product_id': random.choice(hot).id, 'size': 'small', 'eggs': 'eggless',
+            }))
+            stats = catalog.stats()
+            self.stdout.write(
+                f"Catalog cache: {stats['hits']} hits, {stats['misses']} misses, "
+                f"hit ratio {stats['hit_ratio']:.1%}"
+            )
+
+    def run(self, label, options, request):
+        request()
+        timings = []
+        for _ in range(options['iterations']):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                request()
+                timings.append((time.perf_counter() - started) * 1000)
+
+        self.stdout.write(f'{label:<15} {summarize(timings)}  {len(queries)} queries')
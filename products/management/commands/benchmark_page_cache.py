@@ -0,0 +1,40 @@
+import time
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings
+from myshop.benchmarking import benchmark_database
+from products.testing import make_catalog
+
+
+class Command(BaseCommand):
+    help = 'Requests per second for catalog pages with and without fragment caching'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=200)
+        parser.add_argument('--requests', type=int, default=200)
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            product = make_catalog(products=options['products'])[0]
+            pages = [
+                ('home', '/'),
+                ('product list', '/products/'),
+                ('category list', '/products/?category=category-1'),
+                ('product detail', product.get_absolute_url()),
+            ]
+
+            self.stdout.write(f"{'page':<16} {'uncached':>12} {'fragments':>12}")
+            for label, url in pages:
+                with override_settings(CATALOG_FRAGMENT_TIMEOUT=0):
+                    before = self.requests_per_second(url, options['requests'])
+                after = self.requests_per_second(url, options['requests'])
+                self.stdout.write(f'{label:<16} {before:8.1f} r/s {after:8.1f} r/s  ({after / before:.1f}x)')
+
+    def requests_per_second(self, url, count):
+        # A fresh anonymous client per page, as for first-time visitors
+        client = Client()
+        client.get(url)
+        started = time.perf_counter()
+        for _ in range(count):
+            client.get(url)
+        return count / (time.perf_counter() - started)
@@ -0,0 +1,91 @@
+import random
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from myshop.benchmarking import benchmark_database, summarize
+from products.models import Category, Product
+from products.search import _icontains, autocomplete, category_facets, rebuild_index, search_products, terms
+
+FLAVOURS = ['chocolate', 'vanilla', 'red velvet', 'lemon', 'carrot', 'black forest', 'strawberry',
+            'coffee', 'coconut', 'banana', 'orange', 'mango', 'caramel', 'hazelnut', 'pineapple']
+STYLES = ['fudge', 'sponge', 'cheesecake', 'layer', 'drip', 'naked', 'bundt', 'mousse', 'truffle', 'chiffon']
+OCCASIONS = ['birthday', 'wedding', 'anniversary', 'graduation', 'baby shower', 'christmas', 'easter',
+             'valentine', 'corporate', 'kids party']
+EXTRAS = ['fresh berries', 'edible flowers', 'gold leaf', 'sprinkles', 'ganache', 'buttercream roses',
+          'fondant figures', 'macarons', 'nuts', 'toffee shards']
+
+QUERIES = ['chocolate', 'red velvet', 'wedding cake', 'lemon cheesecake', 'choc', 'straw', 'gold leaf',
+           'kids party drip', 'hazelnut truffle birthday', 'mango']
+
+
+class Command(BaseCommand):
+    help = 'Compare full-text catalog search with icontains filtering on a synthetic catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=50000)
+        parser.add_argument('--categories', type=int, default=len(OCCASIONS))
+        parser.add_argument('--iterations', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with benchmark_database() as db:
+            self.stdout.write(f"Database: {db.vendor}, {options['products']} products")
+            self.make_catalog(options['products'], options['categories'])
+            started = time.perf_counter()
+            rebuild_index()
+            self.stdout.write(f'Index built in {time.perf_counter() - started:.1f} s')
+
+            for query in QUERIES:
+                fts_total = search_products(query)[1]
+                naive_total = self.naive_search(query)[1]
+                self.stdout.write(f'"{query}": {fts_total} matches (icontains: {naive_total})')
+                self.run('  search    fts', options, lambda: search_products(query))
+                self.run('  search    icontains', options, lambda: self.naive_search(query))
+                self.run('  facets    fts', options, lambda: category_facets(query))
+                self.run('  facets    icontains', options, lambda: self.naive_facets(query))
+                self.run('  typeahead fts', options, lambda: autocomplete(query))
+                self.run('  typeahead icontains', options, lambda: self.naive_autocomplete(query))
+
+    def make_catalog(self, count, categories):
+        rng = random.Random(0)
+        names = [f'{OCCASIONS[i % len(OCCASIONS)].title()} {i // len(OCCASIONS) or ""}'.strip()
+                 for i in range(categories)]
+        category_objs = Category.objects.bulk_create([
+            Category(name=name, slug=name.lower().replace(' ', '-')) for name in names
+        ])
+        products = []
+        for i in range(count):
+            flavour, style, occasion = rng.choice(FLAVOURS), rng.choice(STYLES), rng.choice(OCCASIONS)
+            products.append(Product(
+                name=f'{flavour.title()} {style.title()} Cake {i}',
+                slug=f'cake-{i}',
+                description=f'A {flavour} {style} cake for a {occasion}, finished with '
+                            f'{rng.choice(EXTRAS)} and {rng.choice(EXTRAS)}.',
+                base_price=Decimal(1000 + rng.randrange(50) * 50),
+                category=rng.choice(category_objs),
+            ))
+        Product.objects.bulk_create(products, batch_size=1000)
+
+    def naive_search(self, query):
+        """What a search would have cost before the index: icontains over the listing"""
+        queryset = Product.objects.for_listing().filter(_icontains(terms(query))).order_by('name')
+        return list(queryset[:48]), queryset.count()
+
+    def naive_facets(self, query):
+        return dict(Product.objects.active().filter(_icontains(terms(query)))
+                    .values_list('category_id').annotate(Count('pk')).order_by())
+
+    def naive_autocomplete(self, query):
+        queryset = Product.objects.active()
+        for word in terms(query):
+            queryset = queryset.filter(name__icontains=word)
+        return list(queryset.order_by('name')[:8])
+
+    def run(self, label, options, search):
+        search()
+        timings = []
+        for _ in range(options['iterations']):
+            started = time.perf_counter()
+            search()
+            timings.append((time.perf_counter() - started) * 1000)
+        self.stdout.write(f'{label:<22} {summarize(timings)}')
@@ -0,0 +1,77 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from products.images import needs_renditions, read_source, render_renditions, store_renditions, update_renditions
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Render responsive image renditions for product images, spread over a process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Encoding processes (default: one per core)')
+        parser.add_argument('--force', action='store_true',
+                            help='Re-render images that already have renditions')
+
+    def handle(self, *args, **options):
+        todo = []
+        for product in Product.objects.order_by('pk').iterator():
+            if not product.base_image:
+                update_renditions(product)  # Drops renditions of a removed image
+            elif options['force'] or needs_renditions(product):
+                todo.append(product)
+        if not todo:
+            self.stdout.write(self.style.SUCCESS('All product images are up to date'))
+            return
+
+        workers = max(options['workers'], 1)
+        widths = list(settings.PRODUCT_IMAGE_WIDTHS.values())
+        started = time.perf_counter()
+        rendered = failed = files = source_bytes = output_bytes = 0
+
+        # Workers only encode bytes; reading sources, saving files and the
+        # database writes stay in this process
+        with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as executor:
+            in_flight = {}
+            queue = iter(todo)
+            while True:
+                # Keep a couple of jobs per worker queued without reading every source up front
+                for product in queue:
+                    try:
+                        data = read_source(product)
+                    except Exception as e:
+                        # Usually a file missing from storage, e.g. after a database restore
+                        failed += 1
+                        self.stderr.write(f'Product {product.pk} ({product.base_image.name}): {e}')
+                        continue
+                    source_bytes += len(data)
+                    future = executor.submit(render_renditions, data, widths, settings.PRODUCT_IMAGE_QUALITY)
+                    in_flight[future] = product
+                    if len(in_flight) >= workers * 2:
+                        break
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    product = in_flight.pop(future)
+                    try:
+                        info, rendered_files = future.result()
+                        store_renditions(product, info, rendered_files)
+                    except Exception as e:
+                        failed += 1
+                        self.stderr.write(f'Product {product.pk} ({product.base_image.name}): {e}')
+                        continue
+                    rendered += 1
+                    files += len(rendered_files)
+                    output_bytes += sum(len(data) for data in rendered_files.values())
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered {rendered} images ({files} files, {source_bytes / 1e6:.1f} MB -> '
+            f'{output_bytes / 1e6:.1f} MB) with {workers} workers in {elapsed:.1f} s'
+            + (f', {failed} failed' if failed else '')
+        ))
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:40
+
+from django.db import migrations
+
+# products.search keeps these tables up to date. Databases other than SQLite
+# and PostgreSQL get no index and search with icontains instead.
+SQLITE_SQL = [
+    "CREATE VIRTUAL TABLE products_search USING fts5("
+    "name, description, category, category_id UNINDEXED, is_active UNINDEXED, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+    "INSERT INTO products_search (rowid, name, description, category, category_id, is_active) "
+    "SELECT p.id, p.name, p.description, c.name, p.category_id, p.is_active "
+    "FROM products_product p JOIN products_category c ON c.id = p.category_id",
+]
+
+POSTGRESQL_SQL = [
+    "CREATE TABLE products_search ("
+    "product_id bigint PRIMARY KEY, "
+    "category_id bigint NOT NULL, is_active boolean NOT NULL, document tsvector NOT NULL)",
+    "CREATE INDEX products_search_document ON products_search USING gin (document)",
+    "INSERT INTO products_search (product_id, category_id, is_active, document) "
+    "SELECT p.id, p.category_id, p.is_active, "
+    "setweight(to_tsvector('simple', p.name), 'A') || "
+    "setweight(to_tsvector('simple', c.name), 'B') || "
+    "setweight(to_tsvector('simple', p.description), 'C') "
+    "FROM products_product p JOIN products_category c ON c.id = p.category_id",
+]
+
+
+def create_search_index(apps, schema_editor):
+    statements = {'sqlite': SQLITE_SQL, 'postgresql': POSTGRESQL_SQL}.get(schema_editor.connection.vendor, [])
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute('DROP TABLE IF EXISTS products_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_product_image_renditions'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
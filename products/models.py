@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Max, Min
 from django.utils.text import slugify
 from django.urls import reverse
 
@@ -18,6 +19,17 @@ class Category(models.Model):
             self.slug = slugify(self.name)
         super().save(*args, **kwargs)
 
+class ProductQuerySet(models.QuerySet):
+    def active(self):
+        return self.filter(is_active=True)
+    
+    def for_listing(self):
+        """Active products with category and size price range in one query"""
+        return self.active().select_related('category').annotate(
+            min_price=Min('sizes__price'),
+            max_price=Max('sizes__price'),
+        )
+
 class Product(models.Model):
     name = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
@@ -25,9 +37,12 @@ class Product(models.Model):
     base_price = models.DecimalField(max_digits=10, decimal_places=2)
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
     base_image = models.ImageField(upload_to='products/', blank=True, null=True)
+    image_renditions = models.JSONField(default=dict, blank=True, editable=False)  # See products.images
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    objects = ProductQuerySet.as_manager()
+    
     def __str__(self):
         return self.name
     
@@ -0,0 +1,298 @@
+"""Full-text catalog search over a maintained index table
+
+products_search holds one row per product: an FTS5 virtual table on SQLite,
+a tsvector column with a GIN index on PostgreSQL (see migration 0004).
+Product and Category signals keep it in step with the catalog inside the
+saving transaction; bulk_create and queryset.update() send no signals, so
+callers that use them index the products themselves (index_products()) or
+run ``manage.py rebuild_search_index``.
+
+Queries are split into words and every word must match; the last one also
+matches as a prefix so results follow the customer's typing. Names weigh
+more than category names, which weigh more than descriptions. Other
+database backends fall back to icontains filtering.
+"""
+import re
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.db.models.signals import post_delete, post_save
+from .models import Category, Product
+
+TABLE = 'products_search'
+
+WORD = re.compile(r'\w+')
+
+MAX_TERMS = 8
+
+
+def terms(query):
+    """Lower-cased words of a search query; punctuation is never query syntax"""
+    return WORD.findall((query or '').lower())[:MAX_TERMS]
+
+
+class SearchBackend:
+    """Queries shared by the index backends; subclasses build the WHERE clause"""
+
+    def count(self, words, category_id=None):
+        where, params = self._where(words, category_id, True)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {TABLE} WHERE {where}', params)
+            return cursor.fetchone()[0]
+
+    def facets(self, words):
+        where, params = self._where(words, None, True)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT category_id, COUNT(*) FROM {TABLE} WHERE {where} GROUP BY category_id', params)
+            return dict(cursor.fetchall())
+
+    def _where(self, words, category_id, active_only, names_only=False):
+        raise NotImplementedError
+
+
+class SQLiteBackend(SearchBackend):
+    # bm25() weights per column: name, description, category (the UNINDEXED
+    # columns after them are never matched)
+    rank = f'bm25({TABLE}, 10.0, 1.0, 4.0)'
+
+    def match_expression(self, words, names_only=False):
+        *whole, last = words
+        phrase = ' '.join([f'"{word}"' for word in whole] + [f'"{last}"*'])
+        return f'name : ({phrase})' if names_only else phrase
+
+    def match(self, words, category_id=None, active_only=True, limit=None, offset=0, names_only=False, ranked=True):
+        where, params = self._where(words, category_id, active_only, names_only)
+        # Unranked matches come in rowid order, so LIMIT stops the scan early
+        order = f'{self.rank}, rowid' if ranked else 'rowid'
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {TABLE} WHERE {where} ORDER BY {order} LIMIT %s OFFSET %s',
+                params + [-1 if limit is None else limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def _where(self, words, category_id, active_only, names_only=False):
+        where, params = [f'{TABLE} MATCH %s'], [self.match_expression(words, names_only)]
+        if active_only:
+            where.append('is_active = 1')
+        if category_id is not None:
+            where.append('category_id = %s')
+            params.append(category_id)
+        return ' AND '.join(where), params
+
+    def index(self, rows):
+        # FTS5 tables have no UPSERT
+        self.remove([row[0] for row in rows])
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {TABLE} (rowid, name, description, category, category_id, is_active) '
+                f'VALUES (%s, %s, %s, %s, %s, %s)',
+                [(pk, name, description, category, category_id, int(is_active))
+                 for pk, name, description, category_id, category, is_active in rows],
+            )
+
+    def remove(self, product_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {TABLE} WHERE rowid = %s', [(pk,) for pk in product_ids])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABLE}')
+
+
+class PostgreSQLBackend(SearchBackend):
+    # 'simple' rather than a language config: no stemming, so prefixes of
+    # what the customer typed keep matching as they type
+    document = (
+        "setweight(to_tsvector('simple', %s), 'A') || "
+        "setweight(to_tsvector('simple', %s), 'B') || "
+        "setweight(to_tsvector('simple', %s), 'C')"
+    )
+
+    def match_expression(self, words, names_only=False):
+        weight = 'A' if names_only else ''
+        *whole, last = words
+        return ' & '.join([f'{word}:{weight}' if weight else word for word in whole] + [f'{last}:*{weight}'])
+
+    def match(self, words, category_id=None, active_only=True, limit=None, offset=0, names_only=False, ranked=True):
+        where, params = self._where(words, category_id, active_only, names_only)
+        if ranked:
+            order = "ts_rank_cd(document, to_tsquery('simple', %s)) DESC, product_id"
+            params.append(self.match_expression(words, names_only))
+        else:
+            order = 'product_id'
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT product_id FROM {TABLE} WHERE {where} ORDER BY {order} LIMIT %s OFFSET %s',
+                params + [limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def _where(self, words, category_id, active_only, names_only=False):
+        where, params = ["document @@ to_tsquery('simple', %s)"], [self.match_expression(words, names_only)]
+        if active_only:
+            where.append('is_active')
+        if category_id is not None:
+            where.append('category_id = %s')
+            params.append(category_id)
+        return ' AND '.join(where), params
+
+    def index(self, rows):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {TABLE} (product_id, category_id, is_active, document) '
+                f'VALUES (%s, %s, %s, {self.document}) '
+                f'ON CONFLICT (product_id) DO UPDATE SET category_id = EXCLUDED.category_id, '
+                f'is_active = EXCLUDED.is_active, document = EXCLUDED.document',
+                [(pk, category_id, is_active, name, category, description)
+                 for pk, name, description, category_id, category, is_active in rows],
+            )
+
+    def remove(self, product_ids):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABLE} WHERE product_id = ANY(%s)', [list(product_ids)])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {TABLE}')
+
+
+BACKENDS = {'sqlite': SQLiteBackend(), 'postgresql': PostgreSQLBackend()}
+
+
+def get_backend():
+    """The index backend for the default database, or None without one"""
+    return BACKENDS.get(connection.vendor)
+
+
+def _rows(product_ids):
+    return Product.objects.filter(pk__in=product_ids).values_list(
+        'pk', 'name', 'description', 'category_id', 'category__name', 'is_active',
+    )
+
+
+def index_products(product_ids):
+    """(Re)index products by id; ids of deleted products are dropped from the index"""
+    backend = get_backend()
+    product_ids = list(product_ids)
+    if backend is None or not product_ids:
+        return
+    rows = list(_rows(product_ids))
+    # One transaction: SQLite would otherwise commit every row on its own
+    with transaction.atomic():
+        backend.index(rows)
+        missing = set(product_ids) - {row[0] for row in rows}
+        if missing:
+            backend.remove(missing)
+
+
+def rebuild_index(batch_size=1000):
+    """Reindex the whole catalog; returns the number of products indexed"""
+    backend = get_backend()
+    if backend is None:
+        return 0
+    # One transaction, so searches never see a half-built index
+    with transaction.atomic():
+        backend.clear()
+        ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+        for start in range(0, len(ids), batch_size):
+            backend.index(list(_rows(ids[start:start + batch_size])))
+    return len(ids)
+
+
+def _icontains(words):
+    """The fallback filter: every word somewhere in the name, description or category"""
+    condition = Q()
+    for word in words:
+        condition &= Q(name__icontains=word) | Q(description__icontains=word) | Q(category__name__icontains=word)
+    return condition
+
+
+def search_ids(query, category=None, limit=None, offset=0, active_only=True):
+    """Ids of matching products, best match first"""
+    words = terms(query)
+    if not words:
+        return []
+    backend = get_backend()
+    category_id = category.pk if category else None
+    if backend is not None:
+        return backend.match(words, category_id, active_only, limit, offset)
+    queryset = Product.objects.filter(_icontains(words))
+    if active_only:
+        queryset = queryset.active()
+    if category_id is not None:
+        queryset = queryset.filter(category_id=category_id)
+    ids = queryset.order_by('name', 'pk').values_list('pk', flat=True)
+    return list(ids[offset:offset + limit] if limit is not None else ids[offset:])
+
+
+def search_products(query, category=None, limit=None):
+    """(products for the listing in rank order, total number of matches)"""
+    limit = limit or settings.SEARCH_RESULTS_LIMIT
+    ids = search_ids(query, category, limit=limit)
+    if not ids:
+        return [], 0
+    backend = get_backend()
+    if len(ids) < limit:
+        total = len(ids)
+    elif backend is not None:
+        total = backend.count(terms(query), category.pk if category else None)
+    else:
+        total = len(search_ids(query, category))
+    products = {product.pk: product for product in Product.objects.for_listing().filter(pk__in=ids)}
+    return [products[pk] for pk in ids if pk in products], total
+
+
+def category_facets(query):
+    """Number of active matches per category id"""
+    words = terms(query)
+    if not words:
+        return {}
+    backend = get_backend()
+    if backend is not None:
+        return backend.facets(words)
+    counts = (Product.objects.active().filter(_icontains(words))
+              .values_list('category_id').annotate(count=Count('pk')).order_by())
+    return dict(counts)
+
+
+def autocomplete(query, limit=None):
+    """Active products whose names match the words typed so far, best first"""
+    words = terms(query)
+    if not words:
+        return []
+    limit = limit or settings.SEARCH_AUTOCOMPLETE_LIMIT
+    backend = get_backend()
+    if backend is not None:
+        # Every suggestion has all the words in its name; ranking thousands
+        # of matches for eight of them is not worth it while typing
+        ids = backend.match(words, limit=limit, names_only=True, ranked=False)
+        products = Product.objects.filter(pk__in=ids).only('name', 'slug').in_bulk()
+        return [products[pk] for pk in ids if pk in products]
+    condition = Q()
+    for word in words:
+        condition &= Q(name__icontains=word)
+    return list(Product.objects.active().filter(condition).only('name', 'slug').order_by('name')[:limit])
+
+
+def _index_product(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) == {'image_renditions'}:
+        return
+    index_products([instance.pk])
+
+
+def _unindex_product(sender, instance, **kwargs):
+    backend = get_backend()
+    if backend is not None:
+        backend.remove([instance.pk])
+
+
+def _index_category(sender, instance, created=False, **kwargs):
+    # A renamed category changes the documents of all its products
+    if not created:
+        index_products(Product.objects.filter(category=instance).values_list('pk', flat=True))
+
+
+post_save.connect(_index_product, sender=Product, dispatch_uid='product-search-index')
+post_delete.connect(_unindex_product, sender=Product, dispatch_uid='product-search-index')
+post_save.connect(_index_category, sender=Category, dispatch_uid='category-search-index')
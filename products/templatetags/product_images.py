@@ -0,0 +1,20 @@
+from django import template
+from products.images import picture_sources
+
+register = template.Library()
+
+
+@register.inclusion_tag('products/includes/picture.html')
+def product_picture(product, width, sizes, css_class='', lazy=True):
+    """<picture> with every rendition of product's image, or its original
+
+    width is the displayed width the fallback <img> src is chosen for; sizes
+    is the <img> sizes attribute telling browsers which srcset entry to use.
+    """
+    return {
+        'product': product,
+        'picture': picture_sources(product, width),
+        'sizes': sizes,
+        'css_class': css_class,
+        'lazy': lazy,
+    }
@@ -0,0 +1,56 @@
+"""Synthetic catalog data for tests and benchmarks"""
+from decimal import Decimal
+from .cache import catalog
+from .models import Category, EggOption, IcingOption, Product, SizeVariant
+from .search import index_products
+
+SIZES = [('Small', Decimal('0')), ('Medium', Decimal('800')), ('Large', Decimal('1600'))]
+ICINGS = [('Buttercream', Decimal('0')), ('Fondant', Decimal('500'))]
+
+
+def make_catalog(products=10, categories=4, batch_size=1000):
+    """Bulk-create a catalog with sizes and icing options for every product
+
+    Returns the created products (with primary keys) in creation order.
+    """
+    start = Category.objects.count()
+    category_objs = Category.objects.bulk_create([
+        Category(name=f'Category {i}', slug=f'category-{i}')
+        for i in range(start, start + categories)
+    ])
+    if not EggOption.objects.exists():
+        EggOption.objects.bulk_create([
+            EggOption(name='With Eggs', slug='with-eggs'),
+            EggOption(name='Eggless', slug='eggless', price_modifier=Decimal('300')),
+        ])
+
+    start = Product.objects.count()
+    product_objs = Product.objects.bulk_create([
+        Product(
+            name=f'Cake {i}',
+            slug=f'cake-{i}',
+            description=f'Freshly baked cake number {i}',
+            base_price=Decimal(1000 + (i % 50) * 10),
+            category=category_objs[i % len(category_objs)],
+        )
+        for i in range(start, start + products)
+    ], batch_size=batch_size)
+    # SQLite and PostgreSQL return primary keys from bulk_create; others may not
+    if product_objs and product_objs[0].pk is None:
+        product_objs = list(Product.objects.filter(slug__in=[p.slug for p in product_objs]).order_by('id'))
+
+    SizeVariant.objects.bulk_create([
+        SizeVariant(product=product, name=name, slug=name.lower(), price=product.base_price + extra)
+        for product in product_objs
+        for name, extra in SIZES
+    ], batch_size=batch_size)
+    IcingOption.objects.bulk_create([
+        IcingOption(product=product, name=name, slug=name.lower(), price_modifier=modifier)
+        for product in product_objs
+        for name, modifier in ICINGS
+    ], batch_size=batch_size)
+    # bulk_create sends no signals, so invalidate the catalog cache and
+    # index the new products here
+    catalog.bump()
+    index_products([product.pk for product in product_objs])
+    return product_objs
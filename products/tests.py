@@ -1,6 +1,25 @@
-from django.test import TestCase
+import io
+import shutil
+import statistics
+import tempfile
+from decimal import Decimal
+from unittest import mock
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from cart.storage import PRICE
+from myshop.benchmarking import time_requests, wire_size
+from .cache import CatalogCache, catalog
 from .models import Category, Product, SizeVariant
+from .search import autocomplete, category_facets, search_products
+from PIL import Image
+from .testing import make_catalog
 
 class ProductModelTests(TestCase):
     def setUp(self):
@@ -20,3 +39,387 @@ class ProductModelTests(TestCase):
         self.assertEqual(self.product.name, "Chocolate Cake")
         self.assertEqual(self.product.base_price, 1500.00)
         self.assertTrue(self.product.is_active)
+
+
+class CatalogQueryCountTests(TestCase):
+    def count_queries(self, url, products):
+        """Return the number of catalog queries a GET of url runs"""
+        make_catalog(products=products)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len([q for q in queries if '"products_' in q['sql']])
+
+    def test_product_list_query_count_is_constant(self):
+        small = self.count_queries(reverse('products:list'), 3)
+        large = self.count_queries(reverse('products:list'), 60)
+        self.assertEqual(small, large)
+        self.assertEqual(large, 2)
+
+    def test_category_filter_query_count_is_constant(self):
+        small = self.count_queries(reverse('products:list') + '?category=category-0', 4)
+        large = self.count_queries(reverse('products:list') + '?category=category-0', 80)
+        self.assertEqual(small, large)
+
+    def test_home_query_count_is_constant(self):
+        small = self.count_queries(reverse('shop:home'), 1)
+        large = self.count_queries(reverse('shop:home'), 30)
+        self.assertEqual(small, large)
+
+    def test_listing_shows_size_price_range(self):
+        make_catalog(products=1)
+
+        response = self.client.get(reverse('products:list'))
+
+        product = response.context['products'][0]
+        self.assertEqual(product.min_price, product.base_price)
+        self.assertEqual(product.max_price, product.base_price + 1600)
+        self.assertContains(response, f'KSh {product.min_price}')
+        self.assertContains(response, f'- KSh {product.max_price}')
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        self.product = make_catalog(products=1)[0]
+        catalog.reset_stats()
+
+    def test_repeat_lookups_skip_the_database(self):
+        catalog.product(self.product.id)
+        catalog.egg_options()
+
+        with self.assertNumQueries(0):
+            product = catalog.product(self.product.id)
+            sizes = [size.slug for size in product.sizes.all()]
+            catalog.egg_options()
+
+        self.assertEqual(sizes, ['small', 'medium', 'large'])
+        self.assertEqual(catalog.stats(), {'hits': 2, 'misses': 2, 'hit_ratio': 0.5})
+
+    def test_saving_a_catalog_model_invalidates_entries(self):
+        catalog.product(self.product.id)
+        version = catalog.version()
+
+        SizeVariant.objects.filter(product=self.product, slug='small').get().delete()
+        self.product.name = 'Renamed Cake'
+        self.product.save()
+
+        self.assertGreater(catalog.version(), version)
+        product = catalog.product(self.product.id)
+        self.assertEqual(product.name, 'Renamed Cake')
+        self.assertEqual(len(product.sizes.all()), 2)
+
+    def test_unknown_and_inactive_products_are_cached_as_none(self):
+        Product.objects.filter(pk=self.product.pk).update(is_active=False)
+        catalog.bump()
+
+        self.assertIsNone(catalog.product_by_slug(self.product.slug))
+        with self.assertNumQueries(0):
+            self.assertIsNone(catalog.product_by_slug(self.product.slug))
+        self.assertEqual(self.client.get(self.product.get_absolute_url()).status_code, 404)
+
+    def test_lost_version_does_not_reuse_old_entries(self):
+        cache = CatalogCache()
+        version = cache.version()
+
+        cache.cache.delete(cache.version_key)
+
+        self.assertNotEqual(cache.version(), version)
+
+    def test_cart_add_uses_cached_catalog(self):
+        self.client.post(reverse('cart:add'), {'product_id': self.product.id, 'size': 'small', 'eggs': 'with-eggs'})
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('cart:add'), {
+                'product_id': self.product.id, 'size': 'large', 'icing': 'fondant', 'eggs': 'eggless',
+            })
+
+        self.assertFalse([q for q in queries if '"products_' in q['sql']])
+        line = self.client.session['cart']['lines'][-1]
+        self.assertEqual(Decimal(line[PRICE]), self.product.base_price + 1600 + 500 + 300)
+
+
+class CatalogFragmentCacheTests(TestCase):
+    def setUp(self):
+        self.product = make_catalog(products=3)[0]
+
+    def catalog_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, [q for q in queries if '"products_' in q['sql']]
+
+    def test_cached_pages_skip_catalog_queries(self):
+        for url in (reverse('shop:home'), reverse('products:list'),
+                    reverse('products:list') + '?category=category-1', self.product.get_absolute_url()):
+            with self.subTest(url=url):
+                self.catalog_queries(url)
+                response, queries = self.catalog_queries(url)
+                self.assertEqual(queries, [])
+                self.assertContains(response, self.product.name if 'category' not in url else 'Cake 1')
+
+    def test_category_filter_has_its_own_fragment(self):
+        self.client.get(reverse('products:list'))
+
+        response = self.client.get(reverse('products:list') + '?category=category-1')
+
+        self.assertContains(response, '1 products found')
+
+    def test_catalog_edit_refreshes_fragments(self):
+        self.client.get(reverse('products:list'))
+
+        self.product.name = 'Lemon Drizzle'
+        self.product.save()
+
+        self.assertContains(self.client.get(reverse('products:list')), 'Lemon Drizzle')
+
+    def test_cart_badge_and_csrf_token_are_per_user(self):
+        self.client.get(self.product.get_absolute_url())
+        self.client.post(reverse('cart:add'), {'product_id': self.product.id, 'size': 'small', 'quantity': 2})
+
+        other = self.client_class(enforce_csrf_checks=True)
+        other.get(self.product.get_absolute_url())
+        response = self.client.get(self.product.get_absolute_url())
+        other_response = other.get(self.product.get_absolute_url())
+
+        badge = 'rounded-full w-5 h-5'
+        self.assertContains(response, badge)
+        self.assertNotContains(other_response, badge)
+        for resp in (response, other_response):
+            self.assertContains(resp, f'value="{resp.context["csrf_token"]}"')
+        self.assertNotEqual(str(response.context['csrf_token']), str(other_response.context['csrf_token']))
+
+
+def jpeg_upload(name='cake.jpg', size=(800, 600)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (200, 80, 120)).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(PRODUCT_IMAGE_WIDTHS={'thumb': 320, 'card': 640, 'detail': 1280},
+                   PRODUCT_IMAGE_FORMATS=['webp'])
+class ImageRenditionTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp(prefix='myshop-media-')
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.product = make_catalog(products=1)[0]
+
+    def upload(self):
+        self.product.base_image = jpeg_upload()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        self.product.refresh_from_db()
+
+    def test_upload_renders_every_width_and_format(self):
+        self.upload()
+
+        record = self.product.image_renditions
+        self.assertEqual(record['source'], self.product.base_image.name)
+        self.assertEqual(record['formats'], ['webp', 'jpeg'])
+        # The 1280px slot is capped at the 800px source
+        self.assertEqual([width for width, _, _ in record['renditions']['webp']], [320, 640, 800])
+        for width, name, height in record['renditions']['webp'] + record['renditions']['jpeg']:
+            self.assertIn(record['hash'], name)
+            self.assertEqual(height, width * 3 // 4)
+            self.assertTrue(default_storage.exists(name))
+
+    def test_picture_tag_offers_srcset_per_format(self):
+        self.upload()
+
+        html = Template('{% load product_images %}{% product_picture product 640 "50vw" "w-full" %}').render(
+            Context({'product': self.product}),
+        )
+
+        self.assertIn('<source type="image/webp" srcset="/media/products/renditions/', html)
+        self.assertIn(' 320w, ', html)
+        self.assertIn('sizes="50vw"', html)
+        self.assertIn('width="640" height="480"', html)
+        self.assertIn('loading="lazy"', html)
+
+    def test_unrendered_image_falls_back_to_the_original(self):
+        self.upload()
+        Product.objects.filter(pk=self.product.pk).update(image_renditions={})
+        self.product.refresh_from_db()
+
+        html = Template('{% load product_images %}{% product_picture product 640 "50vw" %}').render(
+            Context({'product': self.product}),
+        )
+
+        self.assertNotIn('<picture>', html)
+        self.assertIn(f'src="{self.product.base_image.url}"', html)
+
+    def test_backfill_command_uses_a_process_pool(self):
+        self.upload()
+        Product.objects.filter(pk=self.product.pk).update(image_renditions={})
+        out = io.StringIO()
+
+        call_command('generate_image_renditions', workers=2, stdout=out)
+
+        self.assertIn('Rendered 1 images (6 files', out.getvalue())
+        self.product.refresh_from_db()
+        self.assertEqual(len(self.product.image_renditions['renditions']['jpeg']), 3)
+        call_command('generate_image_renditions', stdout=out)
+        self.assertIn('up to date', out.getvalue())
+
+    def test_backfill_skips_images_missing_from_storage(self):
+        self.upload()
+        missing = make_catalog(products=1)[0]
+        Product.objects.filter(pk=missing.pk).update(base_image='products/lost.jpg')
+        Product.objects.filter(pk=self.product.pk).update(image_renditions={})
+        out, err = io.StringIO(), io.StringIO()
+
+        call_command('generate_image_renditions', workers=1, stdout=out, stderr=err)
+
+        self.assertIn('Rendered 1 images', out.getvalue())
+        self.assertIn('1 failed', out.getvalue())
+        self.assertIn(f'Product {missing.pk} (products/lost.jpg)', err.getvalue())
+        self.product.refresh_from_db()
+        self.assertTrue(self.product.image_renditions)
+
+
+class ConditionalPageTests(TestCase):
+    def setUp(self):
+        self.product = make_catalog(products=12)[0]
+        self.list_url = reverse('products:list')
+
+    def first_visit(self, url):
+        response = self.client.get(url, headers={'accept-encoding': 'gzip'})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_repeat_visit_is_an_empty_304_without_catalog_queries(self):
+        for url in (self.list_url, self.product.get_absolute_url()):
+            first = self.first_visit(url)
+            self.assertEqual(first['Content-Encoding'], 'gzip')
+            self.assertIn('private', first['Cache-Control'])
+            self.assertIn('no-cache', first['Cache-Control'])
+
+            with CaptureQueriesContext(connection) as queries:
+                repeat = self.client.get(url, headers={'accept-encoding': 'gzip', 'if-none-match': first['ETag']})
+
+            self.assertEqual(repeat.status_code, 304)
+            self.assertEqual(repeat.content, b'')
+            self.assertEqual([q['sql'] for q in queries if '"products_' in q['sql']], [])
+
+    def test_repeat_visit_sends_fewer_bytes_in_less_time(self):
+        # Timings and sizes of the full benchmark: manage.py benchmark_repeat_visits
+        for url in (self.list_url, self.product.get_absolute_url()):
+            etag = self.first_visit(url)['ETag']
+            full, full_ms = time_requests(self.client, url, 20, accept_encoding='gzip')
+            repeat, repeat_ms = time_requests(self.client, url, 20, accept_encoding='gzip', if_none_match=etag)
+
+            self.assertEqual((full.status_code, repeat.status_code), (200, 304))
+            self.assertLess(wire_size(repeat), wire_size(full) / 2)
+            self.assertLess(statistics.median(repeat_ms), statistics.median(full_ms))
+
+    def test_catalog_change_invalidates_the_etag(self):
+        etag = self.first_visit(self.list_url)['ETag']
+        self.product.base_price += 100
+        self.product.save()
+
+        response = self.client.get(self.list_url, headers={'if-none-match': etag})
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_cart_change_invalidates_the_etag(self):
+        etag = self.first_visit(self.list_url)['ETag']
+        self.client.post(reverse('cart:add'), {'product_id': self.product.id, 'size': 'small'},
+                         headers={'x-requested-with': 'XMLHttpRequest'})
+
+        response = self.client.get(self.list_url, headers={'if-none-match': etag})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_category_filter_has_its_own_etag(self):
+        etag = self.first_visit(self.list_url)['ETag']
+
+        response = self.client.get(self.list_url + '?category=category-0', headers={'if-none-match': etag})
+
+        self.assertEqual(response.status_code, 200)
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.birthday = Category.objects.create(name='Birthday', slug='birthday')
+        self.wedding = Category.objects.create(name='Wedding', slug='wedding')
+        self.fudge = self.make('Chocolate Fudge Cake', 'Rich and dark', self.birthday)
+        self.forest = self.make('Black Forest Cake', 'Cherries and chocolate shavings', self.birthday)
+        self.tier = self.make('Lemon Tier Cake', 'Three tiers of lemon sponge', self.wedding)
+
+    def make(self, name, description, category):
+        return Product.objects.create(
+            name=name, slug=name.lower().replace(' ', '-'), description=description,
+            base_price=Decimal('1500'), category=category,
+        )
+
+    def names(self, query, **kwargs):
+        return [product.name for product in search_products(query, **kwargs)[0]]
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertEqual(self.names('chocolate'), ['Chocolate Fudge Cake', 'Black Forest Cake'])
+
+    def test_last_word_matches_as_a_prefix(self):
+        self.assertEqual(self.names('black for'), ['Black Forest Cake'])
+        self.assertEqual([p.name for p in autocomplete('choc')], ['Chocolate Fudge Cake'])
+
+    def test_query_syntax_is_treated_as_words(self):
+        self.assertEqual(self.names('"lemon" OR (tier* NEAR'), [])
+        self.assertEqual(self.names('lemon-tier!'), ['Lemon Tier Cake'])
+        self.assertEqual(self.names('  ?? '), [])
+
+    def test_index_follows_catalog_changes(self):
+        self.fudge.is_active = False
+        self.fudge.save()
+        self.forest.delete()
+        self.wedding.name = 'Bridal'
+        self.wedding.save()
+
+        self.assertEqual(self.names('chocolate'), [])
+        self.assertEqual(self.names('bridal'), ['Lemon Tier Cake'])
+
+    def test_category_facets_and_filter(self):
+        self.assertEqual(category_facets('cake'), {self.birthday.id: 2, self.wedding.id: 1})
+        self.assertEqual(self.names('cake', category=self.wedding), ['Lemon Tier Cake'])
+
+    def test_total_counts_past_the_page(self):
+        products, total = search_products('cake', limit=2)
+        self.assertEqual((len(products), total), (2, 3))
+
+    def test_icontains_fallback_without_an_index(self):
+        with mock.patch('products.search.get_backend', return_value=None):
+            self.assertEqual(set(self.names('chocolate')), {'Chocolate Fudge Cake', 'Black Forest Cake'})
+            self.assertEqual(category_facets('lemon'), {self.wedding.id: 1})
+
+    def test_list_page_shows_ranked_results_and_facets(self):
+        response = self.client.get(reverse('products:list'), {'q': 'chocolate'})
+
+        self.assertEqual([p.name for p in response.context['products']], ['Chocolate Fudge Cake', 'Black Forest Cake'])
+        self.assertContains(response, '2 products found')
+        self.assertEqual([(c.slug, c.match_count) for c in response.context['categories']], [('birthday', 2)])
+
+    def test_selected_category_stays_listed_without_matches(self):
+        response = self.client.get(reverse('products:list'), {'q': 'chocolate', 'category': 'wedding'})
+
+        self.assertContains(response, '0 products found')
+        self.assertEqual([(c.slug, c.match_count) for c in response.context['categories']],
+                         [('birthday', 2), ('wedding', 0)])
+        self.assertContains(response, 'Wedding <span class="text-gray-400">(0)</span>')
+
+    def test_searches_do_not_fill_the_fragment_cache(self):
+        fragment_cache = caches['default']
+        with mock.patch.object(fragment_cache, 'set', wraps=fragment_cache.set) as cache_set:
+            for query in ('chocolate', 'lemon', 'chocolate'):
+                self.assertContains(self.client.get(reverse('products:list'), {'q': query}), 'products found')
+            self.assertFalse([key for (key, *_), _ in cache_set.call_args_list if key.startswith('template.cache.')])
+
+            self.client.get(reverse('products:list'))
+            self.assertTrue([key for (key, *_), _ in cache_set.call_args_list if key.startswith('template.cache.')])
+
+    def test_suggestions_endpoint(self):
+        response = self.client.get(reverse('products:search_suggestions'), {'q': 'lem'})
+
+        self.assertEqual(response.json(), {'results': [{'name': 'Lemon Tier Cake', 'url': self.tier.get_absolute_url()}]})
+        self.assertIn('public', response['Cache-Control'])
@@ -5,5 +5,6 @@ app_name = 'products'
 
 urlpatterns = [
     path('', views.product_list, name='list'),
+    path('search/suggest/', views.search_suggestions, name='search_suggestions'),
     path('<slug:slug>/', views.product_detail, name='detail'),
 ]
\ No newline at end of file
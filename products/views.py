@@ -1,32 +1,86 @@
-from django.shortcuts import render, get_object_or_404
-from .models import Product, Category, EggOption
+import hashlib
+from django.http import Http404, JsonResponse
+from django.shortcuts import render
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from myshop.conditional import page_etag
+from .cache import catalog
+from .models import Product
+from .search import autocomplete, category_facets, search_products
 
+def _list_etag(request):
+    return page_etag(
+        request, 'list', catalog.version(), request.GET.get('category', ''), request.GET.get('q', '').strip(),
+    )
+
+def _detail_etag(request, slug):
+    return page_etag(request, 'detail', catalog.version(), slug, csrf=True)
+
+# Pages show the visitor's cart, so they are private and always revalidated
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_list_etag)
 def product_list(request):
     category_slug = request.GET.get('category')
-    categories = Category.objects.all()
-    products = Product.objects.filter(is_active=True)
+    query = request.GET.get('q', '').strip()
+    categories = catalog.categories()
+    products = Product.objects.for_listing()
     
     selected_category_name = None
+    category = None
     
     if category_slug:
-        category = get_object_or_404(Category, slug=category_slug)
+        category = next((c for c in categories if c.slug == category_slug), None)
+        if category is None:
+            raise Http404("No Category matches the given query.")
         products = products.filter(category=category)
         selected_category_name = category.name
     
+    total = None
+    if query:
+        # Best matches first, with match counts per category for the sidebar.
+        # The counts cover every category, so each one says what choosing it
+        # would show; the selected one stays listed even without matches
+        products, total = search_products(query, category)
+        facets = category_facets(query)
+        categories = [c for c in categories if c.id in facets or c == category]
+        for c in categories:
+            c.match_count = facets.get(c.id, 0)
+    
     context = {
         'products': products,
         'categories': categories,
         'selected_category': category_slug,
         'selected_category_name': selected_category_name,
+        'search_query': query,
+        'total': total,
     }
     return render(request, 'products/list.html', context)
 
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_detail_etag)
 def product_detail(request, slug):
-    product = get_object_or_404(Product, slug=slug, is_active=True)
-    egg_options = EggOption.objects.all()
+    product = catalog.product_by_slug(slug)
+    if product is None:
+        raise Http404("No Product matches the given query.")
+    egg_options = catalog.egg_options()
     
     context = {
         'product': product,
         'egg_options': egg_options,
     }
-    return render(request, 'products/detail.html', context)
\ No newline at end of file
+    return render(request, 'products/detail.html', context)
+
+def _suggest_etag(request):
+    query = hashlib.md5(request.GET.get('q', '').encode()).hexdigest()
+    return f"{catalog.version()}-{query}"
+
+# Suggestions are the same for everyone; the ETag follows catalog changes
+@cache_control(public=True, max_age=300)
+@condition(etag_func=_suggest_etag)
+def search_suggestions(request):
+    """Typeahead: product names matching what has been typed so far"""
+    results = [
+        {'name': product.name, 'url': product.get_absolute_url()}
+        for product in autocomplete(request.GET.get('q', ''))
+    ]
+    return JsonResponse({'results': results})
@@ -0,0 +1,199 @@
+"""Build-time stylesheet bundle replacing the Tailwind and Font Awesome CDNs
+
+`manage.py build_static` writes two stylesheets into STATIC_BUILD_DIR:
+
+* build/css/main.css - Tailwind compiled by its CLI, purged to the classes
+  the templates use and minified (assets/tailwind.config.js)
+* build/css/icons.css - only the Font Awesome icons the templates use, with
+  the webfonts subset to those glyphs when fontTools is installed
+
+collectstatic then copies them to STATIC_ROOT under content-hashed names,
+and precompress() stores .gz and .br variants beside every text file for
+myshop.static.serve to pick from.
+"""
+import gzip
+import json
+import re
+import shutil
+import subprocess
+from pathlib import Path
+from django.conf import settings
+from django.template.utils import get_app_template_dirs
+
+try:
+    import brotli
+except ImportError:  # .br files are skipped without it
+    brotli = None
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.map', '.html', '.xml', '.ico')
+
+# One webfont per Font Awesome style: CSS family, weight and file stem
+FONT_STYLES = {
+    'solid': ('Font Awesome 6 Free', 900, 'fa-solid-900'),
+    'brands': ('Font Awesome 6 Brands', 400, 'fa-brands-400'),
+}
+
+ICON_BASE_CSS = (
+    '.fa,.fas,.fab,.fa-solid,.fa-brands{-moz-osx-font-smoothing:grayscale;-webkit-font-smoothing:antialiased;'
+    'display:var(--fa-display,inline-block);font-style:normal;font-variant:normal;line-height:1;'
+    'text-rendering:auto}'
+    '.fa,.fas,.fa-solid{font-family:"Font Awesome 6 Free";font-weight:900}'
+    '.fab,.fa-brands{font-family:"Font Awesome 6 Brands";font-weight:400}'
+)
+
+# fa-* classes that are modifiers rather than icons
+ICON_UTILITIES = {
+    'spin': '.fa-spin{animation:fa-spin 2s linear infinite}'
+            '@keyframes fa-spin{0%{transform:rotate(0deg)}to{transform:rotate(1turn)}}',
+    'fw': '.fa-fw{text-align:center;width:1.25em}',
+    'lg': '.fa-lg{font-size:1.25em;line-height:.05em;vertical-align:-.075em}',
+    '2x': '.fa-2x{font-size:2em}',
+    '3x': '.fa-3x{font-size:3em}',
+}
+
+ICON_CLASS = re.compile(r'\bfa-([a-z0-9]+(?:-[a-z0-9]+)*)\b')
+
+
+class BuildError(Exception):
+    pass
+
+
+def build_dir():
+    return Path(settings.STATIC_BUILD_DIR)
+
+
+def template_dirs():
+    dirs = [Path(d) for config in settings.TEMPLATES for d in config.get('DIRS', [])]
+    return dirs + [Path(d) for d in get_app_template_dirs('templates')]
+
+
+def used_icon_classes(dirs=None):
+    """Every fa-* class name (without the prefix) found in the templates"""
+    names = set()
+    for directory in dirs or template_dirs():
+        for path in Path(directory).rglob('*.html'):
+            names.update(ICON_CLASS.findall(path.read_text(encoding='utf-8')))
+    return names
+
+
+def load_icon_metadata(fontawesome_dir):
+    """Map every icon name and alias to (unicode, styles) from Font Awesome's icons.json"""
+    path = Path(fontawesome_dir) / 'metadata' / 'icons.json'
+    try:
+        icons = json.loads(path.read_text(encoding='utf-8'))
+    except FileNotFoundError:
+        raise BuildError(f'{path} not found; run `npm install` first')
+    metadata = {}
+    for name, icon in icons.items():
+        entry = (icon['unicode'], icon.get('free') or icon.get('styles', []))
+        metadata[name] = entry
+        for alias in (icon.get('aliases') or {}).get('names', []):
+            metadata.setdefault(alias, entry)
+    return metadata
+
+
+def build_icons(fontawesome_dir=None, output_dir=None, dirs=None):
+    """Write icons.css and its webfonts for the icons the templates use
+
+    Returns (icon names, unknown fa-* classes).
+    """
+    fontawesome_dir = Path(fontawesome_dir or settings.FONTAWESOME_DIR)
+    output_dir = Path(output_dir or build_dir())
+    metadata = load_icon_metadata(fontawesome_dir)
+
+    names = used_icon_classes(dirs)
+    rules, glyphs, unknown, icons = [], {}, [], []
+    for name in sorted(names):
+        if name in ICON_UTILITIES:
+            continue
+        if name not in metadata:
+            unknown.append(name)
+            continue
+        codepoint, styles = metadata[name]
+        style = 'brands' if 'brands' in styles else 'solid'
+        if style not in styles:
+            unknown.append(name)  # Pro-only style
+            continue
+        glyphs.setdefault(style, set()).add(int(codepoint, 16))
+        rules.append(f'.fa-{name}:before{{content:"\\{codepoint}"}}')
+        icons.append(name)
+
+    utilities = [css for name, css in ICON_UTILITIES.items() if name in names]
+    faces = []
+    (output_dir / 'webfonts').mkdir(parents=True, exist_ok=True)
+    for style, codepoints in sorted(glyphs.items()):
+        family, weight, stem = FONT_STYLES[style]
+        subset_font(fontawesome_dir / 'webfonts' / f'{stem}.woff2',
+                    output_dir / 'webfonts' / f'{stem}.woff2', codepoints)
+        faces.append(
+            f'@font-face{{font-family:"{family}";font-style:normal;font-weight:{weight};'
+            f'font-display:block;src:url(../webfonts/{stem}.woff2) format("woff2")}}'
+        )
+
+    (output_dir / 'css').mkdir(parents=True, exist_ok=True)
+    css = ''.join(faces) + ICON_BASE_CSS + ''.join(utilities) + ''.join(rules)
+    (output_dir / 'css' / 'icons.css').write_text(css + '\n', encoding='utf-8')
+    return icons, unknown
+
+
+def subset_font(source, target, codepoints):
+    """Keep only codepoints' glyphs; copies the whole font without fontTools"""
+    try:
+        from fontTools import subset
+    except ImportError:
+        shutil.copyfile(source, target)
+        return
+    options = subset.Options()
+    options.flavor = 'woff2'
+    options.layout_features = ['*']
+    font = subset.load_font(str(source), options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=codepoints)
+    subsetter.subset(font)
+    subset.save_font(font, str(target), options)
+
+
+def build_css(output_dir=None):
+    """Compile, purge and minify the Tailwind stylesheet with its CLI"""
+    output = Path(output_dir or build_dir()) / 'css' / 'main.css'
+    output.parent.mkdir(parents=True, exist_ok=True)
+    command = [
+        *settings.TAILWIND_CLI,
+        '-c', str(settings.ASSETS_DIR / 'tailwind.config.js'),
+        '-i', str(settings.ASSETS_DIR / 'css' / 'main.css'),
+        '-o', str(output),
+        '--minify',
+    ]
+    try:
+        # Content globs in the config are relative to the project root
+        subprocess.run(command, cwd=settings.BASE_DIR, check=True, capture_output=True, text=True)
+    except FileNotFoundError:
+        raise BuildError(f'{command[0]} not found; install Node.js and run `npm install`')
+    except subprocess.CalledProcessError as e:
+        raise BuildError(f'Tailwind build failed: {e.stderr.strip() or e.returncode}')
+    return output
+
+
+def precompress(root):
+    """Write .gz (and .br with brotli installed) next to each compressible file
+
+    A variant is only kept when it is smaller than the original. Returns
+    the number of files written.
+    """
+    written = 0
+    for path in Path(root).rglob('*'):
+        if not path.is_file() or path.suffix not in COMPRESSIBLE:
+            continue
+        data = path.read_bytes()
+        variants = [('.gz', lambda raw: gzip.compress(raw, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append(('.br', lambda raw: brotli.compress(raw, quality=11)))
+        for suffix, compress in variants:
+            compressed = compress(data)
+            target = path.with_name(path.name + suffix)
+            if len(compressed) < len(data):
+                target.write_bytes(compressed)
+                written += 1
+            elif target.exists():
+                target.unlink()
+    return written
@@ -0,0 +1,5 @@
+from django.conf import settings
+
+def stylesheets(request):
+    """Whether base.html links the CDN stylesheets or the built bundle"""
+    return {'cdn_stylesheets': settings.CDN_STYLESHEETS}
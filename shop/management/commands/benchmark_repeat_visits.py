@@ -0,0 +1,43 @@
+import statistics
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+from myshop.benchmarking import benchmark_database, summarize, time_requests, wire_size
+from orders.models import Order
+from products.testing import make_catalog
+
+
+class Command(BaseCommand):
+    help = 'Bytes sent and server time for first and repeat visits (full render vs 304)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=60)
+        parser.add_argument('--requests', type=int, default=200)
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            product = make_catalog(products=options['products'])[0]
+            order = Order.objects.create(total=100, payment_method='M-Pesa', phone='0712345678')
+            pages = [
+                ('product list', reverse('products:list')),
+                ('product detail', product.get_absolute_url()),
+                ('county stations', reverse('orders:county_stations') + '?county=Nairobi'),
+                ('payment status', reverse('orders:payment_status', args=[order.id])),
+            ]
+            for label, url in pages:
+                self.compare(label, url, options['requests'])
+
+    def compare(self, label, url, count):
+        client = Client()
+        # The first request sets up the session and CSRF cookie, as a real first visit would
+        etag = client.get(url, headers={'accept-encoding': 'gzip'})['ETag']
+        full, full_ms = time_requests(client, url, count, accept_encoding='gzip')
+        repeat, repeat_ms = time_requests(client, url, count, accept_encoding='gzip', if_none_match=etag)
+        if repeat.status_code != 304:
+            self.stderr.write(f'{label}: repeat visit got {repeat.status_code}, not 304')
+
+        self.stdout.write(f'{label} ({url})')
+        self.stdout.write(f'  full render {full.status_code}  {wire_size(full):7d} bytes  {summarize(full_ms)}')
+        self.stdout.write(f'  repeat      {repeat.status_code}  {wire_size(repeat):7d} bytes  {summarize(repeat_ms)}')
+        self.stdout.write(f'  {statistics.mean(full_ms) / statistics.mean(repeat_ms):.1f}x faster, '
+                          f'{wire_size(full) / wire_size(repeat):.1f}x fewer bytes')
@@ -0,0 +1,92 @@
+import re
+import time
+from pathlib import Path
+import requests
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+from myshop.benchmarking import benchmark_database, summarize
+
+# What base.html loaded before the self-hosted bundle
+CDN_ASSETS = [
+    'https://cdn.tailwindcss.com',
+    'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css',
+    'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/webfonts/fa-solid-900.woff2',
+    'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/webfonts/fa-brands-400.woff2',
+]
+
+STYLESHEET = re.compile(r'<link rel="stylesheet" href="([^"]+)"')
+FONT_URL = re.compile(r'url\(([^)]+\.woff2)\)')
+
+
+class Command(BaseCommand):
+    help = 'Measure home page time to first byte and the render-blocking asset weight it pulls in'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--cdn', action='store_true',
+                            help='Also download the former CDN assets for comparison (needs network)')
+
+    def handle(self, *args, **options):
+        if not staticfiles_storage.hashed_files:
+            self.stderr.write(self.style.WARNING(
+                'No staticfiles manifest; run `manage.py build_static` first for hashed, precompressed sizes'
+            ))
+        with benchmark_database():
+            client = Client()
+            url = reverse('shop:home')
+            html = client.get(url).content
+            timings = []
+            for _ in range(options['requests']):
+                started = time.perf_counter()
+                client.get(url)
+                timings.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(f'Home page HTML: {len(html) / 1024:.1f} KB  first byte {summarize(timings)}')
+
+        raw_total = sent_total = 0
+        for asset_url in STYLESHEET.findall(html.decode()):
+            path = self.local_path(asset_url)
+            if path is None:
+                continue
+            assets = [path] + [path.parent / font for font in FONT_URL.findall(path.read_text())]
+            for asset in assets:
+                raw, sent, encoding = self.transfer_size(asset)
+                raw_total += raw
+                sent_total += sent
+                self.stdout.write(f'  {asset.name:<40} {raw / 1024:7.1f} KB  sent {sent / 1024:7.1f} KB ({encoding})')
+        self.stdout.write(f'Self-hosted total: {raw_total / 1024:.1f} KB, {sent_total / 1024:.1f} KB sent')
+
+        if options['cdn']:
+            total = 0
+            for asset_url in CDN_ASSETS:
+                started = time.perf_counter()
+                response = requests.get(asset_url, headers={'Accept-Encoding': 'gzip, br'}, stream=True, timeout=10)
+                size = len(response.raw.read(decode_content=False))
+                total += size
+                self.stdout.write(f'  {asset_url:<84} {size / 1024:7.1f} KB  '
+                                  f'{(time.perf_counter() - started) * 1000:6.0f} ms')
+            # The Play CDN script also compiles the stylesheet in the browser on every page view
+            self.stdout.write(f'CDN total transferred: {total / 1024:.1f} KB')
+
+    def local_path(self, asset_url):
+        if not asset_url.startswith(settings.STATIC_URL) and not asset_url.startswith('/' + settings.STATIC_URL):
+            return None
+        name = asset_url.split(settings.STATIC_URL, 1)[1]
+        for root in [settings.STATIC_ROOT, *settings.STATICFILES_DIRS]:
+            path = (Path(root) / name).resolve()
+            if path.is_file():
+                return path
+        self.stderr.write(f'{asset_url} not found; run `manage.py build_static`')
+        return None
+
+    def transfer_size(self, path):
+        """(size, bytes sent to a browser accepting br and gzip, encoding used)"""
+        raw = path.stat().st_size
+        for suffix, encoding in (('br', 'br'), ('gz', 'gzip')):
+            variant = path.with_name(f'{path.name}.{suffix}')
+            if variant.is_file():
+                return raw, variant.stat().st_size, encoding
+        # No variant: sent as is (webfonts are compressed already)
+        return raw, raw, 'identity'
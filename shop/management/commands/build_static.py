@@ -0,0 +1,47 @@
+from pathlib import Path
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from shop.assets import BuildError, build_css, build_icons, precompress
+
+
+class Command(BaseCommand):
+    help = 'Build the Tailwind and icon stylesheets, collect static files and precompress them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skip-css', action='store_true',
+                            help='Keep the existing Tailwind build (no Node.js needed)')
+        parser.add_argument('--skip-icons', action='store_true',
+                            help='Keep the existing icon stylesheet and webfonts')
+
+    def handle(self, *args, **options):
+        try:
+            if not options['skip_css']:
+                output = build_css()
+                self.stdout.write(f'Tailwind: {output} ({output.stat().st_size / 1024:.1f} KB)')
+            if not options['skip_icons']:
+                icons, unknown = build_icons()
+                self.stdout.write(f'Icons: {len(icons)} used')
+                for name in unknown:
+                    self.stderr.write(self.style.WARNING(f'Unknown Font Awesome class fa-{name}'))
+        except BuildError as e:
+            raise CommandError(str(e))
+
+        call_command('collectstatic', interactive=False, verbosity=0)
+        written = precompress(settings.STATIC_ROOT)
+        self.stdout.write(f'Precompressed {written} files in {settings.STATIC_ROOT}')
+
+        root = Path(settings.STATIC_ROOT)
+        for name in ('build/css/main.css', 'build/css/icons.css'):
+            # Filled in by collectstatic's post-processing above
+            if name not in staticfiles_storage.hashed_files:
+                continue
+            hashed = root / staticfiles_storage.hashed_files[name]
+            sizes = [f'{hashed.stat().st_size / 1024:.1f} KB']
+            for suffix in ('.gz', '.br'):
+                variant = hashed.with_name(hashed.name + suffix)
+                if variant.is_file():
+                    sizes.append(f'{suffix[1:]} {variant.stat().st_size / 1024:.1f} KB')
+            self.stdout.write(self.style.SUCCESS(f'{hashed.relative_to(root)}: {", ".join(sizes)}'))
+
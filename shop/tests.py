@@ -1,3 +1,150 @@
-from django.test import TestCase
+import gzip
+import json
+import shutil
+import tempfile
+from pathlib import Path
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from myshop import static
+from .assets import build_icons, precompress
 
-# Create your tests here.
+
+class TempDirMixin:
+    def make_dir(self):
+        path = Path(tempfile.mkdtemp(prefix='myshop-static-'))
+        self.addCleanup(shutil.rmtree, path, ignore_errors=True)
+        return path
+
+
+class IconBuildTests(TempDirMixin, SimpleTestCase):
+    def setUp(self):
+        self.fontawesome = self.make_dir()
+        (self.fontawesome / 'metadata').mkdir()
+        (self.fontawesome / 'metadata' / 'icons.json').write_text(json.dumps({
+            'cake-candles': {'unicode': 'f1fd', 'free': ['solid'], 'aliases': {'names': ['birthday-cake']}},
+            'house': {'unicode': 'f015', 'free': ['solid'], 'aliases': {'names': ['home']}},
+            'twitter': {'unicode': 'f099', 'free': ['brands']},
+            'rocket': {'unicode': 'f135', 'free': ['solid']},
+        }))
+        (self.fontawesome / 'webfonts').mkdir()
+        for stem in ('fa-solid-900', 'fa-brands-400'):
+            (self.fontawesome / 'webfonts' / f'{stem}.woff2').write_bytes(b'wOF2')
+        self.templates = self.make_dir()
+        (self.templates / 'page.html').write_text(
+            '<i class="fas fa-birthday-cake"></i><i class="fas fa-home fa-spin"></i>'
+            '<i class="fab fa-twitter"></i><i class="fas fa-not-an-icon"></i>'
+        )
+        self.output = self.make_dir()
+
+    def test_only_used_icons_are_emitted(self):
+        icons, unknown = build_icons(self.fontawesome, self.output, dirs=[self.templates])
+        css = (self.output / 'css' / 'icons.css').read_text()
+
+        self.assertEqual(icons, ['birthday-cake', 'home', 'twitter'])
+        self.assertEqual(unknown, ['not-an-icon'])
+        self.assertIn('.fa-birthday-cake:before{content:"\\f1fd"}', css)
+        self.assertIn('.fa-twitter:before{content:"\\f099"}', css)
+        self.assertIn('@keyframes fa-spin', css)
+        self.assertNotIn('f135', css)
+        self.assertIn('url(../webfonts/fa-brands-400.woff2)', css)
+        self.assertTrue((self.output / 'webfonts' / 'fa-solid-900.woff2').is_file())
+
+    def test_unused_styles_ship_no_font(self):
+        (self.templates / 'page.html').write_text('<i class="fas fa-home"></i>')
+        build_icons(self.fontawesome, self.output, dirs=[self.templates])
+
+        self.assertNotIn('Brands";font-style', (self.output / 'css' / 'icons.css').read_text())
+        self.assertFalse((self.output / 'webfonts' / 'fa-brands-400.woff2').exists())
+
+
+class PrecompressTests(TempDirMixin, SimpleTestCase):
+    def test_writes_smaller_variants_only(self):
+        root = self.make_dir()
+        css = b'.a{color:red}' * 200
+        (root / 'main.css').write_bytes(css)
+        (root / 'tiny.css').write_bytes(b'a{}')
+        (root / 'font.woff2').write_bytes(b'x' * 1000)
+
+        precompress(root)
+
+        self.assertEqual(gzip.decompress((root / 'main.css.gz').read_bytes()), css)
+        self.assertFalse((root / 'tiny.css.gz').exists())
+        self.assertFalse((root / 'font.woff2.gz').exists())
+
+
+class StaticServeTests(TempDirMixin, SimpleTestCase):
+    def setUp(self):
+        self.root = self.make_dir()
+        self.css = b'.a{color:red}' * 200
+        (self.root / 'main.0123456789ab.css').write_bytes(self.css)
+        (self.root / 'main.0123456789ab.css.gz').write_bytes(gzip.compress(self.css))
+        (self.root / 'robots.txt').write_bytes(b'User-agent: *')
+        settings_override = override_settings(STATIC_ROOT=str(self.root))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.factory = RequestFactory()
+
+    def get(self, path, **headers):
+        return static.serve(self.factory.get(f'/static/{path}', headers=headers), path)
+
+    def test_hashed_files_are_immutable_and_precompressed(self):
+        response = self.get('main.0123456789ab.css', accept_encoding='gzip, deflate, br')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self.css)
+
+    def test_identity_without_accept_encoding(self):
+        response = self.get('main.0123456789ab.css', accept_encoding='gzip;q=0')
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), self.css)
+
+    def test_unhashed_files_revalidate(self):
+        response = self.get('robots.txt')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=300')
+
+        not_modified = self.get('robots.txt', if_modified_since=response['Last-Modified'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_paths_outside_static_root_are_rejected(self):
+        with self.assertRaises(Http404):
+            self.get('../secret.txt')
+
+
+class SelfHostedAssetTests(TestCase):
+    @override_settings(CDN_STYLESHEETS=False)
+    def test_pages_link_local_stylesheets(self):
+        response = self.client.get(reverse('shop:home'))
+
+        self.assertContains(response, '/static/build/css/main.css')
+        self.assertContains(response, '/static/build/css/icons.css')
+        self.assertNotContains(response, 'cdn.tailwindcss.com')
+        self.assertNotContains(response, 'cdnjs.cloudflare.com')
+
+    @override_settings(CDN_STYLESHEETS=True)
+    def test_pages_fall_back_to_the_cdns_before_a_build(self):
+        response = self.client.get(reverse('shop:home'))
+
+        self.assertContains(response, 'cdn.tailwindcss.com')
+        self.assertContains(response, 'cdnjs.cloudflare.com')
+        self.assertNotContains(response, '/static/build/css/')
+
+
+class CompressionTests(TestCase):
+    def test_large_html_is_gzipped(self):
+        plain = self.client.get(reverse('shop:home'))
+        compressed = self.client.get(reverse('shop:home'), headers={'accept-encoding': 'gzip'})
+
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', compressed['Vary'])
+        self.assertLess(len(compressed.content), len(plain.content) / 2)
+
+    def test_small_responses_are_sent_as_is(self):
+        response = self.client.get(reverse('orders:county_stations') + '?county=Nairobi',
+                                   headers={'accept-encoding': 'gzip'})
+
+        self.assertFalse(response.has_header('Content-Encoding'))
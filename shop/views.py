@@ -2,7 +2,7 @@ from django.shortcuts import render
 from products.models import Product, Category
 
 def home(request):
-    featured_products = Product.objects.filter(is_active=True)[:6]
+    featured_products = Product.objects.for_listing()[:6]
     categories = Category.objects.all()[:4]
     
     context = {